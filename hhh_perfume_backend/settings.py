@@ -99,6 +99,44 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Set to an nginx `internal` location (e.g. /protected-media/) to let the
+# web server stream media via X-Accel-Redirect instead of Django.
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='')
+
+# Cache
+# The catalog cache holds category/product/hero responses keyed on a
+# version counter. locmem is per process, so with several workers point
+# it at a shared directory instead, e.g.
+#   CATALOG_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+#   CATALOG_CACHE_LOCATION=/var/tmp/hhh_catalog_cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': config('CATALOG_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CATALOG_CACHE_LOCATION', default='hhh-catalog'),
+        'TIMEOUT': config('CATALOG_CACHE_TIMEOUT', default=3600, cast=int),
+    },
+}
+
+# Product saves refresh "similar scents" lists inline up to this catalog
+# size; above it, schedule `manage.py rebuild_similar_products`.
+SIMILAR_PRODUCTS_SYNC_LIMIT = config('SIMILAR_PRODUCTS_SYNC_LIMIT', default=5000, cast=int)
+
+# Adding to a cart holds stock for this long; every cart change restarts it.
+# Expired items are released by `manage.py release_expired_reservations`
+# (cron) or, when BASKET_SWEEP_INTERVAL is set (seconds), by a background
+# thread in each web process.
+BASKET_RESERVATION_MINUTES = config('BASKET_RESERVATION_MINUTES', default=30, cast=int)
+BASKET_SWEEP_INTERVAL = config('BASKET_SWEEP_INTERVAL', default=0, cast=int)
+# Checking out holds the cart's stock while its order is Pending (awaiting
+# payment), for up to this long after the order was created.
+BASKET_CHECKOUT_HOLD_MINUTES = config('BASKET_CHECKOUT_HOLD_MINUTES', default=24 * 60, cast=int)
+
+# Checkout and payment confirmation replay their first response to retries
+# sent with the same Idempotency-Key header for this long.
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -106,6 +144,21 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Razorpay Keys
 RAZORPAY_KEY_ID = config('RAZORPAY_KEY_ID', default='')
 RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET', default='')
+# Secret set for the webhook in the Razorpay dashboard; /payments/webhook/
+# refuses every delivery until it is configured.
+RAZORPAY_WEBHOOK_SECRET = config('RAZORPAY_WEBHOOK_SECRET', default='')
+# Leave empty for the real API; point at `manage.py fake_razorpay`
+# (e.g. http://127.0.0.1:8765) to run checkout offline.
+RAZORPAY_BASE_URL = config('RAZORPAY_BASE_URL', default='')
+# Gateway calls from checkout: seconds per attempt, extra attempts for
+# network errors and 5xx, keep-alive connections per process, and the
+# circuit breaker (fail fast for RESET_SECONDS after THRESHOLD failed calls).
+RAZORPAY_CONNECT_TIMEOUT = config('RAZORPAY_CONNECT_TIMEOUT', default=3.05, cast=float)
+RAZORPAY_READ_TIMEOUT = config('RAZORPAY_READ_TIMEOUT', default=10.0, cast=float)
+RAZORPAY_MAX_RETRIES = config('RAZORPAY_MAX_RETRIES', default=2, cast=int)
+RAZORPAY_POOL_SIZE = config('RAZORPAY_POOL_SIZE', default=10, cast=int)
+RAZORPAY_BREAKER_THRESHOLD = config('RAZORPAY_BREAKER_THRESHOLD', default=5, cast=int)
+RAZORPAY_BREAKER_RESET_SECONDS = config('RAZORPAY_BREAKER_RESET_SECONDS', default=30.0, cast=float)
 
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -123,12 +176,12 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
 # Django REST Framework settings
 REST_FRAMEWORK = {
+    # orjson for speed; the browsable API only while developing
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-    ],
+        'store.renderers.ORJSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'store.renderers.ORJSONParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
     ],
@@ -1,10 +1,9 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.conf import settings
-from django.conf.urls.static import static
 
 
 # ---------- Import ViewSets ----------
@@ -25,6 +24,7 @@ from store.views import (
     WishListViewSet
 )
 from payment.views import PaymentViewSet, InvoiceViewSet
+from store.media import serve_media
 
 # ---------- DRF Router ----------
 router = DefaultRouter()
@@ -91,6 +91,9 @@ urlpatterns = [
     path('product/<int:pk>/delete/', product_delete_view, name='product-delete'),
     path('api/', include('store.urls')),
 
+    # Uploaded media (streams with Range / ETag support)
+    re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+
     # All ViewSets from router
     path('', include(router.urls)),
-]+static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+]
\ No newline at end of file
@@ -0,0 +1,109 @@
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# ---------------------------
+# Fake Razorpay API
+# ---------------------------
+# A local stand-in for the parts of the Razorpay API checkout uses
+# (POST/GET /v1/orders), for tests and offline load tests. Latency and
+# failures are configurable: `failure_rate` of the calls answer 500,
+# `hang_rate` sleep for `hang_seconds` before answering (longer than the
+# gateway's read timeout, so they time out).
+class FakeRazorpayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.rstrip('/') != '/v1/orders':
+            return self.send_json(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Not found'}})
+        if not self.server.misbehave():
+            return self.send_json(500, {'error': {'code': 'SERVER_ERROR', 'description': 'Fake failure'}})
+        try:
+            data = json.loads(body or b'{}')
+            amount = int(data['amount'])
+        except (ValueError, KeyError, TypeError):
+            return self.send_json(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'amount is required'}})
+        order = {
+            'id': f"order_{uuid.uuid4().hex[:14]}",
+            'entity': 'order',
+            'amount': amount,
+            'amount_paid': 0,
+            'amount_due': amount,
+            'currency': data.get('currency', 'INR'),
+            'receipt': data.get('receipt'),
+            'status': 'created',
+            'attempts': 0,
+            'notes': data.get('notes') or [],
+            'created_at': int(time.time()),
+        }
+        self.server.orders[order['id']] = order
+        self.send_json(200, order)
+
+    def do_GET(self):
+        order = self.server.orders.get(self.path.rstrip('/').rsplit('/', 1)[-1])
+        if not self.path.startswith('/v1/orders/') or order is None:
+            return self.send_json(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The id provided does not exist'}})
+        self.send_json(200, order)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeRazorpayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, jitter=0.0, failure_rate=0.0,
+                 hang_rate=0.0, hang_seconds=30.0):
+        super().__init__(address, FakeRazorpayHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.orders = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # a client that timed out has hung up before the answer; expected here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def misbehave(self):
+        """Sleep as configured; returns False when this call should fail."""
+        with self.lock:
+            self.requests += 1
+        roll = random.random()
+        if roll < self.hang_rate:
+            time.sleep(self.hang_seconds)
+        else:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        return not (self.hang_rate <= roll < self.hang_rate + self.failure_rate)
+
+    def start(self):
+        """Serve from a background thread; returns the server."""
+        threading.Thread(target=self.serve_forever, name='fake-razorpay', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,156 @@
+import logging
+import random
+import threading
+import time
+
+import razorpay
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Razorpay gateway adapter
+# ---------------------------
+# Checkout waits on Razorpay while holding a worker thread, so every call is
+# bounded: a connect/read timeout per attempt, a few retries with jittered
+# backoff for failures that may be transient, and a circuit breaker that
+# fails fast while the gateway keeps failing instead of queueing workers
+# behind it. One pooled keep-alive session is shared by the whole process.
+class GatewayUnavailable(Exception):
+    """Razorpay could not be reached or kept failing; safe to retry later."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed until `threshold` calls fail in a row, then open for
+    `reset_timeout` seconds (calls are refused), then half-open: one trial
+    call is let through and its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning("Razorpay circuit opened after %s failures", self.failures)
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+
+def _retryable(error):
+    # BadRequestError means Razorpay rejected the request itself; anything
+    # else (network errors, timeouts, 5xx, unreadable error pages) may pass
+    if isinstance(error, (razorpay.errors.ServerError, razorpay.errors.GatewayError)):
+        return True
+    return isinstance(error, (requests.RequestException, ValueError))
+
+
+class RazorpayGateway:
+    def __init__(self, key_id, key_secret, base_url=None, connect_timeout=3.05, read_timeout=10.0,
+                 max_retries=2, backoff=0.2, pool_size=10, breaker=None):
+        self.session = requests.Session()
+        # retries are done here, where they are jittered and counted by the breaker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        options = {'base_url': base_url.rstrip('/')} if base_url else {}
+        self.client = razorpay.Client(session=self.session, auth=(key_id, key_secret), **options)
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            settings.RAZORPAY_KEY_ID,
+            settings.RAZORPAY_KEY_SECRET,
+            base_url=settings.RAZORPAY_BASE_URL,
+            connect_timeout=settings.RAZORPAY_CONNECT_TIMEOUT,
+            read_timeout=settings.RAZORPAY_READ_TIMEOUT,
+            max_retries=settings.RAZORPAY_MAX_RETRIES,
+            pool_size=settings.RAZORPAY_POOL_SIZE,
+            breaker=CircuitBreaker(settings.RAZORPAY_BREAKER_THRESHOLD, settings.RAZORPAY_BREAKER_RESET_SECONDS),
+        )
+
+    def call(self, operation, *args):
+        """
+        Run `operation` (e.g. self.client.order.create) with the timeout,
+        retries and circuit breaker. Raises GatewayUnavailable when the
+        circuit is open or every attempt failed; Razorpay's BadRequestError
+        is passed through untouched.
+        """
+        if not self.breaker.allow():
+            raise GatewayUnavailable("Payment gateway is unavailable", retry_after=self.breaker.retry_after())
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = operation(*args, timeout=self.timeout)
+            except Exception as e:
+                if not _retryable(e):
+                    # the gateway answered, so it is up
+                    self.breaker.record_success()
+                    raise
+                if attempt < self.max_retries:
+                    # full jitter: sleep somewhere in [0, backoff * 2^attempt)
+                    time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                    continue
+                self.breaker.record_failure()
+                logger.warning("Razorpay call failed after %s attempts: %s", attempt + 1, e)
+                raise GatewayUnavailable("Payment gateway did not respond", retry_after=1) from e
+            self.breaker.record_success()
+            return result
+
+    def create_order(self, data):
+        # an order that times out but was created anyway is harmless: it is
+        # never shown to the customer, so it is never paid
+        return self.call(self.client.order.create, data)
+
+
+razorpay_gateway = RazorpayGateway.from_settings()
@@ -0,0 +1,122 @@
+import datetime
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from payment.models import IdempotencyKey
+
+
+# ---------------------------
+# Idempotency-Key support
+# ---------------------------
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# a request still marked as in progress after this is assumed to have died
+IN_PROGRESS_TIMEOUT = datetime.timedelta(minutes=5)
+
+
+def key_ttl():
+    return datetime.timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    raw = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def stale_keys(now=None):
+    now = now or timezone.now()
+    return IdempotencyKey.objects.filter(
+        Q(created_at__lt=now - key_ttl())
+        | Q(response_status__isnull=True, created_at__lt=now - IN_PROGRESS_TIMEOUT)
+    )
+
+
+def claim(user, scope, key, fingerprint):
+    """
+    Returns (record, claimed). The unique constraint decides between
+    concurrent duplicates: exactly one of them inserts the row and runs the
+    request, the others get the existing record.
+    """
+    lookup = {'user': user, 'scope': scope, 'key': key}
+    stale_keys().filter(**lookup).delete()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(request_hash=fingerprint, **lookup), True
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(**lookup).first()
+        if record is not None:
+            return record, False
+        # the holder failed and let go of the key in between; try again
+    return IdempotencyKey.objects.get(**lookup), False
+
+
+def idempotent(scope):
+    """
+    Make a viewset action safe to retry: with an Idempotency-Key header the
+    first response (other than a 5xx) is stored and replayed for repeats of
+    the same request within IDEMPOTENCY_KEY_TTL_HOURS. Without the header
+    the action runs as usual.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return handler(self, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            fingerprint = request_fingerprint(request)
+            record, claimed = claim(request.user, scope, key, fingerprint)
+            if not claimed:
+                return replay(record, fingerprint)
+
+            try:
+                response = handler(self, request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+            if response.status_code >= 500:
+                # failures are not remembered, so the client can retry
+                record.delete()
+            else:
+                record.response_status = response.status_code
+                record.response_body = response.data
+                record.save(update_fields=['response_status', 'response_body'])
+            return response
+        return wrapper
+    return decorator
+
+
+def replay(record, fingerprint):
+    if record.request_hash != fingerprint:
+        return Response(
+            {"error": f"{HEADER} was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if record.response_status is None:
+        response = Response(
+            {"error": f"A request with this {HEADER} is still being processed"},
+            status=status.HTTP_409_CONFLICT
+        )
+        response['Retry-After'] = '1'
+        return response
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from payment.fake_razorpay import FakeRazorpayServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a fake Razorpay orders API for offline checkout testing. "
+        "Point RAZORPAY_BASE_URL at the printed address."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.05, help="Seconds per call")
+        parser.add_argument("--jitter", type=float, default=0.02, help="Latency varies by up to this much")
+        parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of calls answering 500")
+        parser.add_argument("--hang-rate", type=float, default=0.0, help="Share of calls that hang")
+        parser.add_argument("--hang-seconds", type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        server = FakeRazorpayServer(
+            (options["host"], options["port"]),
+            latency=options["latency"],
+            jitter=options["jitter"],
+            failure_rate=options["failure_rate"],
+            hang_rate=options["hang_rate"],
+            hang_seconds=options["hang_seconds"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Fake Razorpay listening on {server.url} (Ctrl+C to stop)"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payment import webhooks
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply stored Razorpay webhook events to payments and orders. Run it from "
+        "cron, or with --every to keep draining the inbox in the foreground."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=webhooks.BATCH_SIZE)
+        parser.add_argument("--every", type=float, default=0, help="Repeat every N seconds until interrupted")
+
+    def handle(self, *args, **options):
+        while True:
+            result = webhooks.process_pending(batch_size=options["batch_size"]).as_dict()
+            self.stdout.write(self.style.SUCCESS(
+                f"Processed {result['events']} events: {result['paid']} paid, "
+                f"{result['failed']} failed, {result['refunded']} refunded."
+            ))
+            if options["every"] <= 0:
+                break
+            time.sleep(options["every"])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from payment.idempotency import stale_keys
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL_HOURS"
+
+    def handle(self, *args, **options):
+        deleted, _ = stale_keys().delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} idempotency keys."))
@@ -0,0 +1,133 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from payment import views
+from payment.fake_razorpay import FakeRazorpayServer
+from payment.gateway import CircuitBreaker, RazorpayGateway
+from store.models import Basket, BasketItem, Category, CustomUser, Order, Product
+from store.reservations import reserved_until
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test checkout against an in-process fake Razorpay with the given "
+        "latency and failure rates, and report latency percentiles, status codes "
+        "and the circuit breaker state. Writes to the configured database: the "
+        "orders and product are removed afterwards, the (inactive) shopper "
+        "accounts are kept for the next run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--requests", type=int, default=20, help="Checkouts per thread")
+        parser.add_argument("--latency", type=float, default=0.1, help="Gateway seconds per call")
+        parser.add_argument("--jitter", type=float, default=0.05)
+        parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of gateway calls answering 500")
+        parser.add_argument("--hang-rate", type=float, default=0.0, help="Share of gateway calls that time out")
+        parser.add_argument("--read-timeout", type=float, default=1.0)
+        parser.add_argument("--retries", type=int, default=2)
+        parser.add_argument("--breaker-threshold", type=int, default=5)
+        parser.add_argument("--breaker-reset", type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        fake = FakeRazorpayServer(
+            latency=options["latency"],
+            jitter=options["jitter"],
+            failure_rate=options["failure_rate"],
+            hang_rate=options["hang_rate"],
+            hang_seconds=options["read_timeout"] * 2,
+        ).start()
+        gateway = RazorpayGateway(
+            "rzp_test_fake",
+            "fake-secret",
+            base_url=fake.url,
+            read_timeout=options["read_timeout"],
+            max_retries=options["retries"],
+            pool_size=options["threads"],
+            breaker=CircuitBreaker(options["breaker_threshold"], options["breaker_reset"]),
+        )
+
+        tag = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name=f"stress-{tag}")
+        product = Product.objects.create(category=category, name=f"stress-{tag}", description="", price="499.00", stock=0)
+        users = [self.shopper(n, product) for n in range(options["threads"])]
+
+        checkout = views.PaymentViewSet.as_view({"post": "user_cart_checkout"})
+        factory = APIRequestFactory()
+        latencies, statuses = [], {}
+        lock = threading.Lock()
+        start = threading.Barrier(len(users))
+
+        def shop(user):
+            timings, codes = [], {}
+            start.wait()
+            try:
+                for _ in range(options["requests"]):
+                    request = factory.post("/payments/user-cart-checkout/", {"city": "Kochi"}, format="json")
+                    force_authenticate(request, user)
+                    began = time.perf_counter()
+                    response = checkout(request)
+                    timings.append(time.perf_counter() - began)
+                    codes[response.status_code] = codes.get(response.status_code, 0) + 1
+            finally:
+                connections.close_all()
+            with lock:
+                latencies.extend(timings)
+                for code, count in codes.items():
+                    statuses[code] = statuses.get(code, 0) + count
+
+        threads = [threading.Thread(target=shop, args=(user,)) for user in users]
+        original, views.razorpay_gateway = views.razorpay_gateway, gateway
+        try:
+            began = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - began
+            close_old_connections()
+        finally:
+            views.razorpay_gateway = original
+            fake.stop()
+            Order.objects.filter(items__product=product).delete()
+            BasketItem.objects.filter(product_object=product).delete()
+            product.delete()
+            category.delete()
+
+        total = len(latencies)
+        quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if total > 1 else latencies * 99
+        self.stdout.write(
+            f"{total} checkouts from {options['threads']} threads in {elapsed:.2f} s ({total / elapsed:.0f} req/s)"
+        )
+        self.stdout.write(
+            f"  latency p50 {quantiles[49] * 1000:.0f} ms, p95 {quantiles[94] * 1000:.0f} ms, "
+            f"p99 {quantiles[98] * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms"
+        )
+        self.stdout.write(
+            "  status " + ", ".join(f"{code}: {count}" for code, count in sorted(statuses.items()))
+            + f"; gateway calls {fake.requests}; circuit {gateway.breaker.state}"
+        )
+
+    @staticmethod
+    def shopper(n, product):
+        user, created = CustomUser.objects.get_or_create(
+            username=f"stress-shopper-{n}",
+            defaults={"email": f"stress-shopper-{n}@example.com", "is_active": False},
+        )
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=["password"])
+        # a one-item cart that checkout can be run against over and over
+        BasketItem.objects.filter(basket_object__owner=user, is_active=True, is_order_placed=False).update(is_active=False)
+        basket, _ = Basket.objects.get_or_create(owner=user, is_active=True)
+        BasketItem.objects.create(
+            basket_object=basket, product_object=product, quantity=1, is_active=True,
+            is_order_placed=False, reserved_until=reserved_until(),
+        )
+        return user
@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth import get_user_model
 from store.models import Order  # Correct import from store app
@@ -19,6 +20,7 @@ class Payment(models.Model):
         ('Created', 'Created'),
         ('Paid', 'Paid'),
         ('Failed', 'Failed'),
+        ('Refunded', 'Refunded'),
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payments')
@@ -44,3 +46,51 @@ class Invoice(models.Model):
 
     def __str__(self):
         return f"Invoice {self.invoice_number} for Order {self.order.order_id}"
+
+
+# ---------------------------
+# Idempotency Key
+# ---------------------------
+class IdempotencyKey(models.Model):
+    """
+    First response to a request sent with an `Idempotency-Key` header, kept
+    so that retries of the same request are answered without running it
+    again (see payment.idempotency). A row without a response_status is
+    still being processed.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='payment_idempotency_key_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key} ({self.response_status or 'processing'})"
+
+
+
+# ---------------------------
+# Webhook inbox
+# ---------------------------
+class WebhookEvent(models.Model):
+    """
+    A Razorpay webhook, stored as received once its signature checks out
+    and applied later, in batches, by `manage.py process_webhooks` (see
+    payment.webhooks). Razorpay delivers at least once; the unique event_id
+    drops redeliveries.
+    """
+    event_id = models.CharField(max_length=100, unique=True)
+    event = models.CharField(max_length=50)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.event} {self.event_id} ({'processed' if self.processed_at else 'pending'})"
@@ -0,0 +1,212 @@
+import hashlib
+import hmac
+import json
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from payment.fake_razorpay import FakeRazorpayServer
+from payment.gateway import CircuitBreaker, GatewayUnavailable, RazorpayGateway
+from payment.models import IdempotencyKey, Payment, WebhookEvent
+from payment.webhooks import process_pending
+from store.models import Basket, BasketItem, Category, CustomUser, Order, OrderItem, Product, ProductPopularity
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Sets")
+        cls.products = Product.objects.bulk_create([
+            Product(category=category, name=f"Sample {n}", description="", price=f"{n}.50", stock=10)
+            for n in range(1, 51)
+        ])
+        cls.user = CustomUser.objects.create_user(username="checkout", email="checkout@example.com", password="pass")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @mock.patch("payment.views.client.order.create", return_value={"id": "order_test123"})
+    def test_fifty_item_checkout_query_count(self, create_order):
+        self.client.post("/api/basket-items/batch/", [{"product": product.pk, "quantity": 2} for product in self.products], format="json")
+        with self.assertNumQueries(7):
+            response = self.client.post("/payments/user-cart-checkout/", {"city": "Kochi"}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        expected = sum(Decimal(f"{n}.50") * 2 for n in range(1, 51))
+        self.assertEqual(create_order.call_args.args[0]["amount"], int(expected * 100))
+        order = Order.objects.get(razorpay_order_id="order_test123")
+        self.assertEqual(order.amount, expected)
+        self.assertEqual(order.items.count(), 50)
+        self.assertEqual(len(response.data["basket_items"]), 50)
+
+    @mock.patch("payment.views.client.order.create", return_value={"id": "order_once"})
+    def test_idempotency_key_replays_checkout(self, create_order):
+        self.client.post("/api/basket-items/batch/", [{"product": self.products[0].pk}], format="json")
+        url = "/payments/user-cart-checkout/"
+        first = self.client.post(url, {"city": "Kochi"}, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        again = self.client.post(url, {"city": "Kochi"}, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again["Idempotent-Replayed"], "true")
+        self.assertEqual(again.data, first.data)
+        self.assertEqual(create_order.call_count, 1)
+        self.assertEqual(Order.objects.count(), 1)
+
+        other = self.client.post(url, {"city": "Pune"}, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        self.assertEqual(other.status_code, 422)
+
+    def test_idempotency_key_in_progress_conflicts(self):
+        # a concurrent duplicate finds the first request still running
+        IdempotencyKey.objects.create(user=self.user, scope="checkout", key="busy", request_hash="")
+        with mock.patch("payment.idempotency.request_fingerprint", return_value=""):
+            response = self.client.post("/payments/user-cart-checkout/", {}, format="json", HTTP_IDEMPOTENCY_KEY="busy")
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    def test_gateway_down_returns_503_and_frees_the_key(self):
+        self.client.post("/api/basket-items/batch/", [{"product": self.products[0].pk}], format="json")
+        with mock.patch("payment.views.razorpay_gateway.create_order", side_effect=GatewayUnavailable("down", retry_after=12)):
+            response = self.client.post("/payments/user-cart-checkout/", {}, format="json", HTTP_IDEMPOTENCY_KEY="down-1")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "12")
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class RazorpayGatewayTests(SimpleTestCase):
+    def gateway(self, server, **options):
+        options = {"backoff": 0, "read_timeout": 1.0, **options}
+        return RazorpayGateway("rzp_test_key", "secret", base_url=server.url, **options)
+
+    def serve(self, **options):
+        server = FakeRazorpayServer(**options).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def test_creates_order_over_keep_alive_session(self):
+        server = self.serve()
+        gateway = self.gateway(server)
+        first = gateway.create_order({"amount": 49900, "currency": "INR"})
+        second = gateway.create_order({"amount": 100, "currency": "INR"})
+        self.assertTrue(first["id"].startswith("order_"))
+        self.assertEqual((first["amount"], second["amount"]), (49900, 100))
+        self.assertEqual(server.requests, 2)
+
+    def test_retries_then_opens_circuit(self):
+        server = self.serve(failure_rate=1.0)
+        gateway = self.gateway(server, max_retries=2, breaker=CircuitBreaker(threshold=2, reset_timeout=60))
+        for _ in range(2):
+            with self.assertRaises(GatewayUnavailable):
+                gateway.create_order({"amount": 100})
+        self.assertEqual(server.requests, 6)
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.OPEN)
+        # open circuit: refused without calling Razorpay
+        with self.assertRaises(GatewayUnavailable) as refused:
+            gateway.create_order({"amount": 100})
+        self.assertEqual(server.requests, 6)
+        self.assertGreater(refused.exception.retry_after, 0)
+
+    def test_slow_gateway_times_out(self):
+        server = self.serve(hang_rate=1.0, hang_seconds=1.0)
+        gateway = self.gateway(server, read_timeout=0.1, max_retries=0)
+        began = time.monotonic()
+        with self.assertRaises(GatewayUnavailable):
+            gateway.create_order({"amount": 100})
+        self.assertLess(time.monotonic() - began, 0.9)
+
+    def test_half_open_trial_closes_circuit(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        now[0] = 11
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # one trial at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET="whsec_test")
+class WebhookTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Attars")
+        cls.product = Product.objects.create(category=category, name="Oud", description="", price="40.00", stock=5)
+        cls.user = CustomUser.objects.create_user(username="hook", email="hook@example.com", password="pass")
+        cls.order = Order.objects.create(user=cls.user, order_id="HOOK1", razorpay_order_id="order_hook", amount="80.00")
+        OrderItem.objects.create(order=cls.order, product=cls.product, quantity=2, price="40.00")
+        cls.payment = Payment.objects.create(
+            user=cls.user, order=cls.order, amount="80.00", status="Created", payment_method="online", payment_id="order_hook"
+        )
+        basket = Basket.objects.create(owner=cls.user)
+        cls.item = BasketItem.objects.create(basket_object=basket, product_object=cls.product, quantity=2, is_active=True)
+
+    def deliver(self, event, event_id, payment=None, refund=None, signature=None):
+        payload = {"entity": "event", "event": event, "payload": {}}
+        if payment:
+            payload["payload"]["payment"] = {"entity": payment}
+        if refund:
+            payload["payload"]["refund"] = {"entity": refund}
+        body = json.dumps(payload).encode()
+        signature = signature or hmac.new(b"whsec_test", body, hashlib.sha256).hexdigest()
+        return self.client.post(
+            "/payments/webhook/", body, content_type="application/json",
+            HTTP_X_RAZORPAY_SIGNATURE=signature, HTTP_X_RAZORPAY_EVENT_ID=event_id,
+        )
+
+    def test_endpoint_only_verifies_and_stores(self):
+        with self.assertNumQueries(1):
+            response = self.deliver("payment.captured", "evt_1", {"id": "pay_1", "order_id": "order_hook"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.deliver("payment.captured", "evt_2", {"id": "pay_1"}, signature="bad").status_code, 400)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "Created")
+
+    def test_worker_applies_batch_and_drops_redeliveries(self):
+        self.deliver("payment.captured", "evt_ok", {"id": "pay_ok", "order_id": "order_hook"})
+        self.deliver("payment.failed", "evt_fail", {"id": "pay_fail", "order_id": "order_hook"})
+        self.deliver("payment.captured", "evt_ok", {"id": "pay_ok", "order_id": "order_hook"})
+        self.assertEqual(WebhookEvent.objects.count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = process_pending(batch_size=1)
+        self.assertEqual(result.events, 2)
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.item.refresh_from_db()
+        # the failed attempt arrived later but does not undo the capture
+        self.assertEqual((self.payment.status, self.payment.payment_id), ("Paid", "pay_ok"))
+        self.assertEqual(self.order.status, "Paid")
+        self.assertTrue(self.item.is_order_placed)
+        self.assertEqual(ProductPopularity.objects.get(product=self.product).units_sold, 2)
+        self.assertEqual(process_pending().events, 0)
+
+    def test_refund_matched_by_payment_id(self):
+        self.deliver("payment.captured", "evt_paid", {"id": "pay_done", "order_id": "order_hook"})
+        with self.captureOnCommitCallbacks(execute=True):
+            process_pending()
+        self.assertEqual(ProductPopularity.objects.get(product=self.product).units_sold, 2)
+
+        self.deliver("refund.processed", "evt_refund", refund={"id": "rfnd_1", "payment_id": "pay_done"})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_pending().refunded, 1)
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.payment.status, "Refunded")
+        self.assertEqual(self.order.status, "Refunded")
+        # the sale no longer counts towards ?sort=popular
+        row = ProductPopularity.objects.get(product=self.product)
+        self.assertEqual((row.units_sold, row.score), (0, 0))
+
+    def test_refund_of_an_unpaid_order_uncounts_nothing(self):
+        self.deliver("payment.captured", "evt_paid", {"id": "pay_x", "order_id": "order_hook"})
+        self.deliver("refund.processed", "evt_refund", {"id": "pay_x", "order_id": "order_hook"}, {"id": "rfnd_x", "payment_id": "pay_x"})
+        with self.captureOnCommitCallbacks(execute=True):
+            process_pending()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "Refunded")
+        self.assertEqual(ProductPopularity.objects.get(product=self.product).units_sold, 0)
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.db import transaction
 from django.shortcuts import render
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
@@ -8,15 +9,19 @@ from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 
 from django.utils.crypto import get_random_string
+from store import reservations
 from store.models import Basket, Order, OrderItem
 from store.serializers import CartItemSerializer
 from payment.models import Payment
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from store.models import Order, BasketItem
 from payment.models import Payment, Invoice
 from payment.serializers import PaymentSerializer, InvoiceSerializer
+from payment import webhooks
+from payment.idempotency import idempotent
+from payment.gateway import GatewayUnavailable, razorpay_gateway
 
-client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+client = razorpay_gateway.client
 
 
 # class PaymentViewSet(viewsets.ModelViewSet):
@@ -97,59 +102,78 @@ class PaymentViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     @action(detail=False, methods=['post'], url_path='user-cart-checkout', permission_classes=[IsAuthenticated])
+    @idempotent('checkout')
     def user_cart_checkout(self, request):
         try:
-            basket = Basket.objects.filter(owner=request.user, is_active=True).first()
-            if not basket:
-                return Response({"error": "No active basket found"}, status=status.HTTP_404_NOT_FOUND)
-
-            items = basket.cartitems.filter(is_active=True, is_order_placed=False)
-            if not items.exists():
+            # one joined query: items, their products and DB-computed line totals
+            items = list(
+                BasketItem.objects.in_cart()
+                .filter(basket_object__owner=request.user, basket_object__is_active=True)
+                .with_totals()
+                .order_by('id')
+            )
+            if not items:
+                if not Basket.objects.filter(owner=request.user, is_active=True).exists():
+                    return Response({"error": "No active basket found"}, status=status.HTTP_404_NOT_FOUND)
                 return Response({"error": "Basket is empty"}, status=status.HTTP_404_NOT_FOUND)
+            basket_id = items[0].basket_object_id
 
-            total_amount = sum([item.product_object.price * item.quantity for item in items])
+            total_amount = sum(item.line_total for item in items)
             razorpay_amount = int(total_amount * 100)  # Razorpay expects paise
 
-            payment_order = client.order.create({
-                "amount": razorpay_amount,
-                "currency": "INR",
-                "payment_capture": "1",
-            })
-
-            order = Order.objects.create(
-                user=request.user,
-                order_id=get_random_string(12),
-                razorpay_order_id=payment_order["id"],
-                amount=total_amount,
-                status="Pending",
-                first_name=request.data.get("first_name"),
-                last_name=request.data.get("last_name"),
-                phone_number=request.data.get("phone_number"),
-                city=request.data.get("city"),
-                state=request.data.get("state"),
-                pincode=request.data.get("pincode"),
-                shipping_address=request.data.get("shipping_address"),
-                billing_address=request.data.get("billing_address"),
-                notes=request.data.get("notes"),
-            )
+            # the gateway call stays outside the transaction and is bounded by
+            # a timeout, retries and a circuit breaker (payment.gateway)
+            try:
+                payment_order = razorpay_gateway.create_order({
+                    "amount": razorpay_amount,
+                    "currency": "INR",
+                    "payment_capture": "1",
+                })
+            except GatewayUnavailable as e:
+                response = Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                response["Retry-After"] = str(max(1, round(e.retry_after or 1)))
+                return response
+
+            with transaction.atomic():
+                order = Order.objects.create(
+                    user=request.user,
+                    order_id=get_random_string(12),
+                    razorpay_order_id=payment_order["id"],
+                    amount=total_amount,
+                    status="Pending",
+                    first_name=request.data.get("first_name"),
+                    last_name=request.data.get("last_name"),
+                    phone_number=request.data.get("phone_number"),
+                    city=request.data.get("city"),
+                    state=request.data.get("state"),
+                    pincode=request.data.get("pincode"),
+                    shipping_address=request.data.get("shipping_address"),
+                    billing_address=request.data.get("billing_address"),
+                    notes=request.data.get("notes"),
+                )
 
-            for item in items:
-                OrderItem.objects.create(
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product=item.product_object,
+                        quantity=item.quantity,
+                        price=item.product_object.price
+                    )
+                    for item in items
+                ])
+
+                # keep the stock held while the customer pays
+                reservations.renew(basket_id)
+
+                Payment.objects.create(
+                    user=request.user,
                     order=order,
-                    product=item.product_object,
-                    quantity=item.quantity,
-                    price=item.product_object.price
+                    amount=total_amount,
+                    status="Created",
+                    payment_method="online",   # Razorpay
+                    payment_id=payment_order["id"]
                 )
 
-            Payment.objects.create(
-                user=request.user,
-                order=order,
-                amount=total_amount,
-                status="Created",
-                payment_method="online",   # Razorpay
-                payment_id=payment_order["id"]
-            )
-
             items_data = CartItemSerializer(items, many=True).data
 
             return Response({
@@ -162,7 +186,23 @@ class PaymentViewSet(viewsets.ModelViewSet):
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['post'], url_path='webhook', permission_classes=[AllowAny], authentication_classes=[])
+    def webhook(self, request):
+        # only verify and store; `manage.py process_webhooks` applies the events
+        if not settings.RAZORPAY_WEBHOOK_SECRET:
+            return Response({"error": "Webhooks are not configured"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        body = request.body
+        if not webhooks.valid_signature(body, request.headers.get("X-Razorpay-Signature")):
+            return Response({"error": "Signature verification failed"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            webhooks.record(body, request.headers.get("X-Razorpay-Event-Id"))
+        except ValueError:
+            return Response({"error": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"status": "ok"}, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['post'], url_path='payment-status')
+    @idempotent('payment-status')
     def payment_status(self, request):
         try:
             data = request.data
@@ -0,0 +1,165 @@
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+from django.utils import timezone
+
+from payment.models import Payment, WebhookEvent
+from store import popularity
+from store.models import BasketItem, Order
+
+
+# ---------------------------
+# Razorpay webhooks
+# ---------------------------
+# The endpoint only checks the signature and appends the event to the
+# WebhookEvent inbox; process_pending applies the inbox in batches. When
+# one batch holds several events for an order, the strongest outcome wins
+# (refund > capture > failure), so a failed attempt followed by a
+# successful one leaves the order paid whatever order they arrive in.
+HANDLED_EVENTS = ('payment.failed', 'payment.captured', 'refund.processed')
+RANK = {event: rank for rank, event in enumerate(HANDLED_EVENTS)}
+BATCH_SIZE = 500
+
+
+def valid_signature(body, signature):
+    if not signature:
+        return False
+    expected = hmac.new(settings.RAZORPAY_WEBHOOK_SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def record(body, event_id=None):
+    """
+    Add a verified webhook body to the inbox. Returns False for events that
+    are not handled here; raises ValueError for a body that is not JSON.
+    Redeliveries of a stored event are ignored.
+    """
+    payload = json.loads(body)
+    event = payload.get('event') if isinstance(payload, dict) else None
+    if event not in HANDLED_EVENTS:
+        return False
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(event_id=event_id or hashlib.sha256(body).hexdigest(), event=event, payload=payload)
+    ], ignore_conflicts=True)
+    return True
+
+
+def pending():
+    return WebhookEvent.objects.filter(processed_at__isnull=True)
+
+
+class ProcessResult:
+    def __init__(self):
+        self.events = 0
+        self.paid = 0
+        self.failed = 0
+        self.refunded = 0
+
+    def as_dict(self):
+        return {'events': self.events, 'paid': self.paid, 'failed': self.failed, 'refunded': self.refunded}
+
+
+def _entities(event):
+    body = event.payload.get('payload') or {}
+    payment = (body.get('payment') or {}).get('entity') or {}
+    refund = (body.get('refund') or {}).get('entity') or {}
+    return payment, refund
+
+
+def outcomes(events):
+    """{razorpay order id: (event, razorpay payment id)}, the strongest event per order."""
+    latest, refunds = {}, set()
+    for event in events:
+        payment, refund = _entities(event)
+        payment_id = payment.get('id') or refund.get('payment_id')
+        if not payment_id:
+            continue
+        order_id = payment.get('order_id')
+        if order_id is None:
+            if event.event == 'refund.processed':
+                refunds.add(payment_id)
+            continue
+        current = latest.get(order_id)
+        if current is None or RANK[event.event] >= RANK[current[0]]:
+            latest[order_id] = (event.event, payment_id)
+    if refunds:
+        # refunds sent without their payment entity are matched through our Payment rows
+        for order_id, payment_id in Payment.objects.filter(payment_id__in=refunds).values_list(
+            'order__razorpay_order_id', 'payment_id'
+        ):
+            latest[order_id] = ('refund.processed', payment_id)
+    return latest
+
+
+def apply_events(events, now, result):
+    latest = outcomes(events)
+    orders = {
+        razorpay_id: (pk, status, user_id)
+        for pk, razorpay_id, status, user_id in Order.objects.select_for_update()
+        .filter(razorpay_order_id__in=list(latest)).values_list('id', 'razorpay_order_id', 'status', 'user_id')
+    }
+    by_event = {event: {} for event in HANDLED_EVENTS}
+    for razorpay_id, (event, payment_id) in latest.items():
+        if razorpay_id in orders:
+            by_event[event][orders[razorpay_id][0]] = payment_id
+
+    captured = by_event['payment.captured']
+    if captured:
+        result.paid += Payment.objects.filter(order_id__in=list(captured)).exclude(status='Refunded').update(
+            status='Paid',
+            payment_id=Case(
+                *(When(order_id=pk, then=Value(payment_id)) for pk, payment_id in captured.items()),
+                output_field=CharField(),
+            ),
+        )
+        placed = [pk for pk, status, _ in orders.values() if pk in captured and status == 'Pending']
+        Order.objects.filter(id__in=placed, status='Pending').update(status='Paid', updated_at=now)
+        BasketItem.objects.filter(
+            basket_object__owner_id__in={user_id for pk, _, user_id in orders.values() if pk in placed},
+            is_active=True,
+            is_order_placed=False,
+        ).update(is_order_placed=True)
+        # queryset updates skip the post_save receiver that counts sales
+        if placed:
+            transaction.on_commit(lambda: popularity.record_orders(placed))
+
+    failed = by_event['payment.failed']
+    if failed:
+        # the customer can pay again for the same order, so only the payment fails
+        result.failed += Payment.objects.filter(order_id__in=list(failed), status='Created').update(status='Failed')
+
+    refunded = by_event['refund.processed']
+    if refunded:
+        result.refunded += Payment.objects.filter(order_id__in=list(refunded)).update(status='Refunded')
+        Order.objects.filter(id__in=list(refunded)).exclude(status='Refunded').update(status='Refunded', updated_at=now)
+        # only orders that were counted as sales are uncounted
+        returned = [pk for pk, status, _ in orders.values() if pk in refunded and status in popularity.PLACED_STATUSES]
+        if returned:
+            transaction.on_commit(lambda: popularity.record_orders(returned, sign=-1))
+
+
+def process_pending(now=None, batch_size=BATCH_SIZE):
+    """
+    Apply the inbox, oldest first, in batches of one transaction each: the
+    batch is claimed by stamping processed_at (so concurrent workers skip
+    it), then Payment, Order and BasketItem rows are updated with a few
+    UPDATEs per batch. A batch that fails is rolled back and retried on the
+    next run.
+    """
+    now = now or timezone.now()
+    result = ProcessResult()
+    while True:
+        ids = list(pending().order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            if not pending().filter(id__in=ids).update(processed_at=now):
+                continue
+            events = list(WebhookEvent.objects.filter(id__in=ids, processed_at=now).order_by('id'))
+            apply_events(events, now, result)
+        result.events += len(events)
+    return result
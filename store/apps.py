@@ -4,6 +4,11 @@ class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
 
+    def ready(self):
+        from store import signals  # noqa: F401
+        from store import reservations
+        reservations.install_sweeper()
+
 class PaymentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'payment'
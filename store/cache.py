@@ -0,0 +1,261 @@
+import hashlib
+import threading
+import time
+
+from django.core.cache import caches
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from store.models import Product, ProductPopularity, Wishlist
+
+
+# ---------------------------
+# Versioned catalog cache
+# ---------------------------
+CACHE_ALIAS = 'catalog'
+VERSION_KEY = 'catalog:version'
+POPULARITY_VERSION_KEY = 'catalog:popularity-version'
+STOCK_VERSION_KEY = 'catalog:stock-version'
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _get_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a lost counter never reuses an old version
+        # whose entries may still be sitting in a file-based cache.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    cache = get_cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        _get_version(key)
+        return cache.incr(key)
+
+
+def get_catalog_version():
+    return _get_version(VERSION_KEY)
+
+
+def bump_catalog_version():
+    return _bump_version(VERSION_KEY)
+
+
+# Popularity scores move with every sale and wishlist change; only
+# responses sorted by popularity depend on them, so they get their own
+# counter instead of invalidating the whole catalog.
+def get_popularity_version():
+    return _get_version(POPULARITY_VERSION_KEY)
+
+
+def bump_popularity_version():
+    return _bump_version(POPULARITY_VERSION_KEY)
+
+
+# Stock moves with every cart change (store.inventory) and only product
+# payloads show it, so category and hero entries outlive it. Product ETags
+# follow stock through updated_at, which inventory sets with each change.
+def get_stock_version():
+    return _get_version(STOCK_VERSION_KEY)
+
+
+def bump_stock_version():
+    return _bump_version(STOCK_VERSION_KEY)
+
+
+# Hit/miss counts are kept in process memory and added to the shared
+# counters now and then: with a file-based cache every incr is a read plus
+# a file write, which would cost each cache hit a disk write.
+STATS_FLUSH_EVERY = 100
+STATS_FLUSH_SECONDS = 10.0
+_pending_counts = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _count(key):
+    with _pending_lock:
+        _pending_counts[key] = _pending_counts.get(key, 0) + 1
+        due = (
+            sum(_pending_counts.values()) >= STATS_FLUSH_EVERY
+            or time.monotonic() - _last_flush >= STATS_FLUSH_SECONDS
+        )
+    if due:
+        flush_stats()
+
+
+def flush_stats():
+    """Add this process's pending hit/miss counts to the shared counters."""
+    global _last_flush
+    with _pending_lock:
+        pending = dict(_pending_counts)
+        _pending_counts.clear()
+        _last_flush = time.monotonic()
+    cache = get_cache()
+    for key, count in pending.items():
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, count)
+
+
+def cache_stats():
+    flush_stats()
+    cache = get_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'version': get_catalog_version(),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else 0.0,
+    }
+
+
+def _sorted_by_popularity(request):
+    return 'popular' in (request.GET.get('sort'), request.GET.get('ordering'))
+
+
+def response_cache_key(request, view_name, stock=False):
+    url = request.build_absolute_uri()
+    digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+    version = get_catalog_version()
+    if stock:
+        version = f'{version}.s{get_stock_version()}'
+    if _sorted_by_popularity(request):
+        version = f'{version}.{get_popularity_version()}'
+    return f'catalog:{version}:{view_name}:{digest}'
+
+
+def make_etag(*parts):
+    raw = ':'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode('utf-8')).hexdigest())
+
+
+def catalog_state(queryset):
+    """
+    Row count and newest updated_at of `queryset`: together they change
+    whenever a row is added, edited or removed. Read from the database, so
+    every worker process derives the same ETag from them.
+    """
+    state = queryset.aggregate(count=Count('pk'), latest=Max('updated_at'))
+    return state['count'], state['latest']
+
+
+def popularity_state():
+    return ProductPopularity.objects.aggregate(total=Sum('score'))['total']
+
+
+def product_list_etag(request, *args, **kwargs):
+    """ETag for product lists; category renames touch their products' updated_at, see store.signals."""
+    parts = [request.build_absolute_uri(), *catalog_state(Product.objects.all())]
+    if _sorted_by_popularity(request):
+        parts.append(popularity_state())
+    return make_etag(*parts)
+
+
+def product_detail_etag(request, pk, *args, **kwargs):
+    last_modified = product_last_modified(request, pk)
+    if last_modified is None:
+        return None
+    parts = [request.build_absolute_uri(), last_modified]
+    if 'wishlist' in request.GET.get('expand', '') and request.user.is_authenticated:
+        # ?expand=wishlist is per user; toggling the wishlist must change the tag
+        parts.append(Wishlist.objects.filter(user=request.user, product_id=pk).exists())
+    return make_etag(*parts)
+
+
+def product_last_modified(request, pk, *args, **kwargs):
+    # condition() asks for the ETag and Last-Modified separately; both need this
+    known = request.__dict__.setdefault('_product_updated_at', {})
+    if pk not in known:
+        known[pk] = Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return known[pk]
+
+
+class CatalogCacheMixin:
+    """
+    Caches list/retrieve responses of catalog viewsets.
+
+    Entries are keyed on the catalog version, which store.signals bumps
+    on every Product, Category, ProductMedia or HeroSection change, so
+    stale entries are never read again and simply expire. The ETag comes
+    from database state (catalog_state), so every worker process agrees on
+    it; it is part of the key too, so a body is never served under the
+    ETag of a newer one. Unchanged resources get a 304 before the cache
+    is read.
+    """
+    catalog_cache_actions = ('list', 'retrieve')
+    # set on viewsets whose payload shows stock, see get_stock_version()
+    catalog_cache_tracks_stock = False
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, self.uncached_list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, self.uncached_retrieve, *args, **kwargs)
+
+    # Override these (not list/retrieve) to change what gets cached.
+    def uncached_list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def uncached_retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def catalog_etag(self, request, *args, **kwargs):
+        queryset = self.queryset.model._default_manager.all()
+        if self.action == 'retrieve':
+            try:
+                queryset = queryset.filter(pk=kwargs[self.lookup_url_kwarg or self.lookup_field])
+            except ValueError:
+                queryset = queryset.none()  # not a valid pk; the handler answers 404
+        parts = [request.build_absolute_uri(), *catalog_state(queryset)]
+        if _sorted_by_popularity(request):
+            parts.append(popularity_state())
+        return make_etag(*parts)
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if self.action not in self.catalog_cache_actions:
+            return handler(request, *args, **kwargs)
+
+        cache = get_cache()
+        etag = self.catalog_etag(request, *args, **kwargs)
+        key = response_cache_key(
+            request, f'{self.basename}-{self.action}', stock=self.catalog_cache_tracks_stock
+        ) + ':' + etag.strip('"')
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        data = cache.get(key)
+        if data is not None:
+            _count(HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            response['ETag'] = etag
+            return response
+
+        _count(MISSES_KEY)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data)
+            response['ETag'] = etag
+        response['X-Cache'] = 'MISS'
+        return response
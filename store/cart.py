@@ -0,0 +1,96 @@
+from django.db import transaction
+from django.utils import timezone
+
+from store import inventory, reservations
+from store.models import BasketItem
+
+
+# ---------------------------
+# Cart operations
+# ---------------------------
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        super().__init__('Not enough stock')
+        # [{'product': id, 'requested': extra units, 'available': stock}, ...]
+        self.shortages = shortages
+
+
+def target_quantities(current, operations):
+    """
+    Fold `operations` ({'product', 'quantity', 'action'} dicts, applied in
+    order) into the quantity each product should end up with.
+    `current` maps product ids to the quantity held in the cart now.
+    """
+    targets = {}
+    for operation in operations:
+        product = operation['product']
+        quantity = targets.get(product, current.get(product, 0))
+        action = operation.get('action', 'add')
+        if action == 'add':
+            quantity += operation['quantity']
+        elif action == 'set':
+            quantity = operation['quantity']
+        else:
+            quantity = 0
+        targets[product] = quantity
+    return targets
+
+
+def apply_operations(basket, operations):
+    """
+    Apply many add/set/remove operations to `basket` in one transaction:
+    one conditional UPDATE reserves all extra stock (or nothing, raising
+    InsufficientStock), one returns freed stock, and the items are written
+    with bulk_create/bulk_update.
+    """
+    product_ids = {operation['product'] for operation in operations}
+    now = timezone.now()
+    items = BasketItem.objects.filter(basket_object=basket, product_object_id__in=product_ids, is_order_placed=False)
+
+    with transaction.atomic():
+        # touching the rows locks them before their quantities are read
+        items.update(updated_date=now)
+        existing = {}
+        for item in items.order_by('id'):
+            existing.setdefault(item.product_object_id, item)
+        held = {pk: item.quantity for pk, item in existing.items() if item.is_active}
+        targets = target_quantities(held, operations)
+
+        changes = {pk: quantity - held.get(pk, 0) for pk, quantity in targets.items()}
+        needed = {pk: change for pk, change in changes.items() if change > 0}
+        if not inventory.reserve_stock_bulk(needed):
+            available = inventory.stock_levels(needed)
+            raise InsufficientStock([
+                {'product': pk, 'requested': change, 'available': available.get(pk, 0)}
+                for pk, change in needed.items()
+                if available.get(pk, 0) < change
+            ])
+        inventory.release_stock_bulk({pk: -change for pk, change in changes.items() if change < 0})
+
+        deadline = reservations.reserved_until(now)
+        to_create, to_update = [], []
+        for pk, quantity in targets.items():
+            item = existing.get(pk)
+            if item is None:
+                if quantity > 0:
+                    to_create.append(BasketItem(
+                        basket_object=basket,
+                        product_object_id=pk,
+                        quantity=quantity,
+                        is_active=True,
+                        is_order_placed=False,
+                        reserved_until=deadline,
+                    ))
+                continue
+            if quantity > 0:
+                item.quantity, item.is_active, item.reserved_until = quantity, True, deadline
+            elif not item.is_active:
+                continue
+            else:
+                item.is_active, item.reserved_until = False, None
+            item.updated_date = now
+            to_update.append(item)
+
+        BasketItem.objects.bulk_create(to_create)
+        BasketItem.objects.bulk_update(to_update, ['quantity', 'is_active', 'reserved_until', 'updated_date'])
+        reservations.renew(basket.pk, now)
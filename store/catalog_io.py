@@ -0,0 +1,284 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from store import popularity, search, similarity
+from store.cache import bump_catalog_version
+from store.facets import FALSE_VALUES, TRUE_VALUES
+from store.models import Category, Product
+
+
+# ---------------------------
+# Bulk catalog import / export
+# ---------------------------
+COLUMNS = ['id', 'brand', 'name', 'description', 'price', 'stock', 'available', 'category']
+UPDATE_FIELDS = ['brand', 'name', 'description', 'price', 'stock', 'available', 'category', 'updated_at']
+FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(fileobj, file_format):
+    """Yield (line number, row dict) without loading the whole file."""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == 'jsonl':
+            for line_no, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_no, {'__error__': f'Invalid JSON: {e}'}
+                    continue
+                yield line_no, row if isinstance(row, dict) else {'__error__': 'Expected a JSON object'}
+        else:
+            reader = csv.reader(text)
+            header = [column.strip().lower() for column in next(reader, [])]
+            for values in reader:
+                if not any(value.strip() for value in values):
+                    continue
+                yield reader.line_num, dict(zip(header, values))
+    finally:
+        text.detach()
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line_no, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line_no, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'errors_truncated': self.error_count > len(self.errors),
+        }
+
+
+def validate_row(row, categories, existing):
+    """Returns (cleaned dict, None) or (None, {field: message})."""
+    if '__error__' in row:
+        return None, {'row': row['__error__']}
+
+    errors = {}
+    cleaned = {}
+
+    product_id = row.get('id')
+    if not _blank(product_id):
+        try:
+            cleaned['id'] = int(product_id)
+        except (TypeError, ValueError):
+            errors['id'] = 'Must be an integer.'
+        else:
+            if cleaned['id'] not in existing:
+                errors['id'] = 'Unknown product id.'
+    is_update = 'id' in cleaned and 'id' not in errors
+
+    for field, max_length in (('name', 100), ('brand', 100)):
+        value = row.get(field)
+        if _blank(value):
+            if field == 'name' and not is_update:
+                errors[field] = 'This field is required.'
+            continue
+        value = str(value).strip()
+        if len(value) > max_length:
+            errors[field] = f'Ensure this field has no more than {max_length} characters.'
+        cleaned[field] = value
+
+    description = row.get('description')
+    if _blank(description):
+        if not is_update:
+            errors['description'] = 'This field is required.'
+    else:
+        cleaned['description'] = str(description)
+
+    price = row.get('price')
+    if _blank(price):
+        if not is_update:
+            errors['price'] = 'This field is required.'
+    else:
+        try:
+            cleaned['price'] = Decimal(str(price)).quantize(Decimal('0.01'))
+            if cleaned['price'] < 0 or cleaned['price'] >= Decimal('1e8'):
+                raise InvalidOperation
+        except InvalidOperation:
+            errors['price'] = 'A valid price is required.'
+
+    stock = row.get('stock')
+    if _blank(stock):
+        if not is_update:
+            errors['stock'] = 'This field is required.'
+    else:
+        try:
+            cleaned['stock'] = int(stock)
+            if cleaned['stock'] < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors['stock'] = 'Must be a non-negative integer.'
+
+    available = row.get('available')
+    if not _blank(available):
+        value = str(available).strip().lower()
+        if value in TRUE_VALUES:
+            cleaned['available'] = True
+        elif value in FALSE_VALUES:
+            cleaned['available'] = False
+        else:
+            errors['available'] = 'Must be true or false.'
+
+    category = row.get('category')
+    if _blank(category):
+        if not is_update:
+            errors['category'] = 'This field is required.'
+    else:
+        key = str(category).strip()
+        match = categories.get(key) or categories.get(key.lower())
+        if match is None:
+            errors['category'] = f'Unknown category "{key}".'
+        else:
+            cleaned['category'] = match
+
+    if errors:
+        return None, errors
+    return cleaned, None
+
+
+def _category_lookup(chunk):
+    keys = {str(row.get('category')).strip() for _, row in chunk if not _blank(row.get('category'))}
+    ids = [int(key) for key in keys if key.isdigit()]
+    lookup = {}
+    for category in Category.objects.filter(slug__in=keys) | Category.objects.filter(pk__in=ids):
+        lookup[category.slug] = category
+        lookup[str(category.pk)] = category
+    return lookup
+
+
+def _existing_ids(chunk):
+    ids = set()
+    for _, row in chunk:
+        try:
+            ids.add(int(row.get('id')))
+        except (TypeError, ValueError):
+            pass
+    return set(Product.objects.filter(pk__in=ids).values_list('pk', flat=True))
+
+
+def import_products(rows, chunk_size=CHUNK_SIZE, dry_run=False):
+    """
+    Validate and upsert products chunk by chunk.
+
+    Rows with an `id` update that product, rows without one create a new
+    product. Each chunk is written with bulk_create/bulk_update inside its
+    own transaction; invalid rows are reported and skipped.
+    """
+    result = ImportResult()
+    touched = []
+
+    for chunk in _chunks(rows, chunk_size):
+        categories = _category_lookup(chunk)
+        existing = _existing_ids(chunk)
+        to_create, to_update = [], {}
+        now = timezone.now()
+
+        for line_no, row in chunk:
+            cleaned, errors = validate_row(row, categories, existing)
+            if errors:
+                result.add_error(line_no, errors)
+            elif 'id' in cleaned:
+                to_update.setdefault(cleaned['id'], {}).update(cleaned)
+            else:
+                to_create.append(Product(available=cleaned.pop('available', True), **cleaned))
+
+        if to_update:
+            products = Product.objects.in_bulk(list(to_update))
+            for pk, values in to_update.items():
+                product = products[pk]
+                for field, value in values.items():
+                    setattr(product, field, value)
+                product.updated_at = now
+            to_update = list(products.values())
+
+        if not dry_run:
+            with transaction.atomic():
+                created = Product.objects.bulk_create(to_create, batch_size=chunk_size)
+                if to_update:
+                    Product.objects.bulk_update(to_update, UPDATE_FIELDS, batch_size=chunk_size)
+            touched.extend(product.pk for product in created)
+            touched.extend(product.pk for product in to_update)
+
+        result.created += len(to_create)
+        result.updated += len(to_update)
+
+    if touched:
+        # bulk writes skip post_save, so refresh what the signals maintain
+        search.index_products(touched)
+        popularity.ensure_rows(touched)
+        # big catalogs are left to the scheduled rebuild_similar_products run
+        if Product.objects.count() <= similarity.sync_refresh_limit():
+            similarity.refresh_similar_products(touched)
+        bump_catalog_version()
+    return result
+
+
+def export_rows(file_format):
+    """Yield the whole catalog as CSV or JSONL text, one chunk at a time."""
+    queryset = (
+        Product.objects.order_by('id')
+        .values_list('id', 'brand', 'name', 'description', 'price', 'stock', 'available', 'category__slug')
+    )
+
+    if file_format == 'jsonl':
+        for values in queryset.iterator(chunk_size=2000):
+            row = dict(zip(COLUMNS, values))
+            row['price'] = str(row['price'])
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for values in queryset.iterator(chunk_size=2000):
+        writer.writerow(values)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
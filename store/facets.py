@@ -0,0 +1,141 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Case, CharField, Count, Q, Value, When
+from rest_framework.exceptions import ValidationError
+
+
+# ---------------------------
+# Storefront filters & facet counts
+# ---------------------------
+# (label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ('0-500', Decimal('0'), Decimal('500')),
+    ('500-1000', Decimal('500'), Decimal('1000')),
+    ('1000-2500', Decimal('1000'), Decimal('2500')),
+    ('2500+', Decimal('2500'), None),
+]
+
+TRUE_VALUES = {'1', 'true', 'yes'}
+FALSE_VALUES = {'0', 'false', 'no'}
+
+
+def _split(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def _decimal(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'Must be a number.'})
+
+
+def parse_filters(params):
+    """
+    Read storefront filters from query params into a dict of Q objects,
+    one per facet, so each facet can be counted without its own filter.
+    """
+    filters = {}
+
+    brands = _split(params.get('brand', ''))
+    if brands:
+        filters['brand'] = Q(brand__in=brands)
+
+    categories = _split(params.get('category', ''))
+    if categories:
+        try:
+            filters['category'] = Q(category_id__in=[int(pk) for pk in categories])
+        except ValueError:
+            raise ValidationError({'category': 'Must be a comma separated list of category ids.'})
+
+    min_price = _decimal(params, 'min_price')
+    max_price = _decimal(params, 'max_price')
+    price = Q()
+    if min_price is not None:
+        price &= Q(price__gte=min_price)
+    if max_price is not None:
+        price &= Q(price__lte=max_price)
+    if price:
+        filters['price'] = price
+
+    available = params.get('available')
+    if available not in (None, ''):
+        available = available.lower()
+        if available not in TRUE_VALUES | FALSE_VALUES:
+            raise ValidationError({'available': 'Must be true or false.'})
+        filters['available'] = Q(available=available in TRUE_VALUES)
+
+    return filters
+
+
+def apply_filters(queryset, filters, exclude=None):
+    for name, condition in filters.items():
+        if name != exclude:
+            queryset = queryset.filter(condition)
+    return queryset
+
+
+def price_bucket_expression():
+    whens = []
+    for label, low, high in PRICE_BUCKETS:
+        condition = Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        whens.append(When(condition, then=Value(label)))
+    return Case(*whens, default=Value(None), output_field=CharField())
+
+
+def facet_counts(queryset, filters):
+    """
+    Count products per brand, category and price bucket with one grouped
+    query per facet. Each facet ignores its own filter (but honours the
+    others) so the sidebar still shows the alternatives to a selection.
+    """
+    brands = (
+        apply_filters(queryset, filters, exclude='brand')
+        .exclude(brand__isnull=True).exclude(brand='')
+        .order_by()
+        .values('brand')
+        .annotate(count=Count('id'))
+        .order_by('brand')
+    )
+    categories = (
+        apply_filters(queryset, filters, exclude='category')
+        .order_by()
+        .values('category_id', 'category__name', 'category__slug')
+        .annotate(count=Count('id'))
+        .order_by('category__name')
+    )
+    buckets = dict(
+        apply_filters(queryset, filters, exclude='price')
+        .order_by()
+        .annotate(bucket=price_bucket_expression())
+        .values('bucket')
+        .annotate(count=Count('id'))
+        .values_list('bucket', 'count')
+    )
+
+    return {
+        'brand': [{'value': row['brand'], 'count': row['count']} for row in brands],
+        'category': [
+            {
+                'id': row['category_id'],
+                'name': row['category__name'],
+                'slug': row['category__slug'],
+                'count': row['count'],
+            }
+            for row in categories
+        ],
+        'price': [
+            {
+                'label': label,
+                'min': str(low),
+                'max': str(high) if high is not None else None,
+                'count': buckets.get(label, 0),
+            }
+            for label, low, high in PRICE_BUCKETS
+        ],
+    }
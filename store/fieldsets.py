@@ -0,0 +1,136 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+# ---------------------------
+# Sparse fieldsets (?fields=id,name,price / ?omit=description)
+# ---------------------------
+FIELDSET_PARAMS = ('fields', 'omit')
+
+
+def parse_field_list(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def fieldset_from_request(request):
+    """Serializer kwargs for the ?fields= / ?omit= of a read request, else {}."""
+    if request is None or request.method not in SAFE_METHODS:
+        return {}
+    return {
+        param: parse_field_list(request.query_params[param])
+        for param in FIELDSET_PARAMS
+        if param in request.query_params
+    }
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin taking `fields=` (keep only these) and `omit=` (drop
+    these) keyword arguments. Unknown names raise a ValidationError.
+
+    Declare Meta.field_sources = {name: [model paths]} for fields whose
+    source does not map to model columns (source='*', method fields), so
+    prune_queryset() knows what they read.
+    """
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None and omit is None:
+            return
+
+        unknown = set(fields or ()).union(omit or ()).difference(self.fields)
+        if unknown:
+            raise serializers.ValidationError(
+                {'fields': f"Unknown field(s): {', '.join(sorted(unknown))}."}
+            )
+        for name in list(self.fields):
+            if (fields is not None and name not in fields) or (omit and name in omit):
+                self.fields.pop(name)
+
+
+def _column_path(model, path):
+    """
+    Returns (column path, related name to join) for a serializer source,
+    ('', None) for reverse/many relations (those are prefetched, not
+    columns) and None when the source is not a model field at all.
+    """
+    parts = path.split('__')
+    try:
+        field = model._meta.get_field(parts[0])
+    except FieldDoesNotExist:
+        return None
+    if field.many_to_many or field.one_to_many or field.one_to_one and not field.concrete:
+        return '', None
+    if len(parts) == 1 or not field.many_to_one:
+        return parts[0], None
+    if _column_path(field.related_model, '__'.join(parts[1:])) is None:
+        return None
+    return path, parts[0]
+
+
+def prune_queryset(queryset, serializer):
+    """
+    Restrict `queryset` with only() to the columns `serializer` will read,
+    dropping select_related() joins nothing reads. Leaves the queryset
+    alone when a field's source cannot be traced to the model.
+    """
+    serializer = getattr(serializer, 'child', serializer)
+    model = queryset.model
+    sources = getattr(serializer.Meta, 'field_sources', {})
+    only = {model._meta.pk.name}
+    joins = set()
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in sources:
+            paths = sources[name]
+        elif field.source == '*':
+            return queryset
+        else:
+            paths = ['__'.join(field.source_attrs)]
+
+        for path in paths:
+            resolved = _column_path(model, path)
+            if resolved is None:
+                return queryset
+            column, join = resolved
+            if column:
+                only.add(column)
+            if join:
+                joins.add(join)
+
+    selected = queryset.query.select_related
+    if isinstance(selected, dict):
+        joins.update(name for name in selected if name in only)
+    queryset = queryset.select_related(None)
+    if joins:
+        queryset = queryset.select_related(*joins)
+    return queryset.only(*only)
+
+
+class SparseFieldsetMixin:
+    """
+    View mixin applying ?fields= / ?omit= to GET requests: the serializer
+    drops the other fields and the queryset only loads what is left.
+    Viewset actions serializing something else are left alone.
+    """
+    fieldset_actions = ('list', 'retrieve')
+
+    def get_fieldset(self):
+        action = getattr(self, 'action', None)
+        if action is not None and action not in self.fieldset_actions:
+            return {}
+        return fieldset_from_request(getattr(self, 'request', None))
+
+    def get_serializer(self, *args, **kwargs):
+        for param, value in self.get_fieldset().items():
+            kwargs.setdefault(param, value)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.get_fieldset():
+            queryset = prune_queryset(queryset, self.get_serializer())
+        return queryset
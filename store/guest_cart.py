@@ -0,0 +1,129 @@
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+
+from store import cart
+from store.images import variant_urls
+from store.models import Basket, Product
+
+
+# ---------------------------
+# Guest cart (signed cookie)
+# ---------------------------
+# Visitors who are not logged in keep their cart in a signed cookie
+# ({product id: quantity}), so browsing and filling a cart writes nothing
+# to the database. Stock is only checked, not reserved; the cart becomes a
+# Basket, with reservations, when the visitor logs in (merge_into_basket).
+COOKIE_NAME = 'guest_cart'
+COOKIE_SALT = 'store.guest_cart'
+MAX_AGE = 60 * 60 * 24 * 30
+MAX_LINES = 50  # keeps the cookie well under the 4 KB browsers accept
+
+
+def read(request):
+    try:
+        raw = request.get_signed_cookie(COOKIE_NAME, salt=COOKIE_SALT, max_age=MAX_AGE)
+        lines = {int(pk): int(quantity) for pk, quantity in json.loads(raw).items()}
+    except (KeyError, signing.BadSignature, ValueError, TypeError, AttributeError):
+        return {}
+    return {pk: quantity for pk, quantity in lines.items() if quantity > 0}
+
+
+def write(response, lines):
+    if not lines:
+        response.delete_cookie(COOKIE_NAME, samesite=settings.SESSION_COOKIE_SAMESITE)
+        return
+    response.set_signed_cookie(
+        COOKIE_NAME,
+        json.dumps({str(pk): quantity for pk, quantity in lines.items()}, separators=(',', ':')),
+        salt=COOKIE_SALT,
+        max_age=MAX_AGE,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite=settings.SESSION_COOKIE_SAMESITE,
+    )
+
+
+def apply_operations(lines, operations):
+    """
+    New cart lines after `operations` (see store.cart.target_quantities).
+    Raises cart.InsufficientStock when a product has fewer units than asked.
+    """
+    targets = cart.target_quantities(lines, operations)
+    stock = dict(Product.objects.filter(pk__in=list(targets)).values_list('id', 'stock'))
+    shortages = [
+        {'product': pk, 'requested': quantity, 'available': stock.get(pk, 0)}
+        for pk, quantity in targets.items()
+        if quantity > stock.get(pk, 0)
+    ]
+    if shortages:
+        raise cart.InsufficientStock(shortages)
+    lines = {**lines, **targets}
+    return {pk: quantity for pk, quantity in lines.items() if quantity > 0}
+
+
+def payload(lines, request=None):
+    """Cart items shaped like CartItemSerializer, plus totals, from one query."""
+    products = Product.objects.in_bulk(list(lines))
+    items, total, units = [], Decimal(0), 0
+    for pk, quantity in lines.items():
+        product = products.get(pk)
+        if product is None:
+            continue
+        line_total = product.price * quantity
+        items.append({
+            'product': {
+                'id': product.id,
+                'name': product.name,
+                'price': str(product.price),
+                'image': product.image.url if product.image else None,
+                'image_variants': variant_urls(product, request),
+            },
+            'quantity': quantity,
+            'item_total': str(line_total),
+        })
+        total += line_total
+        units += quantity
+    return {
+        'results': items,
+        'totals': {'total': str(total.quantize(Decimal('0.01'))), 'items': len(items), 'units': units},
+    }
+
+
+def merge_into_basket(user, lines, attempts=3):
+    """
+    Add the guest cart to the user's Basket in one go (bulk upsert via
+    store.cart.apply_operations). Products short of stock are added as far
+    as stock allows. Returns [{'product', 'dropped'}] for units left out.
+    """
+    known = set(Product.objects.filter(pk__in=list(lines)).values_list('id', flat=True)) if lines else set()
+    operations = [
+        {'product': pk, 'quantity': quantity, 'action': 'add'}
+        for pk, quantity in lines.items() if pk in known
+    ]
+    if not operations:
+        return []
+    basket, _ = Basket.objects.get_or_create(owner=user)
+
+    dropped = {}
+    for _ in range(attempts):
+        try:
+            cart.apply_operations(basket, operations)
+            break
+        except cart.InsufficientStock as e:
+            short = {entry['product']: entry['requested'] - entry['available'] for entry in e.shortages}
+        # retry with what stock allows; it may still move in between
+        for operation in operations:
+            cut = min(short.get(operation['product'], 0), operation['quantity'])
+            operation['quantity'] -= cut
+            if cut:
+                dropped[operation['product']] = dropped.get(operation['product'], 0) + cut
+        operations = [operation for operation in operations if operation['quantity'] > 0]
+        if not operations:
+            break
+    else:
+        for operation in operations:
+            dropped[operation['product']] = dropped.get(operation['product'], 0) + operation['quantity']
+    return [{'product': pk, 'dropped': units} for pk, units in dropped.items()]
@@ -0,0 +1,126 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# ---------------------------
+# Responsive image variants
+# ---------------------------
+# name -> longest edge in pixels
+VARIANT_SIZES = {
+    'thumb': 160,
+    'card': 480,
+    'full': 1600,
+}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+VARIANT_DIR = 'variants'
+
+
+def image_field_name(instance):
+    """The file field variants are generated from (ProductMedia uses `file`)."""
+    return 'file' if instance._meta.model_name == 'productmedia' else 'image'
+
+
+def _variant_name(source_name, variant, ext):
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(VARIANT_DIR, directory, f'{stem}_{variant}.{ext}')
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif fmt == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def delete_variants(storage, variants):
+    for variant, files in variants.items():
+        if variant == 'source':
+            continue
+        for name in files.values():
+            storage.delete(name)
+
+
+def build_variants(fieldfile):
+    """
+    Write thumb/card/full renditions of an uploaded image as WebP plus a
+    JPEG (or PNG, when the source has transparency) fallback. Returns the
+    mapping stored on the model, or {} when the file is not an image.
+    """
+    storage = fieldfile.storage
+    try:
+        with storage.open(fieldfile.name, 'rb') as source:
+            image = Image.open(source)
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (UnidentifiedImageError, OSError, ValueError):
+        return {}
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    fallback = 'png' if has_alpha else 'jpeg'
+
+    variants = {'source': fieldfile.name}
+    for variant, size in VARIANT_SIZES.items():
+        rendition = image.copy()
+        rendition.thumbnail((size, size), Image.LANCZOS)
+        files = {}
+        for fmt in ('webp', fallback):
+            name = _variant_name(fieldfile.name, variant, 'jpg' if fmt == 'jpeg' else fmt)
+            files[fmt] = storage.save(name, ContentFile(_encode(rendition, fmt)))
+        variants[variant] = files
+    return variants
+
+
+def ensure_variants(instance, force=False):
+    """
+    Bring instance.image_variants in line with its current file.
+    Returns True when the stored variants changed.
+    """
+    fieldfile = getattr(instance, image_field_name(instance))
+    current = instance.image_variants or {}
+    source = fieldfile.name if fieldfile else None
+
+    if not force and current.get('source') == source and (current or not source):
+        return False
+
+    if current:
+        delete_variants(fieldfile.storage, current)
+    variants = build_variants(fieldfile) if source else {}
+    if not variants and source:
+        # keep the source so non-image uploads are not re-checked on every save
+        variants = {'source': source}
+
+    # update() keeps this from re-triggering post_save handlers; updated_at
+    # (ETag / Last-Modified) has to move with the payload all the same
+    changes = {'image_variants': variants}
+    if any(field.name == 'updated_at' for field in instance._meta.concrete_fields):
+        changes['updated_at'] = timezone.now()
+    type(instance).objects.filter(pk=instance.pk).update(**changes)
+    instance.image_variants = variants
+    return True
+
+
+def variant_urls(instance, request=None):
+    """Public URLs for each variant, e.g. {'thumb': {'webp': url, 'jpeg': url}}."""
+    variants = instance.image_variants or {}
+    storage = getattr(instance, image_field_name(instance)).storage
+    urls = {}
+    for variant in VARIANT_SIZES:
+        files = variants.get(variant)
+        if not files:
+            continue
+        urls[variant] = {
+            fmt: request.build_absolute_uri(storage.url(name)) if request else storage.url(name)
+            for fmt, name in files.items()
+        }
+    return urls
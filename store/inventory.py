@@ -0,0 +1,86 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from store.cache import bump_stock_version
+from store.models import Product
+
+
+# ---------------------------
+# Stock reservation
+# ---------------------------
+# Carts hold stock from add-to-cart until the item is removed. Every change
+# is a single conditional UPDATE, so concurrent requests can neither
+# oversell nor overwrite each other's counts, and no row is read first.
+# Queryset updates skip post_save, so updated_at (ETag / Last-Modified)
+# is set here and cached product responses are invalidated once the change
+# commits. Categories and hero sections stay cached.
+def _changed():
+    transaction.on_commit(bump_stock_version)
+
+
+def reserve_stock(product_id, quantity):
+    """Take `quantity` units if that many are left. Returns whether it did."""
+    reserved = Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+        stock=F('stock') - quantity,
+        updated_at=timezone.now(),
+    )
+    if reserved:
+        _changed()
+    return bool(reserved)
+
+
+def _per_product(units):
+    return Case(
+        *(When(pk=pk, then=Value(quantity)) for pk, quantity in units.items()),
+        output_field=IntegerField(),
+    )
+
+
+class _Shortage(Exception):
+    pass
+
+
+def reserve_stock_bulk(units):
+    """
+    Take {product_id: quantity} for many products in one UPDATE, all or
+    nothing. Returns whether it did.
+    """
+    units = {pk: quantity for pk, quantity in units.items() if quantity > 0}
+    if not units:
+        return True
+    needed = _per_product(units)
+    try:
+        with transaction.atomic():
+            reserved = Product.objects.filter(pk__in=list(units), stock__gte=needed).update(
+                stock=F('stock') - needed,
+                updated_at=timezone.now(),
+            )
+            if reserved != len(units):
+                raise _Shortage
+    except _Shortage:
+        return False
+    _changed()
+    return True
+
+
+def stock_levels(product_ids):
+    return dict(Product.objects.filter(pk__in=list(product_ids)).values_list('id', 'stock'))
+
+
+def release_stock(product_id, quantity):
+    """Put `quantity` units back."""
+    if quantity <= 0:
+        return
+    Product.objects.filter(pk=product_id).update(stock=F('stock') + quantity, updated_at=timezone.now())
+    _changed()
+
+
+def release_stock_bulk(units):
+    """Put back {product_id: quantity} for many products in one UPDATE."""
+    units = {pk: quantity for pk, quantity in units.items() if quantity > 0}
+    if not units:
+        return
+    returned = _per_product(units)
+    Product.objects.filter(pk__in=list(units)).update(stock=F('stock') + returned, updated_at=timezone.now())
+    _changed()
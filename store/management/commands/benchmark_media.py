@@ -0,0 +1,79 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.views import static
+
+from store.media import serve_media
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure time to first byte of store.media.serve_media on a large local "
+        "file, for the whole file and for a seek near its end (Range request), "
+        "next to django.views.static.serve, which ignores Range and has to "
+        "stream everything before the wanted byte."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size-mb", type=int, default=256)
+        parser.add_argument("--seek", type=float, default=0.9, help="Seek target as a fraction of the file")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        size = options["size_mb"] * 1024 * 1024
+        offset = int(size * options["seek"])
+        with tempfile.TemporaryDirectory() as root, override_settings(MEDIA_ROOT=root):
+            self.write_file(os.path.join(root, "video.mp4"), size)
+            factory = RequestFactory()
+            self.stdout.write(f"{options['size_mb']} MiB file, seek to byte {offset}")
+
+            views = {
+                "serve_media": lambda request: serve_media(request, "video.mp4"),
+                "static": lambda request: static.serve(request, "video.mp4", document_root=root),
+            }
+            timings = {}
+            for name, view in views.items():
+                for case, headers in (("start", {}), ("seek", {"HTTP_RANGE": f"bytes={offset}-"})):
+                    timings[name, case] = statistics.median(
+                        self.time_to_byte(view, factory.get("/media/video.mp4", **headers), offset)
+                        for _ in range(options["repeat"])
+                    )
+                self.stdout.write(
+                    f"  {name:<12} first byte {timings[name, 'start'] * 1000:8.2f} ms, "
+                    f"byte {offset} {timings[name, 'seek'] * 1000:8.2f} ms"
+                )
+
+        ratio = timings["static", "seek"] / timings["serve_media", "seek"]
+        self.stdout.write(self.style.SUCCESS(f"seeking is {ratio:.0f}x faster with serve_media"))
+
+    @staticmethod
+    def write_file(path, size):
+        chunk = os.urandom(1024 * 1024)
+        with open(path, "wb") as file:
+            for _ in range(size // len(chunk)):
+                file.write(chunk)
+            file.write(chunk[:size % len(chunk)])
+
+    @staticmethod
+    def time_to_byte(view, request, offset):
+        """
+        Seconds from the view call until the wanted byte arrives: the first
+        one, or byte `offset` for a Range request. A 206 starts at `offset`;
+        a full response has to be read up to it.
+        """
+        began = time.perf_counter()
+        response = view(request)
+        target = offset if "HTTP_RANGE" in request.META and response.status_code == 200 else 0
+        seen = 0
+        try:
+            for chunk in response.streaming_content:
+                seen += len(chunk)
+                if seen > target:
+                    break
+        finally:
+            response.close()
+        return time.perf_counter() - began
@@ -0,0 +1,133 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store.models import Category, Product
+from store.pagination import ProductCursorPagination
+from store.renderers import ORJSONRenderer
+from store.serializers import ProductSerializer
+from store.views import ProductListAPIView
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Walk view-products/ page by page with cursor pagination over a synthetic "
+        "catalog and report per-page latency from the first page to the last, next "
+        "to OFFSET paging at the same depths. The catalog is created inside a "
+        "transaction that is rolled back, so the database is left as it was."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100000)
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--ordering", default="price", choices=["id", "-id", "price", "-price"])
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        # the request factory sends Host: testserver, which the paginator and
+        # the ETag read through build_absolute_uri()
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]), transaction.atomic():
+                self.seed(options["products"], options["seed"])
+                self.run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def seed(self, total, seed):
+        rng = random.Random(seed)
+        category = Category.objects.create(name="benchmark")
+        # few distinct prices, so (price, id) ties are the common case
+        Product.objects.bulk_create(
+            (
+                Product(
+                    category=category,
+                    name=f"Benchmark {n}",
+                    description="",
+                    price=Decimal(rng.randrange(100, 5000, 50)),
+                    stock=rng.randrange(0, 50),
+                )
+                for n in range(total)
+            ),
+            batch_size=2000,
+        )
+
+    def run(self, options):
+        view = ProductListAPIView.as_view()
+        factory = APIRequestFactory()
+        page_size = options["page_size"]
+        url = f"/api/view-products/?page_size={page_size}&ordering={options['ordering']}"
+
+        cursor_times, urls, seen = [], [], 0
+        while url:
+            urls.append(url)
+            request = factory.get(url)
+            began = time.perf_counter()
+            response = view(request)
+            response.render()
+            cursor_times.append(time.perf_counter() - began)
+            seen += len(response.data["results"])
+            url = response.data["next"]
+
+        pages = len(cursor_times)
+        self.stdout.write(f"{seen} products in {pages} pages of {page_size}, ordering={options['ordering']}")
+        self.report("cursor", dict(enumerate(cursor_times)))
+
+        # the page query alone, without the ETag check, serializing and rendering
+        keyset_times = {}
+        for page in self.sample_pages(pages):
+            request = Request(factory.get(urls[page]))
+            keyset_times[page] = min(
+                self.timed(lambda: ProductCursorPagination().paginate_queryset(Product.objects.for_catalog(), request))
+                for _ in range(5)
+            )
+        self.report("keyset", keyset_times)
+
+        # the same depths with OFFSET, which scans past every skipped row
+        ordering = options["ordering"].lstrip("-")
+        prefix = "-" if options["ordering"].startswith("-") else ""
+        order_by = (prefix + "id",) if ordering == "id" else (prefix + "price", prefix + "id")
+        products = Product.objects.for_catalog().order_by(*order_by)
+        renderer, offset_times = ORJSONRenderer(), {}
+        for page in self.sample_pages(pages):
+            began = time.perf_counter()
+            renderer.render(ProductSerializer(products[page * page_size:(page + 1) * page_size], many=True).data)
+            offset_times[page] = time.perf_counter() - began
+        self.report("offset", offset_times)
+
+        first, last = keyset_times[0], keyset_times[pages - 1]
+        self.stdout.write(self.style.SUCCESS(f"keyset last/first page ratio {last / first:.2f}"))
+
+    @staticmethod
+    def timed(func):
+        began = time.perf_counter()
+        func()
+        return time.perf_counter() - began
+
+    def report(self, name, timings):
+        """timings: {0-based page: seconds}; shows the sampled pages."""
+        times = list(timings.values())
+        samples = ", ".join(
+            f"p{page + 1} {timings[page] * 1000:.1f}" for page in self.sample_pages(max(timings) + 1) if page in timings
+        )
+        self.stdout.write(
+            f"  {name:<7} median {statistics.median(times) * 1000:6.1f} ms, "
+            f"max {max(times) * 1000:6.1f} ms  ({samples} ms)"
+        )
+
+    @staticmethod
+    def sample_pages(pages):
+        """First, a few in between and the last page (0-based)."""
+        return sorted({0, pages // 4, pages // 2, 3 * pages // 4, pages - 1} - {-1})
@@ -0,0 +1,70 @@
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from store.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = "Compare JSONRenderer and ORJSONRenderer on order-details sized payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=200, help="Orders per payload")
+        parser.add_argument("--items", type=int, default=4, help="Items per order")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        data = self.build_payload(options["orders"], options["items"])
+        renderers = {"json": JSONRenderer(), "orjson": ORJSONRenderer()}
+
+        outputs = {name: renderer.render(data) for name, renderer in renderers.items()}
+        if json.loads(outputs["json"]) != json.loads(outputs["orjson"]):
+            self.stderr.write("Renderers disagree on the payload!")
+
+        self.stdout.write(
+            f"{options['orders']} orders x {options['items']} items, "
+            f"{len(outputs['json']) / 1024:.1f} KiB"
+        )
+        timings = {}
+        for name, renderer in renderers.items():
+            timings[name] = min(timeit.repeat(lambda: renderer.render(data), number=1, repeat=options["repeat"]))
+            self.stdout.write(f"  {name:<7} {timings[name] * 1000:8.2f} ms")
+        self.stdout.write(self.style.SUCCESS(f"orjson is {timings['json'] / timings['orjson']:.1f}x faster"))
+
+    @staticmethod
+    def build_payload(orders, items):
+        """Same shape and value types as OrderDetailsViewSet.list (amounts as strings)."""
+        now = timezone.now()
+        return [
+            {
+                "order_id": f"ORD{n:08d}",
+                "razorpay_order_id": f"order_{n:014d}",
+                "user": {"id": n, "email": f"customer{n}@example.com", "first_name": "Asha", "last_name": "Menon"},
+                "phone_number": "9876543210",
+                "shipping_address": "12 MG Road, Near City Mall",
+                "city": "Kochi",
+                "state": "Kerala",
+                "pincode": "682016",
+                "amount": "2499.00",
+                "status": "Processing",
+                "total_amount": "2499.00",
+                "created_at": now,
+                "updated_at": now,
+                "items": [
+                    {
+                        "id": n * items + i,
+                        "product_id": i,
+                        "product_name": "Oud Royale 100ml",
+                        "product_price": "1249.50",
+                        "quantity": 2,
+                        "price": "1249.50",
+                        "total": "2499.00",
+                    }
+                    for i in range(items)
+                ],
+            }
+            for n in range(orders)
+        ]
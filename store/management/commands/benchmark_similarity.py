@@ -0,0 +1,61 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from store import similarity
+
+
+NOTES = """
+    oud rose jasmine amber musk vanilla sandalwood cedar vetiver patchouli bergamot lemon
+    neroli orange mandarin saffron leather tobacco incense myrrh frankincense iris violet
+    tuberose ylang gardenia peony lily lavender sage rosemary mint basil pepper cardamom
+    cinnamon clove nutmeg ginger tonka benzoin labdanum oakmoss ambergris coconut honey
+""".split()
+WORDS = """
+    fresh warm woody floral spicy sweet smoky powdery citrus green aquatic fruity oriental
+    intense soft long lasting elegant bold evening daytime signature blend heart base top
+    notes trail luxurious rich deep light airy creamy dry resinous earthy sensual classic
+""".split()
+
+
+class Command(BaseCommand):
+    help = "Time the similar-products build on a synthetic catalog and report peak memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=50000)
+        parser.add_argument("--memory-mb", type=int, default=similarity.MEMORY_MB)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        total = options["products"]
+        brands = [f"house{n}" for n in range(400)]
+        categories = ["attar", "eau de parfum", "eau de toilette", "body mist", "gift set", "oud oil"]
+        documents = [
+            similarity.product_terms(
+                " ".join(rng.choices(NOTES, k=8) + rng.choices(WORDS, k=40)),
+                rng.choice(brands),
+                rng.choice(categories),
+            )
+            for _ in range(total)
+        ]
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        index = similarity.TfidfIndex(range(total), documents)
+        built = time.perf_counter()
+        lists = 0
+        for rows in index.blocks(options["memory_mb"]):
+            lists += sum(1 for _ in index.neighbours(rows))
+        finished = time.perf_counter()
+        peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+        self.stdout.write(f"{total} products, {len(index.data)} non-zero weights")
+        self.stdout.write(f"  vectorise  {built - started:7.2f} s")
+        self.stdout.write(f"  neighbours {finished - built:7.2f} s ({lists} lists)")
+        self.stdout.write(f"  peak       {peak:7.1f} MiB (budget {options['memory_mb']} MiB)")
+        if peak > options["memory_mb"]:
+            self.stderr.write("Peak memory exceeded the budget.")
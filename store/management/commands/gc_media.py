@@ -0,0 +1,151 @@
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from store import images
+from store.cache import bump_catalog_version
+from store.models import Category, HeroSection, MediaBlob, Product, ProductMedia
+from store.storage import BLOB_DIR, is_blob, media_storage
+
+
+MEDIA_MODELS = (Product, ProductMedia, Category, HeroSection)
+
+
+class Command(BaseCommand):
+    help = "Recount media blob references and delete blobs nothing points at"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be removed without deleting")
+        parser.add_argument(
+            "--grace-minutes", type=int, default=60,
+            help="Keep unreferenced blobs younger than this (uploads whose record is not saved yet)",
+        )
+        parser.add_argument(
+            "--adopt-legacy", action="store_true",
+            help="Move files saved before the blob storage into it, deduplicating them",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        if options["adopt_legacy"]:
+            self.adopt_legacy(dry_run)
+
+        references = self.count_references()
+        self.sync_refcounts(references, dry_run)
+
+        cutoff = timezone.now() - timedelta(minutes=options["grace_minutes"])
+        removed, freed = self.remove_orphans(cutoff, dry_run)
+        removed_files, freed_files = self.remove_untracked_files(cutoff, dry_run)
+
+        verb = "Would remove" if dry_run else "Removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {removed + removed_files} blobs ({(freed + freed_files) / 1024:.1f} KiB)."
+        ))
+
+    def count_references(self):
+        references = Counter()
+        for model in MEDIA_MODELS:
+            field = images.image_field_name(model())
+            rows = model.objects.values_list(field, "image_variants").iterator(chunk_size=1000)
+            for name, variants in rows:
+                if is_blob(name):
+                    references[name] += 1
+                for variant, files in (variants or {}).items():
+                    if variant != "source":
+                        references.update(n for n in files.values() if is_blob(n))
+        return references
+
+    def sync_refcounts(self, references, dry_run):
+        changed = []
+        known = set()
+        for blob in MediaBlob.objects.only("id", "name", "refcount").iterator(chunk_size=1000):
+            known.add(blob.name)
+            count = references.get(blob.name, 0)
+            if blob.refcount != count:
+                blob.refcount = count
+                changed.append(blob)
+
+        missing = [
+            MediaBlob(name=name, refcount=count, size=self.file_size(name))
+            for name, count in references.items()
+            if name not in known and media_storage.exists(name)
+        ]
+        self.stdout.write(f"{len(changed)} refcounts corrected, {len(missing)} blobs registered")
+        if not dry_run:
+            MediaBlob.objects.bulk_update(changed, ["refcount"], batch_size=500)
+            MediaBlob.objects.bulk_create(missing, batch_size=500, ignore_conflicts=True)
+
+    def remove_orphans(self, cutoff, dry_run):
+        orphans = list(MediaBlob.objects.filter(refcount=0, created_at__lt=cutoff).values_list("pk", "name", "size"))
+        removed = freed = 0
+        for pk, name, size in orphans:
+            if not dry_run:
+                with transaction.atomic():
+                    # claim the row; an upload of the same bytes since the
+                    # listing has raised its refcount and keeps the blob
+                    if not MediaBlob.objects.filter(pk=pk, refcount=0).delete()[0]:
+                        continue
+                    media_storage.delete_blob(name)
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def remove_untracked_files(self, cutoff, dry_run):
+        """Blob files without a MediaBlob row, e.g. left by an interrupted upload."""
+        root = media_storage.path(BLOB_DIR)
+        if not os.path.isdir(root):
+            return 0, 0
+        tracked = set(MediaBlob.objects.values_list("name", flat=True))
+        removed = freed = 0
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, media_storage.location).replace(os.sep, "/")
+                if name in tracked:
+                    continue
+                stat = os.stat(path)
+                if datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc) >= cutoff:
+                    continue
+                if not dry_run:
+                    with transaction.atomic():
+                        if MediaBlob.objects.filter(name=name).exists():
+                            continue  # stored again since the listing
+                        media_storage.delete_blob(name)
+                removed += 1
+                freed += stat.st_size
+        return removed, freed
+
+    def adopt_legacy(self, dry_run):
+        adopted = 0
+        for model in MEDIA_MODELS:
+            field = images.image_field_name(model())
+            queryset = model.objects.exclude(**{f"{field}__startswith": f"{BLOB_DIR}/"}).exclude(**{field: ""})
+            for instance in queryset.exclude(**{f"{field}__isnull": True}).iterator(chunk_size=200):
+                old_name = getattr(instance, field).name
+                if not media_storage.exists(old_name):
+                    continue
+                adopted += 1
+                if dry_run:
+                    continue
+                with media_storage.open(old_name, "rb") as source:
+                    new_name = media_storage.save(old_name, File(source, name=old_name))
+                model.objects.filter(pk=instance.pk).update(**{field: new_name})
+                setattr(instance, field, new_name)
+                images.ensure_variants(instance)
+                if not any(m.objects.filter(**{images.image_field_name(m()): old_name}).exists() for m in MEDIA_MODELS):
+                    media_storage.delete(old_name)
+        if adopted and not dry_run:
+            bump_catalog_version()
+        self.stdout.write(f"{adopted} legacy files {'to adopt' if dry_run else 'adopted'}")
+
+    @staticmethod
+    def file_size(name):
+        try:
+            return media_storage.size(name)
+        except OSError:
+            return 0
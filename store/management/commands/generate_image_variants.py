@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from store.cache import bump_catalog_version
+from store.images import ensure_variants, image_field_name
+from store.models import Category, HeroSection, Product, ProductMedia
+
+
+class Command(BaseCommand):
+    help = "Generate thumb/card/full image variants for existing uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Regenerate variants that already exist")
+
+    def handle(self, *args, **options):
+        total = 0
+        for model in (Product, ProductMedia, Category, HeroSection):
+            field = image_field_name(model())
+            queryset = model.objects.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+            updated = 0
+            for instance in queryset.only("pk", field, "image_variants").iterator(chunk_size=200):
+                if ensure_variants(instance, force=options["force"]):
+                    updated += 1
+            self.stdout.write(f"{model._meta.verbose_name_plural}: {updated} updated")
+            total += updated
+
+        if total:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Done, {total} records updated."))
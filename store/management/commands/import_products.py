@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import catalog_io
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert products from a CSV or JSONL file in validated, batched chunks. "
+        "Similar-product lists are refreshed afterwards up to SIMILAR_PRODUCTS_SYNC_LIMIT "
+        "products; above it, run rebuild_similar_products."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file")
+        parser.add_argument("--format", choices=catalog_io.FORMATS, help="Defaults to the file extension")
+        parser.add_argument("--chunk-size", type=int, default=catalog_io.CHUNK_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Validate only, write nothing")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or catalog_io.detect_format(path)
+        try:
+            fileobj = open(path, "rb")
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+
+        with fileobj:
+            result = catalog_io.import_products(
+                catalog_io.read_rows(fileobj, file_format),
+                chunk_size=options["chunk_size"],
+                dry_run=options["dry_run"],
+            )
+
+        for error in result.errors:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f"... {result.error_count - len(result.errors)} more errors not shown")
+
+        verb = "Would create" if options["dry_run"] else "Created"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result.created}, updated {result.updated}, {result.error_count} rows rejected."
+        ))
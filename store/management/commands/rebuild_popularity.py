@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from store import popularity
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute popularity scores from order and wishlist history. Scores are kept "
+        "up to date on every order and wishlist change; run this after changing the "
+        "weights or half-life, or after importing historical orders."
+    )
+
+    def handle(self, *args, **options):
+        count = popularity.rebuild_popularity()
+        self.stdout.write(self.style.SUCCESS(f"Scored {count} products."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from store import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Count newly placed orders into the \"customers also bought\" lists. "
+        "Incremental; schedule it (e.g. cron every 15 minutes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Drop all counts and rebuild from every order")
+        parser.add_argument("--top", type=int, default=recommendations.TOP_N, help="Products kept per list")
+        parser.add_argument("--batch-size", type=int, default=recommendations.ORDER_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["full"]:
+            recommendations.reset_co_purchases()
+        orders, products = recommendations.update_co_purchases(n=options["top"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Counted {orders} orders, refreshed {products} product lists."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from store import similarity
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild every product's \"similar scents\" list. Saves refresh single products "
+        "on small catalogs; schedule this for large ones and after bulk imports."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=similarity.TOP_N, help="Products kept per list")
+        parser.add_argument("--memory-mb", type=int, default=similarity.MEMORY_MB, help="Working-set budget")
+
+    def handle(self, *args, **options):
+        count = similarity.rebuild_similar_products(n=options["top"], memory_mb=options["memory_mb"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products."))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store import reservations
+
+
+class Command(BaseCommand):
+    help = (
+        "Put the stock of expired basket items back on sale. Run it from cron, or "
+        "with --every to keep sweeping in the foreground."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=reservations.BATCH_SIZE)
+        parser.add_argument("--every", type=int, default=0, help="Repeat every N seconds until interrupted")
+
+    def handle(self, *args, **options):
+        while True:
+            result = reservations.release_expired(batch_size=options["batch_size"]).as_dict()
+            self.stdout.write(self.style.SUCCESS(
+                f"Released {result['items']} items, {result['units']} units across {result['products']} products."
+            ))
+            if options["every"] <= 0:
+                break
+            time.sleep(options["every"])
@@ -0,0 +1,100 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from store.models import BasketItem, Category, CustomUser, Product
+from store.views import BasketItemViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer add-to-cart from many threads on a throwaway product, check that "
+        "stock is never oversold and report the throughput. Writes to the configured "
+        "database: the product is removed afterwards, the (inactive) shopper accounts "
+        "are kept for the next run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--stock", type=int, default=200, help="Units available to the shoppers")
+        parser.add_argument("--requests", type=int, default=50, help="Add-to-cart calls per thread")
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name=f"stress-{tag}")
+        product = Product.objects.create(
+            category=category, name=f"stress-{tag}", description="", price="1.00", stock=options["stock"]
+        )
+        users = [self.shopper(n) for n in range(options["threads"])]
+        add_to_cart = BasketItemViewSet.as_view({"post": "add_to_cart"})
+        factory = APIRequestFactory()
+        results = {"added": 0, "refused": 0, "failed": 0}
+        lock = threading.Lock()
+        start = threading.Barrier(len(users))
+
+        def shop(user):
+            counts = {"added": 0, "refused": 0, "failed": 0}
+            start.wait()
+            try:
+                for _ in range(options["requests"]):
+                    request = factory.post(f"/api/basket-items/{product.pk}/add-to-cart/")
+                    force_authenticate(request, user)
+                    response = add_to_cart(request, pk=product.pk)
+                    if response.status_code == 201:
+                        counts["added"] += 1
+                    elif response.status_code == 400:
+                        counts["refused"] += 1
+                    else:
+                        counts["failed"] += 1
+            finally:
+                connections.close_all()
+            with lock:
+                for key, value in counts.items():
+                    results[key] += value
+
+        threads = [threading.Thread(target=shop, args=(user,)) for user in users]
+        try:
+            began = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - began
+            close_old_connections()
+
+            product.refresh_from_db(fields=["stock"])
+            in_carts = sum(
+                BasketItem.objects.filter(product_object=product, is_active=True).values_list("quantity", flat=True)
+            )
+        finally:
+            BasketItem.objects.filter(product_object=product).delete()
+            product.delete()
+            category.delete()
+
+        total = options["threads"] * options["requests"]
+        self.stdout.write(
+            f"{total} requests from {options['threads']} threads in {elapsed:.2f} s "
+            f"({total / elapsed:.0f} req/s)"
+        )
+        self.stdout.write(
+            f"  added {results['added']}, refused {results['refused']}, failed {results['failed']}; "
+            f"stock left {product.stock}, in carts {in_carts}"
+        )
+        if results["failed"] or in_carts != results["added"] or product.stock + in_carts != options["stock"]:
+            raise CommandError("Stock accounting is off: units were oversold or lost.")
+        self.stdout.write(self.style.SUCCESS("No oversell."))
+
+    @staticmethod
+    def shopper(n):
+        user, created = CustomUser.objects.get_or_create(
+            username=f"stress-shopper-{n}",
+            defaults={"email": f"stress-shopper-{n}@example.com", "is_active": False},
+        )
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=["password"])
+        return user
@@ -0,0 +1,153 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, quote_etag
+from django.views.decorators.http import require_safe
+
+from store.storage import BLOB_DIR, is_blob
+
+
+# ---------------------------
+# Media serving (byte ranges, conditional GET)
+# ---------------------------
+CHUNK_SIZE = 64 * 1024
+BLOB_MAX_AGE = 365 * 24 * 60 * 60  # blob names change whenever the content does
+MEDIA_MAX_AGE = 24 * 60 * 60
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOB_HASH_RE = re.compile(r'([0-9a-f]{64})(\.[^/]*)?$')
+
+
+class RangeFileWrapper:
+    """Iterates over `length` bytes of a file starting at `offset`."""
+
+    def __init__(self, filelike, offset, length, chunk_size=CHUNK_SIZE):
+        self.filelike = filelike
+        self.remaining = length
+        self.chunk_size = chunk_size
+        filelike.seek(offset)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.remaining <= 0:
+            raise StopIteration
+        data = self.filelike.read(min(self.chunk_size, self.remaining))
+        if not data:
+            raise StopIteration
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.filelike.close()
+
+
+def media_etag(path, stat):
+    match = BLOB_HASH_RE.search(path)
+    if is_blob(path) and match:
+        return quote_etag(match.group(1))
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def parse_range(header, size):
+    """
+    Returns (start, end) for a single satisfiable byte range, None when the
+    header should be ignored (full response), or False when unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve a file from MEDIA_ROOT with Range, If-None-Match and cache headers.
+
+    Full responses go through FileResponse so servers with wsgi.file_wrapper
+    can sendfile() them; set MEDIA_ACCEL_REDIRECT_PREFIX to hand the file to
+    nginx (X-Accel-Redirect) instead.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    stat = os.stat(full_path)
+    etag = media_etag(path, stat)
+    max_age = BLOB_MAX_AGE if path.startswith(BLOB_DIR + '/') else MEDIA_MAX_AGE
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': f'public, max-age={max_age}' + (', immutable' if max_age == BLOB_MAX_AGE else ''),
+        'Accept-Ranges': 'bytes',
+    }
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponseNotModified()
+        for header in ('ETag', 'Last-Modified', 'Cache-Control'):
+            response[header] = headers[header]
+        return response
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', None)
+    if accel_prefix:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + path
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range or if_range.strip() == etag:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            RangeFileWrapper(open(full_path, 'rb'), start, length),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
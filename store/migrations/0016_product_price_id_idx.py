@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-17 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_herosection_smalltext'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='store_product_price_id_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0 on 2026-10-17 12:30
+
+import store.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=store.storage.ContentAddressedStorage(), upload_to='categories/'),
+        ),
+        migrations.AlterField(
+            model_name='herosection',
+            name='image',
+            field=models.ImageField(storage=store.storage.ContentAddressedStorage(), upload_to='hero_images/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=store.storage.ContentAddressedStorage(), upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='productmedia',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=store.storage.ContentAddressedStorage(), upload_to='product_images/'),
+        ),
+    ]
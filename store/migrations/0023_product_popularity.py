@@ -0,0 +1,38 @@
+# Generated by Django 5.0 on 2026-10-17 12:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_popularity_rows(apps, schema_editor):
+    # every product gets a row so ?sort=popular can order on the score alone;
+    # real scores come from `manage.py rebuild_popularity`
+    Product = apps.get_model('store', 'Product')
+    ProductPopularity = apps.get_model('store', 'ProductPopularity')
+    ProductPopularity.objects.bulk_create(
+        (ProductPopularity(product_id=pk) for pk in Product.objects.values_list('id', flat=True).iterator()),
+        batch_size=1000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_similar_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='store.product')),
+                ('units_sold', models.IntegerField(default=0)),
+                ('wishlist_count', models.IntegerField(default=0)),
+                ('score', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Product popularity',
+                'indexes': [models.Index(fields=['score', 'product'], name='store_popularity_score_idx')],
+            },
+        ),
+        migrations.RunPython(create_popularity_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0 on 2026-10-17 12:59
+
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def start_reservations(apps, schema_editor):
+    # items already in carts expire one reservation period after their last change
+    BasketItem = apps.get_model('store', 'BasketItem')
+    BasketItem.objects.filter(is_active=True, is_order_placed=False).update(
+        reserved_until=models.F('updated_date') + datetime.timedelta(minutes=settings.BASKET_RESERVATION_MINUTES)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_product_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basketitem',
+            name='reserved_until',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(start_reservations, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,10 @@
 from django.db import models
 from django.utils.text import slugify
 from django.utils import timezone
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.contrib.auth.models import AbstractUser,User
+from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+from store.storage import media_storage
 import datetime
 import random
 
@@ -30,7 +29,9 @@ class CustomUser(AbstractUser):
 class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True, blank=True)
-    image = models.ImageField(upload_to="categories/", null=True, blank=True)
+    image = models.ImageField(upload_to="categories/", storage=media_storage, null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -46,19 +47,55 @@ class Category(models.Model):
 # ---------------------------
 # Product Model
 # ---------------------------
+class ProductQuerySet(models.QuerySet):
+    def for_catalog(self):
+        """Catalog read path: join the category in the same query."""
+        return self.select_related('category')
+
+    def with_media(self):
+        return self.prefetch_related(
+            models.Prefetch('media', queryset=ProductMedia.objects.order_by('id'))
+        )
+
+    def with_wishlist_state(self, user):
+        """Annotate `in_wishlist` for `user` as a subquery (always False for anonymous users)."""
+        if not user or not user.is_authenticated:
+            return self.annotate(in_wishlist=models.Value(False, output_field=models.BooleanField()))
+        return self.annotate(
+            in_wishlist=models.Exists(Wishlist.objects.filter(user=user, product=models.OuterRef('pk')))
+        )
+
+
 class Product(models.Model):
     brand = models.CharField(max_length=100, blank=True, null=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     name = models.CharField(max_length=100)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    image = models.ImageField(upload_to='products/',null=True,blank=True)
+    image = models.ImageField(upload_to='products/',storage=media_storage,null=True,blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     stock = models.PositiveIntegerField()
     available = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # lets post_save receivers tell which fields actually changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     def __str__(self):
         return f"{self.name} ({self.category.name})"
 
+    class Meta:
+        indexes = [
+            # keyset pagination on (price, id), see store.pagination
+            models.Index(fields=['price', 'id'], name='store_product_price_id_idx'),
+        ]
+
 
 # ---------------------------
 # Product Media (Multiple Images/Videos)
@@ -70,11 +107,25 @@ class ProductMedia(models.Model):
     ]
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='media')
     media_type=models.CharField(max_length=10,choices=MEDIA_TYPE_CHOICES,null=True,blank=True)
-    file=models.FileField(upload_to='product_images/',null=True,blank=True)
+    file=models.FileField(upload_to='product_images/',storage=media_storage,null=True,blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     def __str__(self):
         return f"Media for {self.product.name}"
 
 
+# ---------------------------
+# Media Blob (content-addressed uploads, see store.storage)
+# ---------------------------
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+
 # ---------------------------
 # Contact Model (Contact Us Form)
 # ---------------------------
@@ -103,23 +154,51 @@ class Basket(models.Model):
 
     @property
     def get_cart_items(self):
-        return self.cartitems.filter(is_order_placed=False)
+        return self.cartitems.in_cart()
+
+    def totals(self):
+        """{'total', 'items', 'units'} of the cart, from a single aggregate query."""
+        return self.cartitems.in_cart().totals()
 
     @property
     def get_cart_total(self):
-        return sum(item.item_total for item in self.get_cart_items)
+        return self.totals()['total']
 
     def basket_total(self):
-        return sum(item.item_total for item in self.cartitems.filter(is_order_placed=False))
+        return self.totals()['total']
 
     @property
     def get_basket_total(self):
-        return sum(item.item_total for item in self.get_cart_items)
+        return self.totals()['total']
 
 
 # ---------------------------
 # Basket Item
 # ---------------------------
+class BasketItemQuerySet(models.QuerySet):
+    def in_cart(self):
+        return self.filter(is_active=True, is_order_placed=False)
+
+    @staticmethod
+    def line_total():
+        return models.ExpressionWrapper(
+            models.F('quantity') * models.F('product_object__price'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+
+    def with_totals(self):
+        """Items with their product joined in and `line_total` computed by the database."""
+        return self.select_related('product_object').annotate(line_total=self.line_total())
+
+    def totals(self):
+        zero = models.Value(0, output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        return self.aggregate(
+            total=models.functions.Coalesce(models.Sum(self.line_total()), zero),
+            items=models.Count('id'),
+            units=models.functions.Coalesce(models.Sum('quantity'), 0),
+        )
+
+
 class BasketItem(models.Model):
     basket_object = models.ForeignKey(Basket, on_delete=models.CASCADE, related_name="cartitems")
     product_object = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True)
@@ -128,21 +207,21 @@ class BasketItem(models.Model):
     updated_date = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     is_order_placed = models.BooleanField(default=False)
+    # stock held for this item goes back on sale after this (see store.reservations)
+    reserved_until = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = BasketItemQuerySet.as_manager()
 
     @property
     def item_total(self):
+        if hasattr(self, 'line_total'):
+            return self.line_total or 0
         return self.product_object.price * self.quantity if self.product_object else 0
 
     def __str__(self):
         return f"{self.quantity} x {self.product_object.name if self.product_object else 'Unknown'} in Basket {self.basket_object.id}"
 
 
-@receiver(post_save, sender=settings.AUTH_USER_MODEL)
-def create_basket(sender, instance, created, **kwargs):
-    if created:
-        Basket.objects.create(owner=instance)
-
-
 # ---------------------------
 # Order Model
 # ---------------------------
@@ -152,6 +231,7 @@ ORDER_STATUS_CHOICES = [
     ('Shipped', 'Shipped'),
     ('Delivered', 'Delivered'),
     ('Cancelled', 'Cancelled'),
+    ('Refunded', 'Refunded'),
 ]
 
 class Order(models.Model):
@@ -175,6 +255,13 @@ class Order(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # lets post_save receivers see status transitions
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     @property
     def order_total(self):
         return sum(item.get_total_price() for item in self.items.all())
@@ -248,7 +335,8 @@ class HeroSection(models.Model):
     smallText = models.CharField(max_length=200,blank=True,null=True)
     title=models.CharField(max_length=200)
     subtitle=models.CharField(max_length=300,blank=True,null=True)
-    image=models.ImageField(upload_to='hero_images/')
+    image=models.ImageField(upload_to='hero_images/',storage=media_storage)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     description=models.TextField(blank=True,null=True)
     created_at=models.DateTimeField(auto_now_add=True)
     updated_at=models.DateTimeField(auto_now=True)
@@ -256,6 +344,82 @@ class HeroSection(models.Model):
         return self.title
 
 
+# ---------------------------
+# "Customers also bought" (see store.recommendations)
+# ---------------------------
+class ProductCoPurchase(models.Model):
+    """Number of placed orders containing both products, stored in both directions."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.PositiveIntegerField(default=0)
 
-    
-  
\ No newline at end of file
+    class Meta:
+        unique_together = ('product', 'other')
+
+
+class CoPurchaseOrder(models.Model):
+    """Orders already counted into ProductCoPurchase, so updates only read new ones."""
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='copurchase_mark')
+
+
+class RelatedProduct(models.Model):
+    """Precomputed top-N list served by /products/<id>/related/."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['rank']
+        unique_together = ('product', 'rank')
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+
+class SimilarProduct(models.Model):
+    """Precomputed "similar scents" list (TF-IDF cosine, see store.similarity)."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_products')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['rank']
+        unique_together = ('product', 'rank')
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.similar_id} (#{self.rank})"
+
+
+# ---------------------------
+# Product popularity (see store.popularity)
+# ---------------------------
+class ProductPopularity(models.Model):
+    """
+    Denormalised popularity of a product, maintained incrementally as
+    orders are placed and wishlists change. `score` is forward-decayed,
+    so ordering by it favours recent activity without rescoring every row
+    as time passes (only when PopularityEpoch moves, about once a year).
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+    units_sold = models.IntegerField(default=0)
+    wishlist_count = models.IntegerField(default=0)
+    score = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Product popularity"
+        indexes = [
+            models.Index(fields=['score', 'product'], name='store_popularity_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.score:.3f}"
+
+
+class PopularityEpoch(models.Model):
+    """The single reference time ProductPopularity.score is measured from."""
+    epoch = models.DateTimeField()
+
+    def __str__(self):
+        return f"Popularity epoch {self.epoch:%Y-%m-%d}"
@@ -0,0 +1,198 @@
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class ProductCursorPagination(BasePagination):
+    """
+    Opt-in keyset pagination for product listings.
+
+    Only kicks in when the client sends `cursor` or `page_size`, so existing
+    clients keep getting the plain list. Pages are fetched with
+    `WHERE (price, id) > (last_price, last_id)` style filters instead of
+    OFFSET, which keeps every page equally cheap however deep it is.
+
+    `?sort=` is accepted as an alias of `?ordering=`. `popular` orders by
+    the materialised store.popularity score, most popular first.
+    """
+    page_size = 24
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    ordering_query_aliases = ('sort',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    # ordering name -> (leading field or None, descending)
+    orderings = {
+        'id': (None, False),
+        '-id': (None, True),
+        'price': ('price', False),
+        '-price': ('price', True),
+        'popular': ('popularity_score', True),
+    }
+    default_ordering = 'id'
+
+    # leading fields that live on a one-to-one table: (column, key standing
+    # in for `id`). Both come from the joined table so the walk follows its
+    # (score, product) index instead of sorting every product.
+    related_fields = {
+        'popularity_score': ('popularity__score', 'popularity__product'),
+    }
+    # how cursor positions of each leading field are decoded
+    cursor_types = {
+        'price': Decimal,
+        'popularity_score': float,
+    }
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request) or self.default_ordering
+        field, descending = self.orderings[self.ordering]
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+
+        # Walking backwards is the same query with the ordering flipped.
+        walk_descending = descending != reverse
+        queryset = self.join(queryset, field).order_by(*self.order_fields(field, walk_descending))
+        if cursor:
+            queryset = queryset.filter(self.position_filter(field, walk_descending, cursor))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next = cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.page = results
+        return results
+
+    def get_ordering(self, request):
+        """The requested ordering name, or None when absent or unknown."""
+        for param in (self.ordering_query_param,) + self.ordering_query_aliases:
+            ordering = request.query_params.get(param)
+            if ordering is not None:
+                return ordering if ordering in self.orderings else None
+        return None
+
+    def order_queryset(self, queryset, request):
+        """Apply a requested ordering to an unpaginated list (left as is otherwise)."""
+        ordering = self.get_ordering(request)
+        if ordering is None:
+            return queryset
+        field, descending = self.orderings[ordering]
+        return self.join(queryset, field).order_by(*self.order_fields(field, descending))
+
+    def join(self, queryset, field):
+        if field not in self.related_fields:
+            return queryset
+        column, key = self.related_fields[field]
+        # every product has its row (see store.popularity), so an inner join loses nothing
+        return queryset.filter(**{f'{key}__isnull': False}).annotate(**{field: F(column)})
+
+    def key_field(self, field):
+        if field in self.related_fields:
+            return self.related_fields[field][1]
+        return 'id'
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if size < 1:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.build_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.build_link(self.page[0], reverse=True)
+
+    def build_link(self, instance, reverse):
+        field, _ = self.orderings[self.ordering]
+        position = {'i': instance.pk, 'r': int(reverse)}
+        if field:
+            position['p'] = str(getattr(instance, field))
+        url = replace_query_param(self.base_url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+
+    def order_fields(self, field, descending):
+        prefix = '-' if descending else ''
+        if field:
+            return (prefix + field, prefix + self.key_field(field))
+        return (prefix + 'id',)
+
+    def position_filter(self, field, descending, cursor):
+        op = 'lt' if descending else 'gt'
+        after_id = Q(**{f'{self.key_field(field)}__{op}': cursor['i']})
+        if not field:
+            return after_id
+        value = cursor['p']
+        # the redundant `field >= value` bound lets the database seek into the
+        # (field, id) index instead of scanning it from the start
+        return Q(**{f'{field}__{op}e': value}) & (Q(**{f'{field}__{op}': value}) | after_id)
+
+    @staticmethod
+    def encode_cursor(position):
+        raw = json.dumps(position, separators=(',', ':')).encode('ascii')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            cursor = {'i': int(position['i']), 'r': bool(position.get('r', 0))}
+            field, _ = self.orderings[self.ordering]
+            if field:
+                cursor['p'] = self.cursor_types[field](position['p'])
+        except (TypeError, ValueError, KeyError, InvalidOperation, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+
+class ProductSearchPagination(PageNumberPagination):
+    """Page-number pagination for ranked search results (?page=, ?page_size=)."""
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
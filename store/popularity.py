@@ -0,0 +1,128 @@
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from store.cache import bump_popularity_version
+from store.models import OrderItem, PopularityEpoch, Product, ProductPopularity, Wishlist
+from store.recommendations import PLACED_STATUSES
+
+
+# ---------------------------
+# Popularity ranking (?sort=popular)
+# ---------------------------
+# Every unit sold and every wishlist add contributes weight * 2**(age / half-life)
+# measured from an epoch ("forward decay"). Ratios between scores are then
+# the same as with an exponentially decaying score, so ordering by the stored
+# sum favours recent activity without ever rescoring old rows. Scores grow by
+# 2x per half-life, which overflows a float about 39 years past the epoch, so
+# the epoch (stored in PopularityEpoch) is moved up to the present once it is
+# REBASE_AFTER_DAYS old and every score is scaled down by the same factor.
+SALE_WEIGHT = 3.0
+WISHLIST_WEIGHT = 1.0
+HALF_LIFE_DAYS = 14
+REBASE_AFTER_DAYS = 365
+# scores written before the epoch was stored are measured from this
+INITIAL_EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def decay_weight(when, epoch):
+    age = (when - epoch).total_seconds()
+    return 2.0 ** (age / (HALF_LIFE_DAYS * 86400))
+
+
+def current_epoch(now=None):
+    """
+    Lock and return the epoch, first moving it to `now` when it is due.
+    Call inside a transaction, so scores are added against the same epoch
+    they are stored under.
+    """
+    now = now or timezone.now()
+    row, _ = PopularityEpoch.objects.select_for_update().get_or_create(pk=1, defaults={'epoch': INITIAL_EPOCH})
+    if now - row.epoch >= datetime.timedelta(days=REBASE_AFTER_DAYS):
+        ProductPopularity.objects.update(score=F('score') * decay_weight(row.epoch, now))
+        row.epoch = now
+        row.save(update_fields=['epoch'])
+    return row.epoch
+
+
+def _apply(activity):
+    """Add (product_id, units, wishlists, weight, when) tuples to the popularity rows."""
+    with transaction.atomic():
+        epoch = current_epoch()
+        deltas = defaultdict(lambda: [0, 0, 0.0])
+        for product_id, units, wishlists, weight, when in activity:
+            deltas[product_id][0] += units
+            deltas[product_id][1] += wishlists
+            deltas[product_id][2] += weight * decay_weight(when, epoch)
+        if not deltas:
+            return
+        ProductPopularity.objects.bulk_create(
+            [ProductPopularity(product_id=pk) for pk in deltas],
+            ignore_conflicts=True,
+        )
+        for pk, (units, wishlists, score) in deltas.items():
+            ProductPopularity.objects.filter(product_id=pk).update(
+                units_sold=F('units_sold') + units,
+                wishlist_count=F('wishlist_count') + wishlists,
+                score=F('score') + score,
+            )
+    bump_popularity_version()
+
+
+def record_order(order, sign=1):
+    """Count (sign=1) or uncount (sign=-1) the items of a placed order."""
+    _apply(
+        (product_id, sign * quantity, 0, sign * quantity * SALE_WEIGHT, order.created_at)
+        for product_id, quantity in OrderItem.objects.filter(order=order).values_list('product_id', 'quantity')
+    )
+
+
+def record_orders(order_ids, sign=1):
+    """record_order for many orders at once, for status changes made with queryset updates."""
+    items = OrderItem.objects.filter(order_id__in=list(order_ids)).values_list('product_id', 'quantity', 'order__created_at')
+    _apply(
+        (product_id, sign * quantity, 0, sign * quantity * SALE_WEIGHT, created_at)
+        for product_id, quantity, created_at in items
+    )
+
+
+def record_wishlist(product_id, added_at, sign=1):
+    _apply([(product_id, 0, sign, sign * WISHLIST_WEIGHT, added_at)])
+
+
+def ensure_rows(product_ids):
+    """Give new products a zero row so they show up in popularity ordering."""
+    ProductPopularity.objects.bulk_create(
+        [ProductPopularity(product_id=pk) for pk in product_ids],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def rebuild_popularity():
+    """Recompute every score from order and wishlist history. Returns the number of products."""
+    with transaction.atomic():
+        epoch = current_epoch()
+        deltas = defaultdict(lambda: [0, 0, 0.0])
+        sales = OrderItem.objects.filter(order__status__in=PLACED_STATUSES).values_list(
+            'product_id', 'quantity', 'order__created_at'
+        )
+        for product_id, quantity, created_at in sales.iterator(chunk_size=2000):
+            deltas[product_id][0] += quantity
+            deltas[product_id][2] += quantity * SALE_WEIGHT * decay_weight(created_at, epoch)
+        for product_id, added_at in Wishlist.objects.values_list('product_id', 'added_at').iterator(chunk_size=2000):
+            deltas[product_id][1] += 1
+            deltas[product_id][2] += WISHLIST_WEIGHT * decay_weight(added_at, epoch)
+
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        rows = []
+        for pk in product_ids:
+            units, wishlists, score = deltas.get(pk, (0, 0, 0.0))
+            rows.append(ProductPopularity(product_id=pk, units_sold=units, wishlist_count=wishlists, score=score))
+        ProductPopularity.objects.all().delete()
+        ProductPopularity.objects.bulk_create(rows, batch_size=1000)
+    bump_popularity_version()
+    return len(product_ids)
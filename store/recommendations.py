@@ -0,0 +1,135 @@
+import numpy as np
+from django.db import transaction
+
+from store.models import CoPurchaseOrder, Order, OrderItem, ProductCoPurchase, RelatedProduct
+
+
+# ---------------------------
+# "Customers also bought"
+# ---------------------------
+PLACED_STATUSES = ('Paid', 'Processing', 'Shipped', 'Delivered')
+TOP_N = 12
+ORDER_BATCH_SIZE = 2000
+PRODUCT_CHUNK_SIZE = 500
+
+
+def co_occurrence(order_ids, product_ids):
+    """
+    Count, for every ordered pair of distinct products, the orders that
+    contain both. Takes parallel arrays of OrderItem (order, product) rows
+    and returns (product, other, count) arrays.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if len(order_ids) == 0:
+        return empty, empty, empty
+
+    # one row per product per order, sorted by order
+    rows = np.unique(np.column_stack([order_ids, product_ids]).astype(np.int64), axis=0)
+    orders, products = rows[:, 0], rows[:, 1]
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, len(orders)])
+
+    # pair every row with each row of its own order (a k*k block per order)
+    row_sizes = np.repeat(sizes, sizes)
+    row_starts = np.repeat(starts, sizes)
+    left = np.repeat(products, row_sizes)
+    offsets = np.arange(left.size) - np.repeat(np.cumsum(row_sizes) - row_sizes, row_sizes)
+    right = products[np.repeat(row_starts, row_sizes) + offsets]
+
+    distinct = left != right
+    if not distinct.any():
+        return empty, empty, empty
+    pairs, counts = np.unique(np.column_stack([left[distinct], right[distinct]]), axis=0, return_counts=True)
+    return pairs[:, 0], pairs[:, 1], counts
+
+
+def top_n(products, others, scores, n=TOP_N):
+    """Indexes of the n best-scoring rows per product (ties go to the lower id)."""
+    order = np.lexsort((others, -scores, products))
+    grouped = products[order]
+    starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+    ranks = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    keep = ranks < n
+    return order[keep], ranks[keep]
+
+
+def _merge_and_rank(product_ids, pair_products, pair_others, pair_counts, n):
+    """Add new pair counts for `product_ids` and rewrite their top-N lists."""
+    rows = {
+        (row.product_id, row.other_id): row
+        for row in ProductCoPurchase.objects.filter(product_id__in=product_ids)
+    }
+    changed, created = [], []
+    for product, other, count in zip(pair_products.tolist(), pair_others.tolist(), pair_counts.tolist()):
+        row = rows.get((product, other))
+        if row is None:
+            row = rows[(product, other)] = ProductCoPurchase(product_id=product, other_id=other, orders=count)
+            created.append(row)
+        else:
+            row.orders += count
+            changed.append(row)
+    ProductCoPurchase.objects.bulk_update(changed, ['orders'], batch_size=500)
+    ProductCoPurchase.objects.bulk_create(created, batch_size=500)
+
+    keys = np.array(list(rows), dtype=np.int64).reshape(-1, 2)
+    scores = np.array([row.orders for row in rows.values()], dtype=np.int64)
+    keep, ranks = top_n(keys[:, 0], keys[:, 1], scores, n)
+
+    RelatedProduct.objects.filter(product_id__in=product_ids).delete()
+    key_list, score_list = keys.tolist(), scores.tolist()
+    RelatedProduct.objects.bulk_create(
+        [
+            RelatedProduct(product_id=key_list[i][0], related_id=key_list[i][1], rank=rank, score=score_list[i])
+            for i, rank in zip(keep.tolist(), ranks.tolist())
+        ],
+        batch_size=500,
+    )
+
+
+def update_co_purchases(n=TOP_N, batch_size=ORDER_BATCH_SIZE):
+    """
+    Fold placed orders that were not counted yet into the co-purchase
+    matrix and refresh the top-N lists of the products they contain.
+    Returns (orders counted, products refreshed).
+
+    Runs are incremental and meant to be scheduled, one at a time
+    (see the rebuild_related_products command).
+    """
+    counted = 0
+    refreshed = set()
+    pending = Order.objects.filter(status__in=PLACED_STATUSES, copurchase_mark__isnull=True).order_by('id')
+
+    while True:
+        order_ids = list(pending.values_list('id', flat=True)[:batch_size])
+        if not order_ids:
+            break
+
+        items = np.array(
+            OrderItem.objects.filter(order_id__in=order_ids).values_list('order_id', 'product_id'),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        pair_products, pair_others, pair_counts = co_occurrence(items[:, 0], items[:, 1])
+        affected = np.unique(pair_products)
+
+        with transaction.atomic():
+            for start in range(0, len(affected), PRODUCT_CHUNK_SIZE):
+                chunk = affected[start:start + PRODUCT_CHUNK_SIZE]
+                mask = np.isin(pair_products, chunk)
+                _merge_and_rank(chunk.tolist(), pair_products[mask], pair_others[mask], pair_counts[mask], n)
+            CoPurchaseOrder.objects.bulk_create(
+                [CoPurchaseOrder(order_id=order_id) for order_id in order_ids],
+                batch_size=500,
+                ignore_conflicts=True,
+            )
+
+        counted += len(order_ids)
+        refreshed.update(affected.tolist())
+    return counted, len(refreshed)
+
+
+def reset_co_purchases():
+    """Forget everything counted so far; the next update starts from scratch."""
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+        ProductCoPurchase.objects.all().delete()
+        CoPurchaseOrder.objects.all().delete()
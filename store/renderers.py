@@ -0,0 +1,65 @@
+from decimal import Decimal
+
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils import encoders
+
+
+# ---------------------------
+# orjson renderer / parser
+# ---------------------------
+# orjson handles str/int/float/dict/list, datetimes and UUIDs natively;
+# everything else (Decimal, lazy strings, querysets, timedelta, ...) goes
+# through DRF's own encoder so the output matches JSONRenderer.
+_drf_encoder = encoders.JSONEncoder()
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        # same as DRF's encoder; serializer DecimalFields already render strings
+        return float(obj)
+    return _drf_encoder.default(obj)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """Drop-in replacement for rest_framework.renderers.JSONRenderer."""
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        options = ORJSON_OPTIONS
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(data, default=_default, option=options)
+        except orjson.JSONEncodeError as e:
+            raise TypeError(str(e)) from e
+
+    def get_indent(self, accepted_media_type, renderer_context):
+        # orjson only indents by two spaces; any requested indent turns it on
+        for param in accepted_media_type.split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'indent' and value.strip().isdigit():
+                return int(value) > 0
+        return bool(renderer_context.get('indent'))
+
+
+class ORJSONParser(BaseParser):
+    """Drop-in replacement for rest_framework.parsers.JSONParser."""
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
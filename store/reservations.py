@@ -0,0 +1,152 @@
+import datetime
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, OuterRef, Sum
+from django.utils import timezone
+
+from store import inventory
+from store.models import BasketItem, Order
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Basket reservations
+# ---------------------------
+BATCH_SIZE = 500
+
+
+def reservation_ttl():
+    return datetime.timedelta(minutes=settings.BASKET_RESERVATION_MINUTES)
+
+
+def reserved_until(now=None):
+    """Expiry for a reservation made or renewed now."""
+    return (now or timezone.now()) + reservation_ttl()
+
+
+def checkout_hold():
+    return datetime.timedelta(minutes=settings.BASKET_CHECKOUT_HOLD_MINUTES)
+
+
+def expired_items(now):
+    # A cart whose order is waiting for payment keeps its stock: payment-status
+    # and the webhook only mark active items as ordered, so releasing them
+    # would sell the units twice. Checkouts abandoned for longer than the
+    # hold are released like any other cart.
+    awaiting_payment = Order.objects.filter(
+        user=OuterRef('basket_object__owner'),
+        status='Pending',
+        created_at__gt=now - checkout_hold(),
+    )
+    return BasketItem.objects.filter(is_active=True, is_order_placed=False, reserved_until__lte=now).filter(
+        ~Exists(awaiting_payment)
+    )
+
+
+def renew(basket_id, now=None):
+    """Restart the reservation of everything in a cart; any change to the cart counts as activity."""
+    return BasketItem.objects.filter(basket_object_id=basket_id, is_active=True, is_order_placed=False).update(
+        reserved_until=reserved_until(now)
+    )
+
+
+class SweepResult:
+    def __init__(self):
+        self.items = 0
+        self.units = 0
+        self.products = set()
+
+    def as_dict(self):
+        return {'items': self.items, 'units': self.units, 'products': len(self.products)}
+
+
+def release_expired(now=None, batch_size=BATCH_SIZE):
+    """
+    Take expired items out of their carts and put their stock back.
+
+    Works through the expired items in batches, one transaction each: the
+    batch is claimed with an UPDATE (so items renewed or removed meanwhile
+    drop out, and the rows stay locked), their quantities are summed per
+    product, and every product is restocked by a single UPDATE.
+    """
+    now = now or timezone.now()
+    result = SweepResult()
+    while True:
+        ids = list(expired_items(now).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        batch = expired_items(now).filter(id__in=ids)
+        with transaction.atomic():
+            if not batch.update(updated_date=now):
+                continue
+            units = dict(
+                batch.order_by().values('product_object').annotate(units=Sum('quantity'))
+                .values_list('product_object', 'units')
+            )
+            released = batch.update(is_active=False, reserved_until=None)
+            units.pop(None, None)
+            inventory.release_stock_bulk(units)
+        result.items += released
+        result.units += sum(units.values())
+        result.products.update(units)
+    return result
+
+
+class Sweeper(threading.Thread):
+    """Runs release_expired every `interval` seconds until stopped."""
+
+    def __init__(self, interval):
+        super().__init__(name='basket-reservation-sweeper', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                result = release_expired()
+                if result.items:
+                    logger.info("Released expired basket reservations: %s", result.as_dict())
+            except Exception:
+                logger.exception("Basket reservation sweep failed")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self.stopped.set()
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def start_sweeper(interval=None):
+    """Start the in-process sweeper once per process (no-op when the interval is 0)."""
+    global _sweeper
+    interval = settings.BASKET_SWEEP_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    with _sweeper_lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = Sweeper(interval)
+            _sweeper.start()
+    return _sweeper
+
+
+def _start_on_request(sender, **kwargs):
+    if _sweeper is None or not _sweeper.is_alive():
+        start_sweeper()
+
+
+def install_sweeper():
+    """
+    With BASKET_SWEEP_INTERVAL set, start the sweeper in every process that
+    serves a request, so web workers run it and management commands don't.
+    Sweeps from several workers are safe: each item is released only once.
+    """
+    if settings.BASKET_SWEEP_INTERVAL > 0:
+        request_started.connect(_start_on_request, dispatch_uid='basket-reservation-sweeper')
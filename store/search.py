@@ -0,0 +1,174 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from store.models import Product
+
+
+# ---------------------------
+# Product full-text search (SQLite FTS5)
+# ---------------------------
+FTS_TABLE = 'store_product_fts'
+
+# bm25 column weights: name, brand, description, category
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 3.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+
+    Every word is quoted (so FTS operators typed by users are treated as
+    plain text) and prefix-matched, and all words must match.
+    """
+    tokens = TOKEN_RE.findall(text or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def index_product(product):
+    if not is_available():
+        return
+    category = Product.category.field.get_cached_value(product, default=None)
+    category_name = category.name if category is not None else None
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+        if category_name is None:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, brand, description, category) '
+                'SELECT p.id, p.name, p.brand, p.description, c.name '
+                'FROM store_product p JOIN store_category c ON c.id = p.category_id '
+                'WHERE p.id = %s',
+                [product.pk],
+            )
+        else:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, brand, description, category) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                [product.pk, product.name, product.brand, product.description, category_name],
+            )
+
+
+def index_products(product_ids):
+    """Re-index many products at once (used after bulk writes, which skip signals)."""
+    if not is_available() or not product_ids:
+        return
+    product_ids = list(product_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), 500):
+            batch = product_ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', batch)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, brand, description, category) '
+                'SELECT p.id, p.name, p.brand, p.description, c.name '
+                'FROM store_product p JOIN store_category c ON c.id = p.category_id '
+                f'WHERE p.id IN ({placeholders})',
+                batch,
+            )
+
+
+def remove_product(product_id):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+def reindex_category(category):
+    """Propagate a category rename to every indexed product in it."""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {FTS_TABLE} SET category = %s '
+            'WHERE rowid IN (SELECT id FROM store_product WHERE category_id = %s)',
+            [category.name, category.pk],
+        )
+
+
+def rebuild_index():
+    """Repopulate the whole index with one INSERT ... SELECT. Returns the row count."""
+    if not is_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, brand, description, category) '
+            'SELECT p.id, p.name, p.brand, p.description, c.name '
+            'FROM store_product p JOIN store_category c ON c.id = p.category_id'
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+class ProductSearchResults:
+    """
+    Lazy, ranked search result sequence.
+
+    Supports count() and slicing so it can be handed straight to a
+    paginator; only the requested page is ever loaded.
+    """
+
+    def __init__(self, text, queryset=None):
+        self.match = build_match_query(text)
+        self.queryset = queryset if queryset is not None else Product.objects.for_catalog()
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if not self.match:
+                self._count = 0
+            elif is_available():
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                        [self.match],
+                    )
+                    self._count = cursor.fetchone()[0]
+            else:
+                self._count = self.fallback_queryset().count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError('ProductSearchResults only supports slicing')
+        start = key.start or 0
+        stop = key.stop if key.stop is not None else self.count()
+        if not self.match or stop <= start:
+            return []
+        if not is_available():
+            return list(self.fallback_queryset()[start:stop])
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {", ".join(str(w) for w in BM25_WEIGHTS)}) '
+                'LIMIT %s OFFSET %s',
+                [self.match, stop - start, start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        products = self.queryset.in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
+
+    def fallback_queryset(self):
+        """Plain icontains search for databases without FTS5."""
+        condition = Q()
+        for token in TOKEN_RE.findall(self.match):
+            condition &= (
+                Q(name__icontains=token)
+                | Q(brand__icontains=token)
+                | Q(description__icontains=token)
+                | Q(category__name__icontains=token)
+            )
+        return self.queryset.filter(condition).order_by('id')
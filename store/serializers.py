@@ -1,35 +1,131 @@
+from django.db import models
 from rest_framework import serializers
+from rest_framework.fields import empty
 from django.contrib.auth import get_user_model
 User = get_user_model()
 from .models import CustomUser, HeroSection
 
 from .models import Category, Product, Contact, Order, OrderItem, Basket, BasketItem, ProductMedia,Wishlist
+from .fieldsets import DynamicFieldsMixin
+from .images import variant_urls
+
+
+# Read-only thumb/card/full URLs for models with an image_variants field
+class ImageVariantsField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return variant_urls(instance, self.context.get('request'))
 
 
 # Category Serializer
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     image = serializers.ImageField(required=False, allow_null=True, use_url=True)
+    image_variants = ImageVariantsField()
     class Meta:
         model = Category
         fields = '__all__'
+        field_sources = {'image_variants': ['image', 'image_variants']}
 
 # ProductMedia Serializer
 class ProductMediaSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = ProductMedia
-        fields = ['id', 'product', 'media_type','file']
+        fields = ['id', 'product', 'media_type','file', 'image_variants']
+
+
+# Product list serializer: serializes each distinct category once per response
+class CatalogProductListSerializer(serializers.ListSerializer):
+    category_map = None
+
+    def to_representation(self, data):
+        products = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if 'category_detail' not in self.child.fields:
+            return super().to_representation(products)
+
+        categories = {}
+        missing = set()
+        for product in products:
+            if Product.category.is_cached(product):
+                categories[product.category_id] = product.category
+            else:
+                missing.add(product.category_id)
+        missing.difference_update(categories)
+        if missing:
+            categories.update(Category.objects.in_bulk(missing))
+
+        self.category_map = {
+            pk: CategorySerializer(category, context=self.context).data
+            for pk, category in categories.items()
+        }
+        try:
+            return super().to_representation(products)
+        finally:
+            self.category_map = None
 
 
 # Product Serializer (WITH IMAGE & CATEGORY DETAILS)
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     brand = serializers.CharField(max_length=100, required=False, allow_blank=True)
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
-    category_detail = CategorySerializer(source='category', read_only=True)
+    category_detail = serializers.SerializerMethodField()
     image = serializers.ImageField(required=False, allow_null=True, use_url=True)
+    image_variants = ImageVariantsField()
     # media=ProductMediaSerializer(many=True,read_only=True)
     class Meta:
         model = Product
-        fields = ['id', 'brand','name','price', 'description', 'stock', 'category', 'category_detail', 'image']
+        fields = ['id', 'brand','name','price', 'description', 'stock', 'category', 'category_detail', 'image', 'image_variants']
+        list_serializer_class = CatalogProductListSerializer
+        field_sources = {'category_detail': ['category'], 'image_variants': ['image', 'image_variants']}
+
+    def get_category_detail(self, obj):
+        category_map = getattr(self.parent, 'category_map', None)
+        if category_map is not None and obj.category_id in category_map:
+            return category_map[obj.category_id]
+        return CategorySerializer(obj.category, context=self.context).data
+
+
+# Product detail with optional expansions (?expand=media,category,wishlist)
+PRODUCT_EXPANSIONS = ('media', 'category', 'wishlist')
+
+
+def parse_expand(value):
+    """Split an ?expand= value; raises ValidationError on unknown names."""
+    expand = {part.strip() for part in (value or '').split(',') if part.strip()}
+    unknown = expand.difference(PRODUCT_EXPANSIONS)
+    if unknown:
+        raise serializers.ValidationError(
+            {'expand': f"Unknown expansion(s): {', '.join(sorted(unknown))}. Choose from {', '.join(PRODUCT_EXPANSIONS)}."}
+        )
+    return expand
+
+
+class ProductDetailSerializer(ProductSerializer):
+    """
+    Expects the queryset to be prepared for the requested expansions:
+    with_media() for `media` and with_wishlist_state() for `wishlist`.
+    `category` is already embedded as category_detail and is accepted so
+    clients can ask for it explicitly.
+    """
+    media = ProductMediaSerializer(many=True, read_only=True)
+    in_wishlist = serializers.BooleanField(read_only=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['media', 'in_wishlist']
+        field_sources = {**ProductSerializer.Meta.field_sources, 'in_wishlist': []}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.context.get('expand', set())
+        if 'media' not in expand:
+            self.fields.pop('media', None)
+        if 'wishlist' not in expand:
+            self.fields.pop('in_wishlist', None)
 
 
 # User Registration Serializer
@@ -90,8 +186,8 @@ class CartItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = BasketItem
-        fields = ['id', 'product', 'product_object', 'basket_object', 'quantity', 'item_total']
-        read_only_fields = ['id', 'quantity', 'item_total', 'is_active', 'is_order_placed']
+        fields = ['id', 'product', 'product_object', 'basket_object', 'quantity', 'item_total', 'reserved_until']
+        read_only_fields = ['id', 'quantity', 'item_total', 'is_active', 'is_order_placed', 'reserved_until']
 
     def get_product(self, obj):
         product = obj.product_object
@@ -100,9 +196,29 @@ class CartItemSerializer(serializers.ModelSerializer):
             "name": product.name,
             "price": str(product.price),
             "image": product.image.url if product.image else None,
+            "image_variants": variant_urls(product, self.context.get('request')),
         }
 
 
+class CartOperationSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0, default=1)
+    # add: quantity more, set: exactly quantity (0 removes), remove: take it out
+    action = serializers.ChoiceField(choices=['add', 'set', 'remove'], default='add')
+
+
+class CartBatchSerializer(serializers.Serializer):
+    items = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+    def validate_items(self, items):
+        product_ids = {item['product'] for item in items}
+        found = set(Product.objects.filter(pk__in=product_ids).values_list('id', flat=True))
+        missing = sorted(product_ids - found)
+        if missing:
+            raise serializers.ValidationError(f"Unknown product(s): {', '.join(map(str, missing))}")
+        return items
+
+
 class CartSerializer(serializers.ModelSerializer):
     cartitems = CartItemSerializer(many=True, read_only=True)
     get_basket_total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
@@ -126,7 +242,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         }
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
@@ -136,7 +252,8 @@ class OrderSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'address': {'required': True},
             'total_amount': {'required': True},
-            'status': {'required': True},
+            # DRF 3.15 passes the model default along; drop it to keep status required
+            'status': {'required': True, 'default': empty},
             'is_paid': {'required': True},
             'items': {'required': False}
         }
@@ -150,7 +267,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
 
 
 
-class WishListSerializer(serializers.ModelSerializer):
+class WishListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source="product.name", read_only=True)
     product_price = serializers.DecimalField(source="product.price", max_digits=10, decimal_places=2, read_only=True)
     product_brand = serializers.CharField(source="product.brand", read_only=True)
@@ -177,6 +294,8 @@ class CustomUserSerializer(serializers.ModelSerializer):
 
 # Hero Section Serializer
 class HeroSectionSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = HeroSection
         fields = '__all__'
@@ -0,0 +1,173 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from store import images, popularity, search, similarity
+from store.cache import bump_catalog_version
+from store.models import Category, HeroSection, Order, Product, ProductMedia, Wishlist
+from store.storage import is_blob, release_reference
+
+
+# ---------------------------
+# Search index sync
+# ---------------------------
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created, **kwargs):
+    if not created:
+        search.reindex_category(instance)
+
+
+# Product payloads embed their category, so a category edit has to move
+# the products' updated_at (used for ETag / Last-Modified) as well.
+@receiver(post_save, sender=Category)
+def touch_category_products(sender, instance, created, **kwargs):
+    if not created:
+        Product.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+# Same for media, which the product page embeds (?expand=media).
+@receiver(post_save, sender=ProductMedia)
+@receiver(post_delete, sender=ProductMedia)
+def touch_media_product(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+# ---------------------------
+# Similar products
+# ---------------------------
+SIMILARITY_FIELDS = ('description', 'brand', 'category_id')
+
+
+@receiver(post_save, sender=Product)
+def refresh_similar_products(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if not created and loaded is not None:
+        changed = [f for f in SIMILARITY_FIELDS if f in loaded and loaded[f] != getattr(instance, f)]
+        if not changed:
+            return
+        loaded.update((f, getattr(instance, f)) for f in changed)
+    # big catalogs are left to the scheduled rebuild_similar_products run
+    if Product.objects.count() <= similarity.sync_refresh_limit():
+        transaction.on_commit(lambda: similarity.refresh_similar_products([instance.pk]))
+
+
+# ---------------------------
+# Popularity scores
+# ---------------------------
+@receiver(post_save, sender=Product)
+def create_popularity_row(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        popularity.ensure_rows([instance.pk])
+
+
+# Items are added after the order row is created, so sales are counted
+# once the transaction that placed (or cancelled) the order commits.
+@receiver(post_save, sender=Order)
+def count_order_sales(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if created:
+        previous = None
+    elif loaded is None or 'status' not in loaded:
+        return  # status was not loaded, so there is no transition to see
+    else:
+        previous = loaded['status']
+    instance._loaded_values = {**(loaded or {}), 'status': instance.status}
+
+    was_placed = previous in popularity.PLACED_STATUSES
+    is_placed = instance.status in popularity.PLACED_STATUSES
+    if is_placed != was_placed:
+        sign = 1 if is_placed else -1
+        transaction.on_commit(lambda: popularity.record_order(instance, sign))
+
+
+@receiver(post_save, sender=Wishlist)
+def count_wishlist_add(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        popularity.record_wishlist(instance.product_id, instance.added_at)
+
+
+@receiver(post_delete, sender=Wishlist)
+def count_wishlist_remove(sender, instance, **kwargs):
+    popularity.record_wishlist(instance.product_id, instance.added_at, sign=-1)
+
+
+# ---------------------------
+# Responsive image variants
+# ---------------------------
+# Registered before the cache receivers below so a save that produces new
+# variants is invalidated after they are written.
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductMedia)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=HeroSection)
+def generate_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.ensure_variants(instance)
+
+
+# ---------------------------
+# Media blob references
+# ---------------------------
+# Uploads are shared content-addressed blobs (store.storage); drop a
+# reference whenever a record stops pointing at one. Files saved before
+# the blob storage existed are left alone.
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductMedia)
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=HeroSection)
+def remember_stored_file(sender, instance, raw=False, update_fields=None, **kwargs):
+    field = images.image_field_name(instance)
+    instance._stored_file = None
+    if raw or instance.pk is None or (update_fields is not None and field not in update_fields):
+        return
+    instance._stored_file = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductMedia)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=HeroSection)
+def release_replaced_file(sender, instance, **kwargs):
+    old_name = getattr(instance, '_stored_file', None)
+    new_name = getattr(instance, images.image_field_name(instance)).name
+    if old_name and old_name != new_name and is_blob(old_name):
+        release_reference(old_name)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductMedia)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=HeroSection)
+def release_deleted_files(sender, instance, **kwargs):
+    fieldfile = getattr(instance, images.image_field_name(instance))
+    if is_blob(fieldfile.name):
+        release_reference(fieldfile.name)
+    # variants are derived files, so they go with their record
+    images.delete_variants(fieldfile.storage, instance.image_variants or {})
+
+
+# ---------------------------
+# Catalog cache invalidation
+# ---------------------------
+def invalidate_catalog(sender, **kwargs):
+    bump_catalog_version()
+
+
+for model in (Product, Category, ProductMedia, HeroSection):
+    post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'invalidate_catalog_save_{model.__name__}')
+    post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'invalidate_catalog_delete_{model.__name__}')
@@ -0,0 +1,223 @@
+import re
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from store.models import Product, SimilarProduct
+
+
+# ---------------------------
+# "Similar scents" (TF-IDF over description, brand and category)
+# ---------------------------
+TOP_N = 12
+MAX_DF = 0.8          # terms in nearly every product say nothing about similarity
+DENSE_TERMS = 256     # the most common terms are multiplied as a dense matrix (BLAS)
+MEMORY_MB = 256       # working-set budget for the similarity blocks
+CANDIDATE_FACTOR = 4  # on a single-product refresh, also revisit its top 4*N neighbours
+
+TOKEN_RE = re.compile(r"[a-z][a-z0-9]+")
+STOP_WORDS = frozenset("""
+    a an and are as at be but by for from has have in into is it its of on or so
+    that the this to was with you your our we will can all any more most very
+""".split())
+
+
+def product_terms(description, brand, category):
+    terms = [token for token in TOKEN_RE.findall((description or '').lower()) if token not in STOP_WORDS]
+    if brand and brand.strip():
+        terms.append('brand:' + brand.strip().lower())
+    if category and category.strip():
+        terms.append('category:' + category.strip().lower())
+    return terms
+
+
+def sync_refresh_limit():
+    """Catalogs bigger than this are refreshed by the scheduled command instead of on save."""
+    return getattr(settings, 'SIMILAR_PRODUCTS_SYNC_LIMIT', 5000)
+
+
+def _ranges(starts, lengths):
+    """Concatenation of arange(start, start + length) for each pair, without a Python loop."""
+    offsets = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets
+
+
+class TfidfIndex:
+    """
+    L2-normalised TF-IDF vectors for a set of documents, kept as parallel
+    NumPy arrays in both row (document) and column (term) order so cosine
+    similarities can be computed as sparse products without scipy.
+
+    The DENSE_TERMS most common terms, whose long posting lists would
+    dominate the sparse product, live in a small dense matrix instead and
+    go through a regular matrix multiplication.
+    """
+
+    def __init__(self, product_ids, documents, max_df=MAX_DF, dense_terms=DENSE_TERMS):
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.row_of = {pk: row for row, pk in enumerate(self.product_ids.tolist())}
+        n_docs = len(self.product_ids)
+
+        vocabulary = {}
+        doc_rows, term_ids = [], []
+        for row, terms in enumerate(documents):
+            for term in terms:
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            doc_rows.extend([row] * len(terms))
+        doc_rows = np.asarray(doc_rows, dtype=np.int64)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+
+        # term frequency per (document, term)
+        pairs, tf = np.unique(doc_rows * max(len(vocabulary), 1) + term_ids, return_counts=True)
+        rows, terms = np.divmod(pairs, max(len(vocabulary), 1))
+        df = np.bincount(terms, minlength=len(vocabulary))
+
+        keep = df[terms] <= max(max_df * n_docs, 1)
+        rows, terms, tf = rows[keep], terms[keep], tf[keep]
+        idf = np.log((1 + n_docs) / (1 + df)) + 1
+        weights = (1 + np.log(tf)) * idf[terms]
+        norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=n_docs))
+        weights = (weights / np.where(norms[rows] > 0, norms[rows], 1)).astype(np.float32)
+
+        # common terms go to the dense block, the long tail stays sparse
+        ranked = np.argsort(-df, kind='stable')[:dense_terms]
+        ranked = ranked[df[ranked] > 1]
+        dense_column = np.full(len(vocabulary), -1, dtype=np.int64)
+        dense_column[ranked] = np.arange(len(ranked))
+        in_dense = dense_column[terms] >= 0
+        self.dense = np.zeros((n_docs, len(ranked)), dtype=np.float32)
+        self.dense[rows[in_dense], dense_column[terms[in_dense]]] = weights[in_dense]
+        rows, terms, weights = rows[~in_dense], terms[~in_dense], weights[~in_dense]
+
+        # row order (already sorted by document)
+        self.indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=n_docs))]
+        self.indices, self.data = terms, weights
+
+        # column order
+        by_term = np.argsort(terms, kind='stable')
+        self.term_indptr = np.r_[0, np.cumsum(np.bincount(terms, minlength=len(vocabulary)))]
+        self.term_docs, self.term_data = rows[by_term], weights[by_term]
+        self.df = np.diff(self.term_indptr)
+
+    @classmethod
+    def from_catalog(cls, queryset=None):
+        queryset = Product.objects.all() if queryset is None else queryset
+        product_ids, documents = [], []
+        rows = queryset.order_by('id').values_list('id', 'description', 'brand', 'category__name')
+        for pk, description, brand, category in rows.iterator(chunk_size=2000):
+            product_ids.append(pk)
+            documents.append(product_terms(description, brand, category))
+        return cls(product_ids, documents)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def pair_counts(self):
+        """Posting entries each document touches when compared with all others."""
+        costs = np.zeros(len(self), dtype=np.int64)
+        touched = self.df[self.indices]
+        nonempty = np.flatnonzero(np.diff(self.indptr))
+        costs[nonempty] = np.add.reduceat(touched, self.indptr[nonempty])
+        return costs
+
+    def blocks(self, memory_mb=MEMORY_MB):
+        """Split the rows into runs whose similarity computation fits the memory budget."""
+        budget = memory_mb * 1024 * 1024 - self.dense.nbytes
+        row_bytes = len(self) * 24   # score rows plus top-N scratch
+        pair_bytes = 40              # expanded index/weight arrays per posting entry
+        start, used = 0, 0
+        for row, cost in enumerate(self.pair_counts().tolist()):
+            need = row_bytes + cost * pair_bytes
+            if row > start and used + need > budget:
+                yield np.arange(start, row)
+                start, used = row, 0
+            used += need
+        if start < len(self):
+            yield np.arange(start, len(self))
+
+    def similarities(self, rows):
+        """(len(rows), len(self)) float32 cosine similarities of `rows` against every document."""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        local = np.repeat(np.arange(len(rows)), lengths)
+        nnz = _ranges(self.indptr[rows], lengths)
+        query_terms, query_weights = self.indices[nnz], self.data[nnz]
+
+        scores = self.dense[rows] @ self.dense.T
+
+        # every sparse query term meets each document in its posting list
+        postings = self.df[query_terms]
+        if postings.sum():
+            position = _ranges(self.term_indptr[query_terms], postings)
+            scores += np.bincount(
+                np.repeat(local, postings) * len(self) + self.term_docs[position],
+                weights=np.repeat(query_weights, postings) * self.term_data[position],
+                minlength=len(rows) * len(self),
+            ).reshape(len(rows), len(self))
+        return scores
+
+    def neighbours(self, rows, n=TOP_N):
+        """Yields (row, [(other row, score), ...]) with the n most similar documents per row."""
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = self.similarities(rows)
+        scores[np.arange(len(rows)), rows] = 0
+        k = min(n, len(self) - 1)
+        if k <= 0:
+            for row in rows.tolist():
+                yield row, []
+            return
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.lexsort((best, -best_scores), axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for row, others, values in zip(rows.tolist(), best.tolist(), best_scores.tolist()):
+            yield row, [(other, score) for other, score in zip(others, values) if score > 0]
+
+
+def _similar_rows(index, rows, n):
+    return [
+        SimilarProduct(
+            product_id=int(index.product_ids[row]),
+            similar_id=int(index.product_ids[other]),
+            rank=rank,
+            score=round(score, 6),
+        )
+        for row, neighbours in index.neighbours(rows, n)
+        for rank, (other, score) in enumerate(neighbours)
+    ]
+
+
+def rebuild_similar_products(n=TOP_N, memory_mb=MEMORY_MB):
+    """Recompute every product's list. Returns the number of products indexed."""
+    index = TfidfIndex.from_catalog()
+    with transaction.atomic():
+        SimilarProduct.objects.all().delete()
+        for rows in index.blocks(memory_mb):
+            SimilarProduct.objects.bulk_create(_similar_rows(index, rows, n), batch_size=1000)
+    return len(index)
+
+
+def refresh_similar_products(product_ids, n=TOP_N):
+    """
+    Recompute the lists of `product_ids` after their text changed, plus
+    the lists they may have entered or dropped out of: products that
+    listed them before and their closest new neighbours.
+    """
+    index = TfidfIndex.from_catalog()
+    rows = [index.row_of[pk] for pk in product_ids if pk in index.row_of]
+    if not rows:
+        return 0
+
+    affected = set(rows)
+    for _, neighbours in index.neighbours(rows, n * CANDIDATE_FACTOR):
+        affected.update(other for other, _ in neighbours)
+    listed_by = SimilarProduct.objects.filter(similar_id__in=product_ids).values_list('product_id', flat=True)
+    affected.update(index.row_of[pk] for pk in listed_by if pk in index.row_of)
+
+    affected = sorted(affected)
+    with transaction.atomic():
+        SimilarProduct.objects.filter(product_id__in=index.product_ids[affected].tolist()).delete()
+        SimilarProduct.objects.bulk_create(_similar_rows(index, affected, n), batch_size=1000)
+    return len(affected)
@@ -0,0 +1,105 @@
+import hashlib
+import os
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+
+# ---------------------------
+# Content-addressed media storage
+# ---------------------------
+BLOB_DIR = 'blobs'
+
+
+class _BlobExists(Exception):
+    pass
+
+
+def is_blob(name):
+    return bool(name) and name.replace('\\', '/').startswith(BLOB_DIR + '/')
+
+
+def blob_model():
+    return apps.get_model('store', 'MediaBlob')
+
+
+def add_reference(name, size=0):
+    """Count one more reference to `name`. Returns True when this created its row."""
+    MediaBlob = blob_model()
+    if MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + 1):
+        return False
+    try:
+        with transaction.atomic():
+            MediaBlob.objects.create(name=name, size=size, refcount=1)
+    except IntegrityError:
+        MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + 1)
+        return False
+    return True
+
+
+def release_reference(name):
+    blob_model().objects.filter(name=name, refcount__gt=0).update(refcount=F('refcount') - 1)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that names every upload after the SHA-256 of its content
+    (blobs/ab/cd/<sha256><ext>), so identical uploads share a single file.
+
+    Each save() adds a reference and each delete() drops one in the
+    MediaBlob table; files are only removed from disk by the gc_media
+    command once nothing points at them. Files saved before this storage
+    was introduced keep their old names and plain filesystem behaviour.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save(); a clash on
+        # a blob name means the same bytes are already stored.
+        if is_blob(name) and self.exists(name):
+            raise _BlobExists(name)
+        return name
+
+    def blob_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+        hexdigest = digest.hexdigest()
+        ext = os.path.splitext(name)[1].lower()
+        return f'{BLOB_DIR}/{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{ext}'
+
+    def _save(self, name, content):
+        name = self.blob_name(name, content)
+        # Reference first: gc_media removes a file only together with a row
+        # it deleted at refcount 0, so from here on the file is kept. A
+        # missing row means the blob was collected (or never stored), and a
+        # file still lying there cannot be trusted, so it is written again.
+        created = add_reference(name, size=content.size or 0)
+        try:
+            if created and self.exists(name):
+                super().delete(name)
+            if not self.exists(name):
+                try:
+                    super()._save(name, content)
+                except _BlobExists:
+                    pass
+        except Exception:
+            release_reference(name)
+            raise
+        return name
+
+    def delete(self, name):
+        if is_blob(name):
+            release_reference(name)
+        else:
+            super().delete(name)
+
+    def delete_blob(self, name):
+        """Physically remove a blob; only gc_media should call this."""
+        super().delete(name)
+
+
+media_storage = ContentAddressedStorage()
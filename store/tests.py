@@ -1,3 +1,1232 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import uuid
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import Http404
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from store import catalog_io, inventory
+from store.cache import HITS_KEY, cache_stats, flush_stats, get_cache
+from store.images import VARIANT_SIZES
+from store.media import parse_range, serve_media
+from store.models import Basket, BasketItem, Category, CustomUser, HeroSection, MediaBlob, Order, OrderItem, PopularityEpoch, Product, ProductMedia, ProductPopularity, RelatedProduct, Wishlist
+from store.popularity import INITIAL_EPOCH, WISHLIST_WEIGHT, decay_weight, rebuild_popularity
+from store.recommendations import co_occurrence, update_co_purchases
+from store.reservations import release_expired
+from store.search import FTS_TABLE, build_match_query
+from store.renderers import ORJSONParser, ORJSONRenderer
+from store.similarity import TfidfIndex, product_terms
+from store.storage import media_storage
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Rose")
+        # pairs of tied prices, so pages split inside a tie
+        cls.products = Product.objects.bulk_create([
+            Product(category=category, name=f"Rose {n}", description="", price=f"{10 + n // 2}.00", stock=1)
+            for n in range(7)
+        ])
+        cls.expected = [p.pk for p in sorted(cls.products, key=lambda p: (Decimal(p.price), p.pk))]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def ids(self, response):
+        return [item["id"] for item in response.data["results"]]
+
+    def test_walks_forward_and_back_through_price_ties(self):
+        url, forward, pages = "/api/view-products/?ordering=price&page_size=3", [], []
+        while url:
+            response = self.client.get(url)
+            pages.append(response.data)
+            forward += self.ids(response)
+            url = response.data["next"]
+        self.assertEqual(forward, self.expected)
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]["previous"])
+
+        backward, url = [], pages[-1]["previous"]
+        while url:
+            response = self.client.get(url)
+            backward = self.ids(response) + backward
+            url = response.data["previous"]
+        self.assertEqual(backward, self.expected[:6])
+
+    def test_descending_order_and_other_endpoints(self):
+        response = self.client.get("/api/products/", {"ordering": "-price", "page_size": 4})
+        self.assertEqual(self.ids(response), self.expected[::-1][:4])
+        self.assertEqual(self.ids(self.client.get(response.data["next"])), self.expected[::-1][4:])
+
+    def test_invalid_cursor_is_404(self):
+        for cursor in ("not-a-cursor", "eyJpIjoieCJ9"):  # garbage, then {"i":"x"}
+            response = self.client.get("/api/view-products/", {"ordering": "price", "cursor": cursor})
+            self.assertEqual(response.status_code, 404)
+
+    def test_page_size_is_capped(self):
+        Product.objects.bulk_create([
+            Product(category=self.products[0].category, name=f"Extra {n}", description="", price="99.00", stock=1)
+            for n in range(101)
+        ])
+        response = self.client.get("/api/view-products/", {"page_size": 500})
+        self.assertEqual(len(response.data["results"]), 100)
+        self.assertIn("page_size=100", response.data["next"])
+
+    def test_plain_list_without_params(self):
+        response = self.client.get("/api/view-products/")
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 7)
+
+    @override_settings(ALLOWED_HOSTS=[""])  # the settings default
+    def test_benchmark_command_runs(self):
+        out = io.StringIO()
+        call_command("benchmark_pagination", products=120, page_size=25, stdout=out)
+        output = out.getvalue()
+        self.assertIn("127 products in 6 pages of 25", output)
+        self.assertIn("keyset last/first page ratio", output)
+        # the synthetic catalog is rolled back
+        self.assertEqual(Product.objects.count(), 7)
+
+
+class ProductListQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def add_products(self, count):
+        # spread over several categories, so a per-category lookup would show
+        categories = [Category.objects.create(name=f"Family {uuid.uuid4().hex[:8]}") for _ in range(3)]
+        Product.objects.bulk_create([
+            Product(category=categories[n % 3], name=f"Scent {n}", description="", price="10.00", stock=1)
+            for n in range(count)
+        ])
+        return categories[0]
+
+    def assert_constant_queries(self, url_for, queries):
+        for count in (3, 30):
+            category = self.add_products(count)
+            url = url_for(category)
+            with self.subTest(url=url, products=Product.objects.count()):
+                get_cache().clear()
+                with self.assertNumQueries(queries):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(all(item["category_detail"] for item in response.data))
+
+    def test_products(self):
+        # ETag state + the list
+        self.assert_constant_queries(lambda category: "/api/products/", 2)
+
+    def test_view_products(self):
+        # ETag state + the list
+        self.assert_constant_queries(lambda category: "/api/view-products/", 2)
+
+    def test_category_products(self):
+        # the category + its products
+        self.assert_constant_queries(lambda category: f"/api/categories/{category.pk}/products/", 2)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Attars")
+        cls.named = Product.objects.create(category=cls.category, name="Oud Royale", description="Dark and smoky", price="90.00", stock=1)
+        cls.described = Product.objects.create(category=cls.category, name="Night Musk", description="Musk over a little oud", price="60.00", stock=1)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def search(self, q):
+        response = self.client.get("/api/products/search/", {"q": q})
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.data["results"]]
+
+    def test_fts_syntax_in_input_is_plain_text(self):
+        self.assertEqual(build_match_query('oud AND "ros* NEAR('), '"oud"* "AND"* "ros"* "NEAR"*')
+        for q in ('"oud', "oud AND", "*", "oud OR NOT musk", "NEAR(oud musk)"):
+            self.search(q)
+        self.assertEqual(self.search("*"), [])
+        # as an operator NOT would return "Oud Royale"; as a word nothing matches it
+        self.assertEqual(self.search("oud NOT musk"), [])
+
+    def test_name_matches_rank_above_description(self):
+        self.assertEqual(self.search("oud"), [self.named.pk, self.described.pk])
+        self.assertEqual(self.search("roy"), [self.named.pk])
+
+    def test_index_follows_product_save_and_delete(self):
+        self.named.name = "Amber Royale"
+        self.named.save()
+        self.assertEqual(self.search("amber"), [self.named.pk])
+        self.assertEqual(self.search("oud"), [self.described.pk])
+        self.described.delete()
+        self.assertEqual(self.search("musk"), [])
+
+    def test_index_follows_category_rename(self):
+        self.category.name = "Bakhoor"
+        self.category.save()
+        self.assertEqual(sorted(self.search("bakhoor")), sorted([self.named.pk, self.described.pk]))
+        self.assertEqual(self.search("attars"), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        self.assertEqual(self.search("oud"), [])
+        out = io.StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("Indexed 2 products", out.getvalue())
+        self.assertEqual(self.search("oud"), [self.named.pk, self.described.pk])
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.attar = Category.objects.create(name="Attar")
+        cls.mist = Category.objects.create(name="Mist")
+        rows = [
+            ("Ajmal", cls.attar, "499.99", True),
+            ("Ajmal", cls.attar, "500.00", True),
+            ("Ajmal", cls.mist, "999.99", False),
+            ("Rasasi", cls.attar, "1000.00", True),
+            ("Rasasi", cls.mist, "2499.99", True),
+            ("Rasasi", cls.mist, "2500.00", True),
+        ]
+        for n, (brand, category, price, available) in enumerate(rows):
+            Product.objects.create(
+                category=category, brand=brand, name=f"Scent {n}", description="", price=price, stock=1, available=available,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def facets(self, **params):
+        response = self.client.get("/api/products/", {"facets": "true", **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_each_facet_ignores_only_its_own_filter(self):
+        data = self.facets(brand="Ajmal", category=str(self.attar.pk))
+        self.assertEqual(len(data["results"]), 2)
+        facets = data["facets"]
+        # brands counted within Attar, categories counted within Ajmal
+        self.assertEqual(facets["brand"], [{"value": "Ajmal", "count": 2}, {"value": "Rasasi", "count": 1}])
+        self.assertEqual([(row["name"], row["count"]) for row in facets["category"]], [("Attar", 2), ("Mist", 1)])
+        self.assertEqual(sum(row["count"] for row in facets["price"]), 2)
+
+        facets = self.facets(available="false", min_price="900")["facets"]
+        self.assertEqual(facets["brand"], [{"value": "Ajmal", "count": 1}])
+        # the price facet ignores min_price but keeps available=false
+        self.assertEqual({row["label"]: row["count"] for row in facets["price"]}["500-1000"], 1)
+
+    def test_price_bucket_edges(self):
+        counts = {row["label"]: row["count"] for row in self.facets()["facets"]["price"]}
+        self.assertEqual(counts, {"0-500": 1, "500-1000": 2, "1000-2500": 2, "2500+": 1})
+        data = self.facets(min_price="500", max_price="999.99")
+        self.assertEqual(sorted(item["price"] for item in data["results"]), ["500.00", "999.99"])
+
+    def test_invalid_filters_are_400(self):
+        for params in ({"category": "attar"}, {"available": "maybe"}, {"min_price": "cheap"}, {"max_price": "1,000"}):
+            response = self.client.get("/api/products/", params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(next(iter(params)), response.data)
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Incense")
+        cls.product = Product.objects.create(category=cls.category, name="Bakhoor", description="", price="15.00", stock=3)
+
+    def setUp(self):
+        self.client = APIClient()
+        flush_stats()  # also restarts the flush interval
+        get_cache().clear()
+
+    def assert_cache(self, url, expected):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], expected, url)
+        return response
+
+    def test_second_read_is_a_hit(self):
+        first = self.assert_cache("/api/products/", "MISS")
+        # only the ETag state; the body comes from the cache
+        with self.assertNumQueries(1):
+            second = self.assert_cache("/api/products/", "HIT")
+        self.assertEqual(second.data, first.data)
+        self.assert_cache(f"/api/categories/{self.category.pk}/", "MISS")
+        self.assert_cache(f"/api/categories/{self.category.pk}/", "HIT")
+
+    def test_query_strings_get_their_own_entries(self):
+        self.assert_cache("/api/products/", "MISS")
+        response = self.assert_cache("/api/products/?fields=id,name", "MISS")
+        self.assertEqual(list(response.data[0]), ["id", "name"])
+        self.assert_cache("/api/products/?fields=id,name", "HIT")
+        self.assertIn("description", self.assert_cache("/api/products/", "HIT").data[0])
+
+    def test_each_catalog_model_invalidates(self):
+        changes = {
+            "product": lambda: Product.objects.filter(pk=self.product.pk).first().save(),
+            "category": lambda: Category.objects.get(pk=self.category.pk).save(),
+            "media": lambda: ProductMedia.objects.create(product=self.product, media_type="video"),
+            "hero": lambda: HeroSection.objects.create(title="Eid", image="hero_images/eid.jpg"),
+        }
+        for name, change in changes.items():
+            with self.subTest(name):
+                self.assert_cache("/api/products/", "MISS")
+                self.assert_cache("/api/products/", "HIT")
+                change()
+        self.assert_cache("/api/products/", "MISS")
+
+    def test_stock_changes_only_invalidate_products(self):
+        HeroSection.objects.create(title="Eid", image="hero_images/eid.jpg")
+        urls = ("/api/products/", f"/api/products/{self.product.pk}/", "/api/categories/", "/api/herosection/")
+        for url in urls:
+            self.assert_cache(url, "MISS")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(inventory.reserve_stock(self.product.pk, 1))
+        self.assertEqual(self.assert_cache("/api/products/", "MISS").data[0]["stock"], 2)
+        self.assertEqual(self.assert_cache(f"/api/products/{self.product.pk}/", "MISS").data["stock"], 2)
+        self.assert_cache("/api/categories/", "HIT")
+        self.assert_cache("/api/herosection/", "HIT")
+
+    def test_counts_stay_in_memory_until_flushed(self):
+        self.assert_cache("/api/products/", "MISS")
+        self.assert_cache("/api/products/", "HIT")
+        self.assertIsNone(get_cache().get(HITS_KEY))
+        stats = cache_stats()
+        self.assertGreaterEqual(stats["hits"], 1)
+        self.assertGreaterEqual(stats["misses"], 1)
+
+
+class ConditionalRequestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Rose")
+        cls.product = Product.objects.create(category=cls.category, name="Taif Rose", description="", price="75.00", stock=4)
+        HeroSection.objects.create(title="Summer", image="hero_images/summer.jpg")
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_catalog_viewsets_answer_304(self):
+        for url in ("/api/categories/", f"/api/categories/{self.category.pk}/", "/api/herosection/",
+                    "/api/products/", f"/api/products/{self.product.pk}/"):
+            with self.subTest(url):
+                etag = self.client.get(url)["ETag"]
+                # another worker has its own (empty) cache but derives the same tag
+                get_cache().clear()
+                response = self.revalidate(url, etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+
+    def test_changes_move_the_etag(self):
+        changes = {
+            "/api/products/": lambda: Product.objects.get(pk=self.product.pk).save(),
+            "/api/categories/": lambda: Category.objects.get(pk=self.category.pk).save(),
+            "/api/herosection/": lambda: HeroSection.objects.get().save(),
+        }
+        for url, change in changes.items():
+            with self.subTest(url):
+                etag = self.client.get(url)["ETag"]
+                change()
+                response = self.revalidate(url, etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etag)
+
+    def test_deleting_a_row_moves_the_etag(self):
+        other = Category.objects.create(name="Vetiver")
+        etag = self.client.get("/api/categories/")["ETag"]
+        other.delete()
+        self.assertEqual(self.revalidate("/api/categories/", etag).status_code, 200)
+
+    def test_view_products_answers_304(self):
+        etag = self.client.get("/api/view-products/")["ETag"]
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate("/api/view-products/", etag).status_code, 304)
+        Category.objects.get(pk=self.category.pk).save()  # renames reach the embedded category
+        self.assertEqual(self.revalidate("/api/view-products/", etag).status_code, 200)
+
+    def test_product_detail_answers_304(self):
+        url = f"/api/view-product/{self.product.pk}/"
+        first = self.client.get(url, {"expand": "media"})
+        etag, last_modified = first["ETag"], first["Last-Modified"]
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"expand": "media"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        ProductMedia.objects.create(product=self.product, media_type="video")
+        response = self.client.get(url, {"expand": "media"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["media"]), 1)
+
+
+class MediaRootMixin:
+    """Points MEDIA_ROOT at a throwaway directory for the test."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @staticmethod
+    def image_upload(name="scent.jpg", size=(2000, 1000), mode="RGB", fmt="JPEG", color=(200, 120, 40, 128)):
+        buffer = io.BytesIO()
+        Image.new(mode, size, color[:len(mode)]).save(buffer, fmt)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class ImageVariantTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name="Amber")
+
+    def create_product(self, image):
+        return Product.objects.create(category=self.category, name="Amber Noir", description="", price="60.00", stock=2, image=image)
+
+    def open_variant(self, name):
+        with media_storage.open(name, "rb") as file:
+            image = Image.open(file)
+            image.load()
+        return image
+
+    def test_three_sizes_in_webp_and_jpeg(self):
+        product = self.create_product(self.image_upload())
+        variants = Product.objects.get(pk=product.pk).image_variants
+        self.assertEqual(variants["source"], product.image.name)
+        for variant, edge in VARIANT_SIZES.items():
+            with self.subTest(variant):
+                self.assertEqual(set(variants[variant]), {"webp", "jpeg"})
+                webp, jpeg = self.open_variant(variants[variant]["webp"]), self.open_variant(variants[variant]["jpeg"])
+                self.assertEqual((webp.format, jpeg.format), ("WEBP", "JPEG"))
+                # 2000x1000 is scaled down to the longest edge, keeping its aspect ratio
+                self.assertEqual(jpeg.size, (edge, edge // 2))
+
+    def test_transparent_source_falls_back_to_png(self):
+        product = self.create_product(self.image_upload("logo.png", size=(300, 300), mode="RGBA", fmt="PNG"))
+        variants = Product.objects.get(pk=product.pk).image_variants
+        self.assertEqual(set(variants["thumb"]), {"webp", "png"})
+        png = self.open_variant(variants["thumb"]["png"])
+        self.assertEqual((png.format, png.mode), ("PNG", "RGBA"))
+        # never upscaled past the source
+        self.assertEqual(self.open_variant(variants["full"]["png"]).size, (300, 300))
+
+    def test_stock_only_save_does_not_reencode(self):
+        product = Product.objects.get(pk=self.create_product(self.image_upload()).pk)
+        variants = product.image_variants
+        product.stock = 9
+        with mock.patch("store.images.build_variants") as build:
+            product.save()
+        build.assert_not_called()
+        self.assertEqual(Product.objects.get(pk=product.pk).image_variants, variants)
+
+    def test_new_image_replaces_variants(self):
+        product = Product.objects.get(pk=self.create_product(self.image_upload()).pk)
+        old_thumb = product.image_variants["thumb"]["webp"]
+        product.image = self.image_upload("other.jpg", size=(800, 400), color=(20, 40, 160))
+        product.save()
+        variants = Product.objects.get(pk=product.pk).image_variants
+        self.assertEqual(variants["source"], product.image.name)
+        self.assertNotEqual(variants["thumb"]["webp"], old_thumb)
+        self.assertEqual(self.open_variant(variants["full"]["jpeg"]).size, (800, 400))
+
+    def test_non_image_media_is_skipped(self):
+        product = self.create_product(None)
+        video = SimpleUploadedFile("clip.mp4", b"\x00\x00\x00\x18ftypmp42 not really a video")
+        media = ProductMedia.objects.create(product=product, media_type="video", file=video)
+        media = ProductMedia.objects.get(pk=media.pk)
+        # only the source is kept, so later saves do not try again
+        self.assertEqual(media.image_variants, {"source": media.file.name})
+        with mock.patch("store.images.build_variants") as build:
+            media.save()
+        build.assert_not_called()
+
+
+class MediaBlobTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name="Leather")
+
+    def create_product(self, image, name="Cuir"):
+        return Product.objects.create(category=self.category, name=name, description="", price="80.00", stock=1, image=image)
+
+    def refcount(self, name):
+        return MediaBlob.objects.get(name=name).refcount
+
+    def gc_media(self, *args):
+        out = io.StringIO()
+        call_command("gc_media", *args, stdout=out)
+        return out.getvalue()
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.create_product(self.image_upload("a.jpg"))
+        second = self.create_product(self.image_upload("b.jpg"), name="Cuir II")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith("blobs/"))
+        self.assertEqual(MediaBlob.objects.filter(name=first.image.name).count(), 1)
+        self.assertEqual(self.refcount(first.image.name), 2)
+
+    def test_replacing_an_image_releases_its_reference(self):
+        product = self.create_product(self.image_upload())
+        old_name = product.image.name
+        product.image = self.image_upload("new.jpg", color=(10, 10, 10))
+        product.save()
+        self.assertEqual(self.refcount(old_name), 0)
+        self.assertEqual(self.refcount(product.image.name), 1)
+
+    def test_deleting_a_record_releases_its_references(self):
+        keep = self.create_product(self.image_upload())
+        gone = self.create_product(self.image_upload(), name="Cuir II")
+        variant = Product.objects.get(pk=gone.pk).image_variants["thumb"]["webp"]
+        self.assertEqual(self.refcount(variant), 2)
+        gone.delete()
+        self.assertEqual(self.refcount(keep.image.name), 1)
+        self.assertEqual(self.refcount(variant), 1)
+
+    def test_gc_media_keeps_new_orphans_and_dry_run_deletes_nothing(self):
+        product = self.create_product(self.image_upload())
+        name = product.image.name
+        product.delete()
+        self.assertEqual(self.refcount(name), 0)
+
+        # inside the grace window: an upload whose record is not saved yet
+        self.assertIn("Would remove 0 blobs", self.gc_media("--dry-run"))
+
+        MediaBlob.objects.update(created_at=timezone.now() - datetime.timedelta(hours=2))
+        output = self.gc_media("--dry-run")
+        self.assertNotIn("Would remove 0 blobs", output)
+        self.assertTrue(media_storage.exists(name))
+        self.assertTrue(MediaBlob.objects.filter(name=name).exists())
+
+        self.gc_media()
+        self.assertFalse(media_storage.exists(name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_gc_media_spares_blobs_uploaded_again_meanwhile(self):
+        first = self.create_product(self.image_upload("a.jpg"))
+        second = self.create_product(self.image_upload("b.jpg", color=(10, 10, 10)), name="Cuir II")
+        names = [first.image.name, second.image.name]
+        Product.objects.filter(pk__in=[first.pk, second.pk]).delete()
+        MediaBlob.objects.update(created_at=timezone.now() - datetime.timedelta(hours=2))
+
+        delete_blob = media_storage.delete_blob
+        reuploaded = []
+
+        def delete_then_reupload(name):
+            delete_blob(name)
+            if not reuploaded:
+                # the same bytes as the second image arrive while gc runs
+                reuploaded.append(media_storage.save("again.jpg", self.image_upload("again.jpg", color=(10, 10, 10))))
+
+        with mock.patch.object(media_storage, "delete_blob", side_effect=delete_then_reupload):
+            self.gc_media("--grace-minutes", "60")
+        self.assertEqual(reuploaded, [names[1]])
+        self.assertFalse(media_storage.exists(names[0]))
+        self.assertTrue(media_storage.exists(names[1]))
+        self.assertEqual(self.refcount(names[1]), 1)
+
+    def test_upload_rewrites_the_file_of_a_collected_blob(self):
+        product = self.create_product(self.image_upload())
+        name = product.image.name
+        with media_storage.open(name, "rb") as file:
+            content = file.read()
+        # gc deleted the row; the file it was about to unlink is still there
+        MediaBlob.objects.filter(name=name).delete()
+        with open(media_storage.path(name), "wb") as file:
+            file.write(b"truncated")
+
+        self.assertEqual(media_storage.save("again.jpg", self.image_upload()), name)
+        self.assertEqual(self.refcount(name), 1)
+        with media_storage.open(name, "rb") as file:
+            self.assertEqual(file.read(), content)
+
+    def test_gc_media_keeps_referenced_blobs_and_fixes_refcounts(self):
+        product = self.create_product(self.image_upload())
+        MediaBlob.objects.update(refcount=0, created_at=timezone.now() - datetime.timedelta(hours=2))
+        self.assertIn("Removed 0 blobs", self.gc_media())
+        self.assertTrue(media_storage.exists(product.image.name))
+        self.assertEqual(self.refcount(product.image.name), 1)
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        cases = {
+            "bytes=0-99": (0, 99),
+            "bytes=900-": (900, 999),
+            "bytes=-100": (900, 999),
+            "bytes=-5000": (0, 999),
+            "bytes=990-5000": (990, 999),
+            # unsatisfiable: 416
+            "bytes=1000-": False,
+            "bytes=5-2": False,
+            "bytes=-0": False,
+            # not a single byte range: ignored, full response
+            "bytes=-": None,
+            "bytes=0-1,5-6": None,
+            "items=0-9": None,
+            "": None,
+        }
+        for header, expected in cases.items():
+            with self.subTest(header):
+                self.assertEqual(parse_range(header, 1000), expected)
+
+
+class MediaServingTests(MediaRootMixin, TestCase):
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        # a file saved before the blob storage, served under its own name
+        os.makedirs(media_storage.path("videos"))
+        with open(media_storage.path("videos/clip.mp4"), "wb") as file:
+            file.write(self.content)
+        self.url = "/media/videos/clip.mp4"
+        self.etag = self.client.get(self.url)["ETag"]
+
+    def body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_full_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Type"], "video/mp4")
+
+    def test_byte_ranges(self):
+        size = len(self.content)
+        for header, (start, end) in {"bytes=10-19": (10, 19), "bytes=10000-": (10000, size - 1), "bytes=-16": (size - 16, size - 1)}.items():
+            with self.subTest(header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/{size}")
+                self.assertEqual(response["Content-Length"], str(end - start + 1))
+                self.assertEqual(self.body(response), self.content[start:end + 1])
+
+    def test_unsatisfiable_range_is_416(self):
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.content)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.content)}")
+
+    def test_if_range(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=self.etag)
+        self.assertEqual(response.status_code, 206)
+        # the client's copy is outdated: send the whole file instead of a piece
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_if_none_match_is_304(self):
+        for header in (self.etag, f'"other", {self.etag}', "*"):
+            with self.subTest(header):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], self.etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_blobs_are_cached_for_good(self):
+        name = media_storage.save("clip.mp4", ContentFile(self.content))
+        response = self.client.get("/media/" + name)
+        self.assertEqual(response["ETag"], f'"{name.split("/")[-1].split(".")[0]}"')
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertNotIn("immutable", self.client.get(self.url)["Cache-Control"])
+
+    def test_paths_outside_media_root_are_404(self):
+        request = RequestFactory().get("/media/")
+        for path in ("../manage.py", "videos/../../manage.py", "/etc/passwd", "videos/missing.mp4"):
+            with self.subTest(path), self.assertRaises(Http404):
+                serve_media(request, path)
+
+
+class CatalogImportExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Floral")
+        cls.product = Product.objects.create(category=cls.category, brand="Ajmal", name="Jasmine", description="White", price="30.00", stock=5)
+        cls.admin = CustomUser.objects.create_user(username="admin", email="admin@example.com", password="pass", is_superuser=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def rows(self, text, file_format="csv"):
+        return catalog_io.read_rows(io.BytesIO(text.encode("utf-8")), file_format)
+
+    def test_errors_are_reported_per_row(self):
+        result = catalog_io.import_products(self.rows(
+            "name,description,price,stock,category\n"
+            "Gardenia,Creamy,45.00,3,floral\n"
+            ",No name,10,1,floral\n"
+            "Tuberose,Heady,cheap,-1,floral\n"
+            "Lily,Green,12,1,citrus\n"
+        ))
+        self.assertEqual((result.created, result.updated, result.error_count), (1, 0, 3))
+        self.assertEqual(result.errors, [
+            {"row": 3, "errors": {"name": "This field is required."}},
+            {"row": 4, "errors": {"price": "A valid price is required.", "stock": "Must be a non-negative integer."}},
+            {"row": 5, "errors": {"category": 'Unknown category "citrus".'}},
+        ])
+        self.assertTrue(Product.objects.filter(name="Gardenia", category=self.category).exists())
+        self.assertFalse(Product.objects.filter(name__in=["Tuberose", "Lily"]).exists())
+
+    def test_jsonl_errors_keep_line_numbers(self):
+        result = catalog_io.import_products(self.rows(
+            '{"name": "Iris", "description": "Powdery", "price": 50, "stock": 2, "category": "floral"}\n'
+            "not json\n"
+            "[1, 2]\n",
+            "jsonl",
+        ))
+        self.assertEqual(result.created, 1)
+        self.assertEqual([error["row"] for error in result.errors], [2, 3])
+
+    def test_rows_with_an_id_update_in_place(self):
+        result = catalog_io.import_products(self.rows(
+            "id,price,available\n"
+            f"{self.product.pk},35.50,false\n"
+            "999999,10,true\n"
+        ))
+        self.assertEqual((result.created, result.updated), (0, 1))
+        self.assertEqual([error["row"] for error in result.errors], [3])
+        self.assertEqual(result.errors[0]["errors"]["id"], "Unknown product id.")
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.price, product.available), (Decimal("35.50"), False))
+        # columns left out keep their values
+        self.assertEqual((product.name, product.stock, product.brand), ("Jasmine", 5, "Ajmal"))
+
+    def test_import_is_written_chunk_by_chunk(self):
+        lines = ["name,description,price,stock,category"]
+        lines += [f"Bloom {n},Petals,{n}.00,1,floral" for n in range(5)]
+        lines.insert(4, "Broken,Petals,,1,floral")
+        with mock.patch.object(Product.objects, "bulk_create", wraps=Product.objects.bulk_create) as bulk_create:
+            result = catalog_io.import_products(self.rows("\n".join(lines) + "\n"), chunk_size=2)
+        self.assertEqual(bulk_create.call_count, 3)
+        self.assertEqual(result.created, 5)
+        self.assertEqual(result.errors, [{"row": 5, "errors": {"price": "This field is required."}}])
+        # bulk writes skip post_save; the import indexes them itself
+        self.assertEqual(len(self.client.get("/api/products/search/", {"q": "bloom"}).data["results"]), 5)
+
+    def test_dry_run_writes_nothing(self):
+        result = catalog_io.import_products(self.rows("name,description,price,stock,category\nRose,Red,9,1,floral\n"), dry_run=True)
+        self.assertEqual(result.created, 1)
+        self.assertFalse(Product.objects.filter(name="Rose").exists())
+
+    def test_upload_endpoint(self):
+        upload = SimpleUploadedFile("catalog.csv", b"name,description,price,stock,category\nNeroli,Bright,20,4,floral\n")
+        response = self.client.post("/api/products/import/", {"file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 1)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post("/api/products/import/", {}, format="multipart").status_code, 401)
+
+    def test_export_streams_csv_and_jsonl(self):
+        response = self.client.get("/api/products/export/")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(rows, [{
+            "id": str(self.product.pk), "brand": "Ajmal", "name": "Jasmine", "description": "White",
+            "price": "30.00", "stock": "5", "available": "True", "category": "floral",
+        }])
+
+        response = self.client.get("/api/products/export/", {"output": "jsonl"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["name"] for line in lines], ["Jasmine"])
+
+    def test_large_export_is_yielded_in_pieces_and_reimports(self):
+        Product.objects.bulk_create([
+            Product(category=self.category, name=f"Bouquet {n}", description="notes " * 700, price="15.00", stock=1)
+            for n in range(40)
+        ])
+        pieces = list(catalog_io.export_rows("csv"))
+        self.assertGreater(len(pieces), 1)
+        result = catalog_io.import_products(self.rows("".join(pieces)))
+        self.assertEqual((result.created, result.updated, result.error_count), (0, 41, 0))
+
+
+class ProductDetailExpandTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Oud")
+        cls.product = Product.objects.create(
+            category=cls.category, brand="Amouage", name="Interlude",
+            description="Smoky", price="250.00", stock=5,
+        )
+        for _ in range(3):
+            ProductMedia.objects.create(product=cls.product, media_type="image")
+        cls.user = CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass")
+        Wishlist.objects.create(user=cls.user, product=cls.product)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = f"/api/view-product/{self.product.pk}/"
+
+    def test_expanded_detail_query_count(self):
+        self.client.force_authenticate(self.user)
+        # Last-Modified lookup (shared with the ETag), wishlist state for the
+        # ETag, product joined with category and wishlist state, media prefetch
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, {"expand": "media,category,wishlist"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["category_detail"]["name"], "Oud")
+        self.assertEqual([m["id"] for m in response.data["media"]],
+                         list(self.product.media.order_by("id").values_list("id", flat=True)))
+        self.assertTrue(response.data["in_wishlist"])
+
+    def test_query_count_does_not_grow_with_media(self):
+        ProductMedia.objects.bulk_create(ProductMedia(product=self.product) for _ in range(20))
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {"expand": "media,category,wishlist"})
+        self.assertEqual(len(response.data["media"]), 23)
+        self.assertFalse(response.data["in_wishlist"])
+
+    def test_plain_detail_is_unchanged(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("media", response.data)
+        self.assertNotIn("in_wishlist", response.data)
+
+    def test_unknown_expansion_is_rejected(self):
+        response = self.client.get(self.url, {"expand": "reviews"})
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Musk")
+        Product.objects.create(category=category, name="White Musk", description="Clean", price="40.00", stock=2)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_fields_limits_response_and_columns(self):
+        # ETag state + the list
+        with self.assertNumQueries(2) as queries:
+            response = self.client.get("/api/products/", {"fields": "id,name,price"})
+        self.assertEqual(list(response.data[0]), ["id", "name", "price"])
+        self.assertNotIn("description", queries.captured_queries[1]["sql"])
+        self.assertNotIn("store_category", queries.captured_queries[1]["sql"])
+
+    def test_omit_drops_fields(self):
+        response = self.client.get("/api/products/", {"omit": "description,category_detail"})
+        self.assertNotIn("description", response.data[0])
+        self.assertNotIn("category_detail", response.data[0])
+        self.assertIn("image_variants", response.data[0])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get("/api/products/", {"fields": "id,cost"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    def test_matches_stock_json_renderer(self):
+        data = {
+            "price": Decimal("1249.50"),
+            "created_at": timezone.now(),
+            "naive": datetime.datetime(2024, 1, 1, 10, 30, 15, 123456),
+            "date": datetime.date(2024, 1, 1),
+            "elapsed": datetime.timedelta(minutes=5),
+            "token": uuid.uuid4(),
+            1: "non-string key",
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parser_round_trip_and_errors(self):
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO(b'{"quantity": 2, "note": "gift"}')), {"quantity": 2, "note": "gift"})
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"quantity": '))
+
+
+class CoOccurrenceTests(SimpleTestCase):
+    def test_counts_each_order_once_per_pair(self):
+        # order 1: products 10, 20, 20 (duplicate line); order 2: 10, 20, 30; order 3: 30 alone
+        products, others, counts = co_occurrence([1, 1, 1, 2, 2, 2, 3], [10, 20, 20, 10, 20, 30, 30])
+        pairs = dict(zip(zip(products.tolist(), others.tolist()), counts.tolist()))
+        self.assertEqual(pairs, {
+            (10, 20): 2, (20, 10): 2,
+            (10, 30): 1, (30, 10): 1,
+            (20, 30): 1, (30, 20): 1,
+        })
+
+    def test_single_item_orders_give_nothing(self):
+        products, _, _ = co_occurrence([1, 2], [10, 10])
+        self.assertEqual(len(products), 0)
+
+
+class RelatedProductsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Gift sets")
+        cls.oud, cls.musk, cls.rose, cls.amber = (
+            Product.objects.create(category=category, name=name, description="", price="20.00", stock=50)
+            for name in ("Oud", "Musk", "Rose", "Amber")
+        )
+        cls.user = CustomUser.objects.create_user(username="gifter", email="gifter@example.com", password="pass")
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def order(self, *products, status="Paid"):
+        order = Order.objects.create(user=self.user, amount="20.00", status=status)
+        OrderItem.objects.bulk_create(OrderItem(order=order, product=product, quantity=1, price="20.00") for product in products)
+        return order
+
+    def related(self, product):
+        return list(RelatedProduct.objects.filter(product=product).values_list("related_id", "score"))
+
+    def test_paid_orders_update_related_rows(self):
+        self.order(self.oud, self.musk)
+        self.order(self.oud, self.musk, self.rose)
+        self.order(self.oud, self.amber, status="Pending")  # not placed, not counted
+        self.assertEqual(update_co_purchases(), (2, 3))
+        self.assertEqual(self.related(self.oud), [(self.musk.pk, 2), (self.rose.pk, 1)])
+
+        # only new orders are folded in, and the lists are re-ranked
+        self.order(self.oud, self.rose)
+        self.order(self.oud, self.rose)
+        self.assertEqual(update_co_purchases(), (2, 2))
+        self.assertEqual(self.related(self.oud), [(self.rose.pk, 3), (self.musk.pk, 2)])
+        self.assertEqual(update_co_purchases(), (0, 0))
+
+    def test_endpoint_lists_top_n_in_rank_order(self):
+        self.order(self.oud, self.musk, self.rose)
+        self.order(self.oud, self.rose, self.amber)
+        update_co_purchases(n=2)
+        # rose (2 orders) first, then the lower id of the tied musk and amber
+        response = self.client.get(f"/api/products/{self.oud.pk}/related/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["id"] for item in response.data], [self.rose.pk, self.musk.pk])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/products/{self.amber.pk}/related/", {"fields": "id"})
+        self.assertEqual(response.data, [{"id": self.oud.pk}, {"id": self.rose.pk}])
+
+    def test_unknown_product(self):
+        self.assertEqual(self.client.get(f"/api/products/{self.oud.pk}/related/").data, [])
+        self.assertEqual(self.client.get("/api/products/999999/related/").status_code, 404)
+        self.assertEqual(self.client.get("/api/products/abc/related/").status_code, 404)
+
+
+class TfidfIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = TfidfIndex([11, 12, 13, 14], [
+            product_terms("smoky oud with amber and leather", "Amouage", "Attar"),
+            product_terms("fresh citrus bergamot and lemon", "Dior", "Eau de Toilette"),
+            product_terms("oud, amber and smoky incense", "Amouage", "Attar"),
+            product_terms("lemon and neroli, bright citrus", "Chanel", "Eau de Toilette"),
+        ], dense_terms=2)
+
+    def test_similarities_are_cosines(self):
+        scores = self.index.similarities([0, 1, 2, 3])
+        for row in range(4):
+            self.assertAlmostEqual(float(scores[row, row]), 1.0, places=5)
+        self.assertAlmostEqual(float(scores[0, 2]), float(scores[2, 0]), places=5)
+
+    def test_neighbours_rank_shared_notes_first(self):
+        neighbours = dict(self.index.neighbours([0, 1], n=1))
+        self.assertEqual([other for other, _ in neighbours[0]], [2])
+        self.assertEqual([other for other, _ in neighbours[1]], [3])
+
+
+class SimilarProductsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.attar = Category.objects.create(name="Attar")
+        self.fresh = Category.objects.create(name="Eau de Toilette")
+
+    def create(self, name, description, category, brand=""):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(category=category, brand=brand, name=name, description=description, price="30.00", stock=1)
+
+    def similar_ids(self, product):
+        response = self.client.get(f"/api/products/{product.pk}/similar/")
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.data]
+
+    def test_saving_refreshes_neighbours(self):
+        smoky = self.create("Smoky", "smoky oud with amber and leather", self.attar, "Amouage")
+        citrus = self.create("Citrus", "fresh citrus bergamot and lemon", self.fresh, "Dior")
+        incense = self.create("Incense", "oud, amber and smoky incense", self.attar, "Amouage")
+        neroli = self.create("Neroli", "lemon and neroli, bright citrus", self.fresh, "Chanel")
+        self.assertEqual(self.similar_ids(smoky)[0], incense.pk)
+        self.assertEqual(self.similar_ids(citrus)[0], neroli.pk)
+
+        # a new text moves the product into other lists, and out of its old ones
+        citrus.description = "smoky oud, amber, leather and incense"
+        citrus.category = self.attar
+        with self.captureOnCommitCallbacks(execute=True):
+            citrus.save()
+        self.assertIn(citrus.pk, self.similar_ids(smoky)[:2])
+        self.assertNotEqual(self.similar_ids(neroli)[:1], [citrus.pk])
+
+    def test_saves_that_keep_the_text_do_not_refresh(self):
+        product = self.create("Smoky", "smoky oud", self.attar)
+        product = Product.objects.get(pk=product.pk)
+        product.price = "35.00"
+        with mock.patch("store.similarity.refresh_similar_products") as refresh, self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        refresh.assert_not_called()
+
+    @override_settings(SIMILAR_PRODUCTS_SYNC_LIMIT=1)
+    def test_big_catalogs_are_left_to_the_scheduled_rebuild(self):
+        first = self.create("Smoky", "smoky oud", self.attar)
+        with mock.patch("store.similarity.refresh_similar_products") as refresh:
+            incense = self.create("Incense", "smoky oud incense", self.attar)
+            self.create("Citrus", "fresh lemon", self.fresh)
+        refresh.assert_not_called()
+        self.assertEqual(self.similar_ids(first), [])
+        call_command("rebuild_similar_products", stdout=io.StringIO())
+        self.assertEqual(self.similar_ids(first)[0], incense.pk)
+
+    def test_bulk_import_refreshes_neighbours(self):
+        smoky = self.create("Smoky", "smoky oud with amber and leather", self.attar)
+        self.create("Citrus", "fresh citrus bergamot and lemon", self.fresh)
+        rows = catalog_io.read_rows(io.BytesIO(
+            b"name,description,price,stock,category\n"
+            b"Incense,\"oud, amber and smoky incense\",20,1,attar\n"
+        ), "csv")
+        catalog_io.import_products(rows)
+        incense = Product.objects.get(name="Incense")
+        self.assertEqual(self.similar_ids(smoky)[0], incense.pk)
+        self.assertEqual(self.similar_ids(incense)[0], smoky.pk)
+
+    def test_unknown_product(self):
+        product = self.create("Lonely", "vetiver", self.attar)
+        self.assertEqual(self.similar_ids(product), [])
+        self.assertEqual(self.client.get("/api/products/999999/similar/").status_code, 404)
+        self.assertEqual(self.client.get("/api/products/abc/similar/").status_code, 404)
+
+
+class PopularSortTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Attar")
+        cls.quiet, cls.wished, cls.sold = (
+            Product.objects.create(category=category, name=name, description="Oud", price="30.00", stock=9)
+            for name in ("Quiet", "Wished", "Sold")
+        )
+        cls.user = CustomUser.objects.create_user(username="fan", email="fan@example.com", password="pass")
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def place_order(self, product, quantity):
+        order = Order.objects.create(user=self.user, amount="30.00")
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, price="30.00")
+        order.status = "Paid"
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        return order
+
+    def ids(self, response):
+        data = response.data["results"] if isinstance(response.data, dict) else response.data
+        return [item["id"] for item in data]
+
+    def test_sales_and_wishlists_drive_the_order(self):
+        Wishlist.objects.create(user=self.user, product=self.wished)
+        self.place_order(self.sold, 2)
+        expected = [self.sold.pk, self.wished.pk, self.quiet.pk]
+        self.assertEqual(self.ids(self.client.get("/api/products/", {"sort": "popular"})), expected)
+        self.assertEqual(self.ids(self.client.get("/api/view-products/", {"sort": "popular", "page_size": 2})), expected[:2])
+        self.assertEqual(ProductPopularity.objects.get(pk=self.sold.pk).units_sold, 2)
+
+    def test_cancelling_uncounts_the_sale(self):
+        order = self.place_order(self.sold, 1)
+        order.status = "Cancelled"
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        row = ProductPopularity.objects.get(pk=self.sold.pk)
+        self.assertEqual((row.units_sold, row.score), (0, 0))
+
+    def test_rebuild_matches_incremental_scores(self):
+        self.place_order(self.sold, 3)
+        Wishlist.objects.create(user=self.user, product=self.sold)
+        before = {row.pk: (row.units_sold, row.wishlist_count, row.score) for row in ProductPopularity.objects.all()}
+        rebuild_popularity()
+        for row in ProductPopularity.objects.all():
+            units, wishlists, score = before[row.pk]
+            self.assertEqual((row.units_sold, row.wishlist_count), (units, wishlists))
+            self.assertAlmostEqual(row.score, score, delta=1e-9 * max(score, 1))
+
+    def test_old_epoch_is_moved_up_and_scores_rescaled(self):
+        now = timezone.now()
+        old_epoch = now - datetime.timedelta(days=2 * 365)
+        PopularityEpoch.objects.create(pk=1, epoch=old_epoch)
+        ProductPopularity.objects.filter(pk=self.sold.pk).update(score=decay_weight(now, old_epoch))
+        ProductPopularity.objects.filter(pk=self.wished.pk).update(score=2 * decay_weight(now, old_epoch))
+
+        with mock.patch("store.popularity.timezone.now", return_value=now):
+            Wishlist.objects.create(user=self.user, product=self.quiet, added_at=now)
+
+        self.assertEqual(PopularityEpoch.objects.get().epoch, now)
+        scores = dict(ProductPopularity.objects.values_list("pk", "score"))
+        # measured from `now`, activity at `now` weighs exactly its weight
+        self.assertAlmostEqual(scores[self.sold.pk], 1.0)
+        self.assertAlmostEqual(scores[self.wished.pk], 2.0)
+        self.assertAlmostEqual(scores[self.quiet.pk], WISHLIST_WEIGHT)
+
+    def test_scores_do_not_overflow_decades_on(self):
+        later = timezone.now() + datetime.timedelta(days=60 * 365)
+        with self.assertRaises(OverflowError):
+            decay_weight(later, INITIAL_EPOCH)
+        with mock.patch("store.popularity.timezone.now", return_value=later):
+            Wishlist.objects.create(user=self.user, product=self.wished, added_at=later)
+        self.assertAlmostEqual(ProductPopularity.objects.get(pk=self.wished.pk).score, WISHLIST_WEIGHT)
+
+
+class BasketStockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Rose")
+        cls.product = Product.objects.create(category=category, name="Taif Rose", description="Rose", price="80.00", stock=3)
+        cls.user = CustomUser.objects.create_user(username="shopper", email="shopper@example.com", password="pass")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def stock(self):
+        self.product.refresh_from_db(fields=["stock"])
+        return self.product.stock
+
+    def add(self):
+        return self.client.post(f"/api/basket-items/{self.product.pk}/add-to-cart/")
+
+    def test_add_reserves_until_sold_out(self):
+        for _ in range(3):
+            self.assertEqual(self.add().status_code, 201)
+        response = self.add()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "No more stock available"})
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(BasketItem.objects.get().quantity, 3)
+
+    def test_update_quantity_moves_the_difference(self):
+        item_id = self.add().data["id"]
+        url = f"/api/basket-items/{item_id}/update-quantity/"
+        self.assertEqual(self.client.patch(url, {"quantity": 3}).data["quantity"], 3)
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(self.client.patch(url, {"quantity": 4}).status_code, 400)
+        self.client.patch(url, {"quantity": 1})
+        self.assertEqual(self.stock(), 2)
+
+    def test_remove_restocks_once(self):
+        self.add()
+        item_id = self.add().data["id"]
+        for _ in range(2):
+            response = self.client.delete(f"/api/basket-items/{item_id}/remove-from-cart/")
+            self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.stock(), 3)
+
+    def test_expired_reservations_are_released(self):
+        item_id = self.add().data["id"]
+        self.add()
+        BasketItem.objects.filter(pk=item_id).update(reserved_until=timezone.now() - datetime.timedelta(minutes=1))
+        result = release_expired()
+        self.assertEqual(result.as_dict(), {"items": 1, "units": 2, "products": 1})
+        self.assertEqual(self.stock(), 3)
+        self.assertFalse(BasketItem.objects.get(pk=item_id).is_active)
+        self.assertEqual(release_expired().items, 0)
+
+    def test_carts_awaiting_payment_keep_their_stock(self):
+        self.add()
+        self.add()
+        order = Order.objects.create(user=self.user, amount="160.00", status="Pending")
+        expired = timezone.now() - datetime.timedelta(minutes=1)
+        BasketItem.objects.update(reserved_until=expired)
+
+        # the customer is still paying: nothing goes back on sale
+        self.assertEqual(release_expired().items, 0)
+        self.assertEqual(self.stock(), 1)
+        # the payment then lands on the items still in the cart
+        self.assertEqual(BasketItem.objects.filter(is_active=True, is_order_placed=False).count(), 1)
+
+        # an abandoned checkout is released once the hold is over
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - datetime.timedelta(days=2))
+        self.assertEqual(release_expired().as_dict(), {"items": 1, "units": 2, "products": 1})
+        self.assertEqual(self.stock(), 3)
+
+    def test_batch_is_all_or_nothing(self):
+        other = Product.objects.create(category=self.product.category, name="Oud Rose", description="", price="90.00", stock=1)
+        url = "/api/basket-items/batch/"
+        response = self.client.post(url, [{"product": self.product.pk, "quantity": 2}, {"product": other.pk, "quantity": 2}], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["unavailable"], [{"product": other.pk, "requested": 2, "available": 1}])
+        self.assertEqual(self.stock(), 3)
+
+        with self.assertNumQueries(12):
+            response = self.client.post(url, {"items": [
+                {"product": self.product.pk, "quantity": 2},
+                {"product": other.pk},
+                {"product": self.product.pk, "quantity": 1, "action": "set"},
+            ]}, format="json")
+        self.assertEqual(sorted((item["product"]["id"], item["quantity"]) for item in response.data), [(self.product.pk, 1), (other.pk, 1)])
+        self.assertEqual(self.stock(), 2)
+
+    def test_view_cart_is_one_query(self):
+        other = Product.objects.create(category=self.product.category, name="Musk", description="", price="12.25", stock=5)
+        self.client.post("/api/basket-items/batch/", [{"product": self.product.pk, "quantity": 2}, {"product": other.pk, "quantity": 3}], format="json")
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/basket-items/view-cart/", {"totals": "true"})
+        self.assertEqual(response.data["totals"], {"total": "196.75", "items": 2, "units": 5})
+        self.assertEqual([item["item_total"] for item in response.data["results"]], ["160.00", "36.75"])
+        basket = BasketItem.objects.first().basket_object
+        with self.assertNumQueries(1):
+            self.assertEqual(basket.totals()["total"], Decimal("196.75"))
+
+
+class GuestCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Amber")
+        cls.product = Product.objects.create(category=category, name="Amber Noir", description="", price="55.00", stock=4)
+        cls.user = CustomUser.objects.create_user(username="guest", email="guest@example.com", password="pass-1234")
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_guest_cart_writes_nothing_until_login(self):
+        self.assertFalse(Basket.objects.exists())
+        with self.assertNumQueries(3) as queries:
+            response = self.client.post("/api/guest-cart/", [{"product": self.product.pk, "quantity": 3}], format="json")
+        self.assertTrue(all(query["sql"].startswith("SELECT") for query in queries.captured_queries))
+        self.assertEqual(response.data["totals"], {"total": "165.00", "items": 1, "units": 3})
+        self.assertEqual(self.client.get("/api/guest-cart/").data["totals"]["units"], 3)
+
+        response = self.client.post("/api/login/", {"email": "guest@example.com", "password": "pass-1234"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies["guest_cart"].value, "")
+        item = BasketItem.objects.get(basket_object__owner=self.user)
+        self.assertEqual((item.product_object_id, item.quantity), (self.product.pk, 3))
+        self.product.refresh_from_db(fields=["stock"])
+        self.assertEqual(self.product.stock, 1)
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.cookies["guest_cart"] = '{"1":5}'
+        self.assertEqual(self.client.get("/api/guest-cart/").data["results"], [])
@@ -33,6 +33,7 @@ from .views import (
     OrderDetailsViewSet,
     MyOrdersViewSet,
     HeroSectionViewSet,
+    GuestCartView,
 )
 from payment.views import InvoiceViewSet
 
@@ -60,6 +61,9 @@ urlpatterns = [
     path('login/', login_view, name='login'),
     path('admin-login/', admin_login_view, name='admin-login'),
 
+    # Cart for visitors who are not logged in (signed cookie)
+    path('guest-cart/', GuestCartView.as_view(), name='guest-cart'),
+
     # Contact form API
     # path('contact/', ContactView.as_view(), name='contact'),
 
@@ -101,6 +105,7 @@ urlpatterns = [
 
     #############################ADMIN DASHBOARD####################################
     path('dashboard-stats/',dashboard_stats, name='dashboard_stats'),
+    path('catalog-cache-stats/', views.catalog_cache_stats, name='catalog_cache_stats'),
 
     path("forgot-password/",views.forgot_password,name="forgot_password"),
     path("request-reset-password/",views.request_password_reset,name="request_reset_password"),
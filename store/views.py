@@ -1,4 +1,5 @@
 import datetime
+from decimal import Decimal
 from itertools import product
 from random import random
 import string
@@ -17,7 +18,8 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.generics import RetrieveAPIView, CreateAPIView,ListAPIView, DestroyAPIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from django.db.models import Sum, Count
+from django.db import transaction
+from django.db.models import F, Sum, Count
 from django.db.models.functions import TruncMonth
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.permissions import IsAdminUser, IsAuthenticated,AllowAny
@@ -29,20 +31,29 @@ from store.models import (
     Category, CustomUser, Product, Contact,
     Order, OrderItem,
     Basket, BasketItem, ProductMedia,Wishlist,PasswordReset,EmailVerificationCode,OTPVerification,
-    HeroSection
+    HeroSection, RelatedProduct, SimilarProduct
 )
 from payment.models import Invoice            
 
 from store.serializers import (
     CategorySerializer, ProductSerializer, ContactSerializer,
     UserRegistrationSerializer, OrderSerializer, OrderItemSerializer,
-    CartItemSerializer, ProductMediaSerializer,WishListSerializer,
+    CartItemSerializer, CartBatchSerializer, ProductMediaSerializer,WishListSerializer,
     CustomUserSerializer,
-    HeroSectionSerializer
+    HeroSectionSerializer, ProductDetailSerializer, parse_expand
 )
 from payment.serializers import InvoiceSerializer   
 
 from store.forms import ProductForm
+from store import cart, catalog_io, guest_cart, inventory, reservations
+from store.cache import (
+    CatalogCacheMixin, cache_stats,
+    product_detail_etag, product_last_modified, product_list_etag,
+)
+from store.fieldsets import SparseFieldsetMixin, fieldset_from_request, prune_queryset
+from store.facets import TRUE_VALUES, apply_filters, facet_counts, parse_filters
+from store.pagination import ProductCursorPagination, ProductSearchPagination
+from store.search import ProductSearchResults
 from store.utils import render_to_pdf,send_mail
 from django.core.mail import send_mail
 from rest_framework import status
@@ -51,8 +62,11 @@ from .utils import generate_otp, send_verification_email
 from datetime import timedelta
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.utils.decorators import method_decorator
+from django.utils.cache import patch_vary_headers
 
 
 
@@ -60,7 +74,7 @@ User=get_user_model()
 # -------------------------------------------
 # CATEGORY / PRODUCT / CONTACT API
 # -------------------------------------------
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     parser_classes = [MultiPartParser, FormParser]
@@ -77,26 +91,131 @@ class CategoryViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"])
     def products(self, request, pk=None):
         category = self.get_object()
-        products = Product.objects.filter(category=category)
-        serializer = ProductSerializer(products, many=True)
+        fieldset = fieldset_from_request(request)
+        products = Product.objects.for_catalog().filter(category=category)
+        if fieldset:
+            products = prune_queryset(products, ProductSerializer(**fieldset))
+        paginator = ProductCursorPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        if page is not None:
+            serializer = ProductSerializer(page, many=True, **fieldset)
+            return paginator.get_paginated_response(serializer.data)
+        products = paginator.order_queryset(products, request)
+        serializer = ProductSerializer(products, many=True, **fieldset)
         return Response(serializer.data)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class ProductViewSet(CatalogCacheMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.for_catalog()
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+    fieldset_actions = ("list", "retrieve", "search", "related", "similar")
+    catalog_cache_tracks_stock = True
+    # non-numeric ids 404 in the router instead of failing in filter(product_id=...)
+    lookup_value_regex = r"\d+"
 
     def get_permissions(self):
         """
         Allow everyone (authenticated) to view products,
         but only superusers can create, update, or delete.
         """
-        if self.action in ["list", "retrieve"]:  # GET requests
+        if self.action in ["list", "retrieve", "search", "related", "similar"]:  # GET requests
             permission_classes = [permissions.AllowAny]  # anyone can view
         else:  # POST, PATCH, PUT, DELETE
             permission_classes = [permissions.IsAuthenticated, IsSuperUser]
         return [permission() for permission in permission_classes]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            # ?brand=a,b&category=1,2&min_price=&max_price=&available=true
+            self.filters = parse_filters(self.request.query_params)
+            queryset = apply_filters(queryset, self.filters)
+            # ?sort=popular|price|-price|... without a cursor/page_size
+            queryset = self.paginator.order_queryset(queryset, self.request)
+        return queryset
+
+    def uncached_list(self, request, *args, **kwargs):
+        response = super().uncached_list(request, *args, **kwargs)
+        if request.query_params.get("facets", "").lower() in TRUE_VALUES:
+            facets = facet_counts(Product.objects.all(), self.filters)
+            if isinstance(response.data, list):
+                response.data = {"results": response.data, "facets": facets}
+            else:
+                response.data["facets"] = facets
+        return response
+
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Admin only. Upsert products from an uploaded CSV or JSONL `file`
+        (columns: id, brand, name, description, price, stock, available,
+        category slug or id). Rows with an id update, rows without create.
+        """
+        upload = request.FILES.get("file")
+        if not upload:
+            return Response({"error": "Upload a CSV or JSONL file as 'file'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = request.data.get("input") or catalog_io.detect_format(upload.name)
+        if file_format not in catalog_io.FORMATS:
+            return Response({"error": "input must be csv or jsonl"}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = str(request.data.get("dry_run", "")).lower() in TRUE_VALUES
+        result = catalog_io.import_products(catalog_io.read_rows(upload.file, file_format), dry_run=dry_run)
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """Admin only. Stream the whole catalog as ?output=csv (default) or ?output=jsonl."""
+        file_format = request.query_params.get("output", "csv")
+        if file_format not in catalog_io.FORMATS:
+            return Response({"error": "output must be csv or jsonl"}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type = "text/csv" if file_format == "csv" else "application/x-ndjson"
+        response = StreamingHttpResponse(catalog_io.export_rows(file_format), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="products.{file_format}"'
+        return response
+
+    @action(detail=True, methods=["get"])
+    def related(self, request, pk=None):
+        """Customers also bought, precomputed by the rebuild_related_products command."""
+        products = [
+            row.related
+            for row in RelatedProduct.objects.filter(product_id=pk).select_related("related__category")
+        ]
+        if not products and not Product.objects.filter(pk=pk).exists():
+            return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        serializer = self.get_serializer(products, many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=["get"])
+    def similar(self, request, pk=None):
+        """Similar scents by description, brand and category (see store.similarity)."""
+        products = [
+            row.similar
+            for row in SimilarProduct.objects.filter(product_id=pk).select_related("similar__category")
+        ]
+        if not products and not Product.objects.filter(pk=pk).exists():
+            return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        serializer = self.get_serializer(products, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """
+        Full-text search over name, brand, description and category name.
+        Results are ranked by relevance and paginated with ?page= / ?page_size=.
+        """
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({"error": "Query parameter 'q' is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = ProductSearchResults(query, queryset=self.get_queryset())
+        paginator = ProductSearchPagination()
+        page = paginator.paginate_queryset(results, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
 
 class ContactView(viewsets.ViewSet):
     def create(self, request):
@@ -132,12 +251,21 @@ def login_view(request):
 
   
         refresh = RefreshToken.for_user(user)
-        return Response({
+        response = Response({
             "message": "Login successful",
             "email": user.email,
             "access": str(refresh.access_token),
             "refresh": str(refresh)
         }, status=status.HTTP_200_OK)
+
+        # a cart filled before logging in moves into the user's basket
+        lines = guest_cart.read(request)
+        if lines:
+            dropped = guest_cart.merge_into_basket(user, lines)
+            if dropped:
+                response.data["cart_unavailable"] = dropped
+            guest_cart.write(response, {})
+        return response
     return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
 @api_view(['POST'])
@@ -217,6 +345,15 @@ def product_delete_view(request, pk):
 # -------------------------------------------
 # CART / BASKET API
 # -------------------------------------------
+def cart_totals(items):
+    """Totals of already fetched cart items (see BasketItemQuerySet.with_totals)."""
+    return {
+        'total': str(sum((item.item_total for item in items), Decimal(0)).quantize(Decimal('0.01'))),
+        'items': len(items),
+        'units': sum(item.quantity for item in items),
+    }
+
+
 class BasketItemViewSet(viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -226,70 +363,65 @@ class BasketItemViewSet(viewsets.ModelViewSet):
             basket_object__owner=self.request.user,
             is_active=True,
             is_order_placed=False
-        )
+        ).with_totals()
 
     def perform_create(self, serializer):
         basket, _ = Basket.objects.get_or_create(owner=self.request.user)
         serializer.save(basket_object=basket)
 
+    # Stock is reserved with conditional UPDATEs (store.inventory). Each
+    # transaction below starts with a write, so the rows it then reads are
+    # already locked (and SQLite has taken its write lock instead of failing
+    # to upgrade a read lock under contention).
     @action(detail=True, methods=['post'], url_path='add-to-cart')
     def add_to_cart(self, request, pk=None):
-        try:
-            product = Product.objects.get(pk=pk)
-        except Product.DoesNotExist:
+        if not Product.objects.filter(pk=pk).exists():
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        if product.stock < 1:
-            return Response({'error': 'Product is out of stock'}, status=status.HTTP_400_BAD_REQUEST)
-
         basket, _ = Basket.objects.get_or_create(owner=request.user)
+        in_basket = BasketItem.objects.filter(product_object_id=pk, basket_object=basket, is_order_placed=False)
 
-        item = BasketItem.objects.filter(
-            product_object=product,
-            basket_object=basket,
-            is_order_placed=False
-        ).first()
-
-        if item:
-            if not item.is_active:
-                item.is_active = True
-                item.quantity = 1
-                product.stock -= 1
-                product.save()
-            else:
-                if product.stock < 1:
+        with transaction.atomic():
+            # WHERE stock >= 1, so concurrent adds can never oversell
+            if not inventory.reserve_stock(pk, 1):
+                if in_basket.filter(is_active=True).exists():
                     return Response({'error': 'No more stock available'}, status=status.HTTP_400_BAD_REQUEST)
-                item.quantity += 1
-                product.stock -= 1
-                product.save()
-            item.save()
-        else:
-            product.stock -= 1
-            product.save()
-            item = BasketItem.objects.create(
-                product_object=product,
-                basket_object=basket,
-                quantity=1,
-                is_active=True,
-                is_order_placed=False
-            )
+                return Response({'error': 'Product is out of stock'}, status=status.HTTP_400_BAD_REQUEST)
+
+            item = in_basket.select_for_update().first()
+            if item is None:
+                item = BasketItem.objects.create(
+                    product_object_id=pk,
+                    basket_object=basket,
+                    quantity=1,
+                    is_active=True,
+                    is_order_placed=False
+                )
+            else:
+                if item.is_active:
+                    item.quantity = F('quantity') + 1
+                else:
+                    item.is_active = True
+                    item.quantity = 1
+                item.save(update_fields=['quantity', 'is_active', 'updated_date'])
+            reservations.renew(basket.pk)
+            item.refresh_from_db(fields=['quantity', 'reserved_until'])
 
         return Response(CartItemSerializer(item).data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['delete'], url_path='remove-from-cart')
     def remove_from_cart(self, request, pk=None):
-        try:
-            item = BasketItem.objects.get(pk=pk, basket_object__owner=request.user, is_order_placed=False)
-            product = item.product_object
-            product.stock += item.quantity
-            product.save()
-
-            item.is_active = False
-            item.save()
-            return Response({'detail': 'Item removed from cart'}, status=status.HTTP_204_NO_CONTENT)
-        except BasketItem.DoesNotExist:
+        items = BasketItem.objects.filter(pk=pk, basket_object__owner=request.user, is_order_placed=False)
+        if not items.exists():
             return Response({'detail': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
 
+        with transaction.atomic():
+            # only the request that deactivates the item gives its stock back
+            if items.filter(is_active=True).update(is_active=False, reserved_until=None, updated_date=timezone.now()):
+                product_id, quantity = items.values_list('product_object_id', 'quantity').get()
+                inventory.release_stock(product_id, quantity)
+        return Response({'detail': 'Item removed from cart'}, status=status.HTTP_204_NO_CONTENT)
+
 
     @action(detail=True, methods=['patch'], url_path='update-quantity')
     def update_quantity(self, request, pk=None):
@@ -301,33 +433,121 @@ class BasketItemViewSet(viewsets.ModelViewSet):
         except (TypeError, ValueError):
             return Response({'detail': 'Quantity must be an integer >= 1'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            item = BasketItem.objects.get(pk=pk, basket_object__owner=request.user, is_order_placed=False)
+        items = BasketItem.objects.filter(pk=pk, basket_object__owner=request.user, is_order_placed=False)
+        with transaction.atomic():
+            # touching the row locks it before its current quantity is read
+            if not items.update(updated_date=timezone.now()):
+                return Response({'detail': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+            item = items.get()
+
+            # only active items hold stock; reserve or release the difference
+            change = quantity - item.quantity if item.is_active else 0
+            if change > 0 and not inventory.reserve_stock(item.product_object_id, change):
+                transaction.set_rollback(True)
+                return Response({'detail': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
+            if change < 0:
+                inventory.release_stock(item.product_object_id, -change)
             item.quantity = quantity
-            item.save()
-            return Response(CartItemSerializer(item).data)
-        except BasketItem.DoesNotExist:
-            return Response({'detail': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+            item.save(update_fields=['quantity', 'updated_date'])
+            if item.is_active:
+                reservations.renew(item.basket_object_id)
+                item.refresh_from_db(fields=['reserved_until'])
+        return Response(CartItemSerializer(item).data)
+
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """
+        Apply many cart changes at once, e.g. "buy the set" or re-order:
+        {"items": [{"product": 3, "quantity": 2, "action": "add"}, ...]}
+        (action is add (default), set or remove; a bare list works too).
+        All or nothing: if any product lacks stock, nothing changes.
+        Returns the whole cart.
+        """
+        data = {'items': request.data} if isinstance(request.data, list) else request.data
+        serializer = CartBatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        basket, _ = Basket.objects.get_or_create(owner=request.user)
+        try:
+            cart.apply_operations(basket, serializer.validated_data['items'])
+        except cart.InsufficientStock as e:
+            return Response(
+                {'error': 'Not enough stock available', 'unavailable': e.shortages},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        items = basket.cartitems.in_cart().with_totals().order_by('id')
+        return Response(CartItemSerializer(items, many=True, context={'request': request}).data)
 
     @action(detail=False, methods=['get'], url_path='view-cart')
     def view_cart(self, request):
-        
-        basket = Basket.objects.filter(owner=request.user).first()
-        if not basket:
+        """
+        The cart's items; with ?totals=true wrapped as {"results", "totals"}.
+        Items, products and line totals come from one joined query, and the
+        cart totals are summed from those same rows.
+        """
+        items = list(
+            BasketItem.objects.in_cart().filter(basket_object__owner=request.user).with_totals().order_by('id')
+        )
+        if not items and not Basket.objects.filter(owner=request.user).exists():
             return Response({'detail': 'Cart is empty'}, status=status.HTTP_404_NOT_FOUND)
-        items = basket.cartitems.filter(is_order_placed=False, is_active=True)
-        return Response(CartItemSerializer(items, many=True).data)
+
+        data = CartItemSerializer(items, many=True).data
+        if request.query_params.get('totals', '').lower() in TRUE_VALUES:
+            data = {'results': data, 'totals': cart_totals(items)}
+        return Response(data)
+
+
+class GuestCartView(APIView):
+    """
+    Cart for visitors who are not logged in, kept in a signed cookie so it
+    costs no database writes. GET shows it, POST changes it with the same
+    operations as basket-items/batch/, DELETE empties it. Stock is checked
+    but not reserved; logging in merges it into the user's basket.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        return Response(guest_cart.payload(guest_cart.read(request)))
+
+    def post(self, request):
+        data = {'items': request.data} if isinstance(request.data, list) else request.data
+        serializer = CartBatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            lines = guest_cart.apply_operations(guest_cart.read(request), serializer.validated_data['items'])
+        except cart.InsufficientStock as e:
+            return Response(
+                {'error': 'Not enough stock available', 'unavailable': e.shortages},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(lines) > guest_cart.MAX_LINES:
+            return Response(
+                {'error': f'A guest cart holds at most {guest_cart.MAX_LINES} products'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        response = Response(guest_cart.payload(lines))
+        guest_cart.write(response, lines)
+        return response
+
+    def delete(self, request):
+        response = Response(status=status.HTTP_204_NO_CONTENT)
+        guest_cart.write(response, {})
+        return response
 
 
 # -------------------------------------------
 # ORDER API
 # -------------------------------------------
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
 
     @action(detail=True, methods=['post'])
     def confirm_order(self, request, pk=None):
@@ -412,15 +632,63 @@ class ProductCreateAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 # Single product view
-class ProductDetailAPIView(RetrieveAPIView):
-    queryset = Product.objects.all()
+class ProductDetailAPIView(SparseFieldsetMixin, RetrieveAPIView):
+    """
+    Product page in one round trip: ?expand=media,category,wishlist adds the
+    ordered media list and the caller's wishlist state to the product.
+    """
+    queryset = Product.objects.for_catalog()
     serializer_class = ProductSerializer
 
+    @method_decorator(condition(etag_func=product_detail_etag, last_modified_func=product_last_modified))
+    def get(self, request, *args, **kwargs):
+        self.expand = parse_expand(request.query_params.get('expand'))
+        response = super().get(request, *args, **kwargs)
+        if 'wishlist' in self.expand:
+            patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        expand = getattr(self, 'expand', set())
+        if 'media' in expand:
+            queryset = queryset.with_media()
+        if 'wishlist' in expand:
+            queryset = queryset.with_wishlist_state(self.request.user)
+        return queryset
+
+    def get_serializer_class(self):
+        if getattr(self, 'expand', None):
+            return ProductDetailSerializer
+        return ProductSerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = getattr(self, 'expand', set())
+        return context
+
 # Get all products
 class ProductListAPIView(APIView):
-    def get(self, request):
-        products = Product.objects.all()
-        serializer = ProductSerializer(products, many=True)
+    pagination_class = ProductCursorPagination
+
+    @method_decorator(condition(etag_func=product_list_etag))
+    def get(self, request, category_id=None):
+        fieldset = fieldset_from_request(request)
+        products = Product.objects.for_catalog()
+        if category_id is not None:
+            products = products.filter(category_id=category_id)
+        if fieldset:
+            products = prune_queryset(products, ProductSerializer(**fieldset))
+
+        # paginated only when the client asks for it (?page_size= / ?cursor=)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(products, request, view=self)
+        if page is not None:
+            serializer = ProductSerializer(page, many=True, **fieldset)
+            return paginator.get_paginated_response(serializer.data)
+
+        products = paginator.order_queryset(products, request)
+        serializer = ProductSerializer(products, many=True, **fieldset)
         return Response(serializer.data)
     
 # Delete product
@@ -507,12 +775,20 @@ def dashboard_stats(request):
             for p in top_products
         ],
     })
-class WishListViewSet(viewsets.ModelViewSet):
+
+@api_view(['GET'])
+@permission_classes([IsSuperUser])
+def catalog_cache_stats(request):
+    return Response(cache_stats())
+
+
+class WishListViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset=Wishlist.objects.select_related("product")
     serializer_class=WishListSerializer
     permission_classes=[IsAuthenticated]
 
     def get_queryset(self):
-        return Wishlist.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
 
     def create(self, request, *args, **kwargs):
         product_id = request.data.get("product")
@@ -884,7 +1160,7 @@ class MyOrdersViewSet(viewsets.GenericViewSet):
         return Response(data)
     
 # Hero Section View
-class HeroSectionViewSet(viewsets.ModelViewSet):
+class HeroSectionViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = HeroSection.objects.all()
     serializer_class = HeroSectionSerializer
     parser_classes = [MultiPartParser, FormParser]  